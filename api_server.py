@@ -0,0 +1,593 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import re
+import signal
+import socket
+import sys
+import time
+import traceback
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote
+
+from llm_admission import LLMUnavailableError
+from metrics import metrics
+
+# ----------------------- HTTP API -----------------------
+# Headless JSON API over ChatService. `app` is a plain ASGI application, so any ASGI
+# server can host it (`uvicorn api_server:app --workers 4`). The module also ships a small
+# dependency-free HTTP/1.1 server with a prefork worker pool. Each worker process holds a
+# warm ChatService, sheds load with 503s once it is saturated, and drains in-flight
+# requests on SIGTERM:
+#     python -m api_server --workers 4 --port 8000
+#     python -m api_server --fake-llm 0.3          # offline, against FakeChatModel
+#
+#     GET  /health                  worker status
+#     GET  /metrics                 Prometheus text (this worker's registry)
+#     POST /turn                    {"messages": [...], "thread_id": optional} -> final state with the reply
+#                                   (with thread_id, messages the thread already holds are skipped;
+#                                   only accepted with a single worker)
+#     POST /stream                  same input; server-sent "token" events, then "state"
+#     GET  /chats                   saved chats with message counts and timestamps
+#     POST /chats                   {"messages": [...], "name": optional} -> {"name": ...}, final (never renamed)
+#     GET  /chats/{name}?tail=N     a saved chat's messages
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_SHUTDOWN_GRACE = 30.0
+DEFAULT_BACKLOG = 256
+
+MAX_BODY_BYTES = 1024 * 1024
+REQUEST_HEADER_TIMEOUT = 10.0
+RETRY_AFTER_SECONDS = 1
+
+ROLES = ("user", "assistant")
+_CHAT_NAME_RE = re.compile(r"[\w\- ]{1,128}")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: tuple = ()):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+class ClientDisconnected(Exception):
+    """The client went away while the response was being sent."""
+
+
+# ----------------------- REQUEST HELPERS -----------------------
+
+async def _read_body(receive) -> bytes:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(499, "client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, f"body larger than {MAX_BODY_BYTES} bytes")
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _parse_json(body: bytes) -> dict:
+    try:
+        payload = json.loads(body or b"{}")
+    except json.JSONDecodeError as e:
+        raise HTTPError(400, f"invalid JSON: {e}")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "body must be a JSON object")
+    return payload
+
+
+def _parse_messages(payload: dict, last_role: str | None = None) -> list[dict]:
+    messages = payload.get("messages")
+    if not isinstance(messages, list) or not messages:
+        raise HTTPError(400, "messages must be a non-empty list")
+    for msg in messages:
+        if not isinstance(msg, dict) or msg.get("role") not in ROLES or not isinstance(msg.get("content"), str):
+            raise HTTPError(400, "each message needs a role (user or assistant) and string content")
+    if last_role is not None and messages[-1]["role"] != last_role:
+        raise HTTPError(400, f"the last message must have role {last_role}")
+    return messages
+
+
+def _chat_name(name: str) -> str:
+    # Chat names become file names; keep them to a safe character set
+    if not _CHAT_NAME_RE.fullmatch(name):
+        raise HTTPError(400, "chat names may only contain letters, digits, spaces, '_' and '-'")
+    return name
+
+
+def _public_state(state: dict) -> dict:
+    return {"messages": state["messages"], "message_type": state.get("message_type"),
+            "chat_id": state.get("chat_id")}
+
+
+async def _send_json(send, status: int, payload, headers: tuple = ()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers,
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+# ----------------------- ASGI APPLICATION -----------------------
+
+class ApiApp:
+    """ASGI app serving one ChatService; the service is built and warmed up at startup.
+
+    At most max_concurrency turns run at once; further turns get 503 with Retry-After
+    instead of queueing behind them. While draining, every new request gets 503.
+    """
+
+    def __init__(self, service_factory=None, max_concurrency: int | None = None, workers: int | None = None):
+        self.service_factory = service_factory
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("API_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self.max_concurrency = max_concurrency
+        # Graph checkpoints live in each worker's memory, so threads only work with one worker;
+        # under an external server, set API_WORKERS to its worker count
+        if workers is None:
+            workers = int(os.getenv("API_WORKERS", "1"))
+        self.workers = workers
+        self.service = None
+        self.in_flight = 0
+        self.turns_in_flight = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._startup_lock = asyncio.Lock()
+        self._routes = [
+            ("GET", re.compile(r"/health"), self._health),
+            ("GET", re.compile(r"/metrics"), self._metrics),
+            ("POST", re.compile(r"/turn"), self._turn),
+            ("POST", re.compile(r"/stream"), self._stream),
+            ("GET", re.compile(r"/chats"), self._list_chats),
+            ("POST", re.compile(r"/chats"), self._save_chat),
+            ("GET", re.compile(r"/chats/(?P<name>[^/]+)"), self._load_chat),
+        ]
+
+    # --- Lifecycle ---
+
+    async def startup(self):
+        async with self._startup_lock:
+            if self.service is not None:
+                return
+            if self.service_factory is not None:
+                factory = self.service_factory
+            else:
+                from main import ChatService
+                factory = ChatService
+            # Client, structured-output runnables and graph are ready before the first request
+            service = await asyncio.to_thread(factory)
+            await asyncio.to_thread(service.warm_up)
+            self.service = service
+
+    async def shutdown(self, grace: float = DEFAULT_SHUTDOWN_GRACE):
+        """Stops taking requests, waits up to `grace` seconds for in-flight ones, then flushes local writes."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), grace)
+        except asyncio.TimeoutError:
+            print(f"Shutting down with {self.in_flight} request(s) still in flight")
+        if self.service is not None:
+            await asyncio.to_thread(self.service.wait_for_titles, min(grace, 5.0))
+        from main import chat_log_writer
+        chat_log_writer.close()
+
+    # --- ASGI entry point ---
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        self.in_flight += 1
+        self._idle.clear()
+        start = time.perf_counter()
+        route = "unmatched"
+        started = False
+
+        async def tracked_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            try:
+                await send(message)
+            except ConnectionError as e:
+                raise ClientDisconnected() from e
+
+        try:
+            if self.draining:
+                raise HTTPError(503, "server is shutting down", ((b"retry-after", str(RETRY_AFTER_SECONDS).encode()),))
+            if self.service is None:
+                await self.startup()
+            handler, params, route = self._match(scope["method"], scope["path"])
+            await handler(scope, receive, tracked_send, **params)
+        except ClientDisconnected:
+            # Nobody is left to answer; the handler's cleanup has already run
+            pass
+        except HTTPError as e:
+            if not started:
+                await _send_json(send, e.status, {"error": str(e)}, e.headers)
+        except LLMUnavailableError as e:
+            if not started:
+                await _send_json(send, 503, {"error": f"model unavailable: {e}"},
+                                 ((b"retry-after", str(RETRY_AFTER_SECONDS).encode()),))
+        except Exception as e:
+            traceback.print_exc()
+            if not started:
+                await _send_json(send, 500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            metrics.observe("http_seconds", time.perf_counter() - start, route=route)
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _match(self, method: str, path: str):
+        path_matched = False
+        for route_method, pattern, handler in self._routes:
+            match = pattern.fullmatch(path.rstrip("/") or "/")
+            if match is None:
+                continue
+            path_matched = True
+            if route_method == method:
+                return handler, {k: unquote(v) for k, v in match.groupdict().items()}, pattern.pattern
+        if path_matched:
+            raise HTTPError(405, f"{method} not allowed on {path}")
+        raise HTTPError(404, f"no route for {path}")
+
+    # --- Backpressure ---
+
+    def _admit_turn(self):
+        if self.turns_in_flight >= self.max_concurrency:
+            metrics.inc("http_rejected_total", reason="saturated")
+            raise HTTPError(503, "server is at capacity", ((b"retry-after", str(RETRY_AFTER_SECONDS).encode()),))
+        self.turns_in_flight += 1
+
+    # --- Handlers ---
+
+    async def _health(self, scope, receive, send):
+        await _send_json(send, 200, {"status": "draining" if self.draining else "ok", "pid": os.getpid(),
+                                     "in_flight": self.in_flight, "turns_in_flight": self.turns_in_flight,
+                                     "max_concurrency": self.max_concurrency})
+
+    async def _metrics(self, scope, receive, send):
+        body = metrics.prometheus_text().encode("utf-8")
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/plain; version=0.0.4"), (b"content-length", str(len(body)).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    def _turn_state(self, payload: dict) -> tuple[dict, str | None]:
+        thread_id = payload.get("thread_id")
+        if thread_id is not None:
+            if not isinstance(thread_id, str) or not self.service.checkpointing:
+                raise HTTPError(400, "thread_id must be a string and needs GRAPH_CHECKPOINTER enabled")
+            if self.workers > 1:
+                raise HTTPError(400, f"thread_id needs a single worker; each of the {self.workers} workers "
+                                     "keeps its own graph checkpoints, send the whole conversation instead")
+        state = {"messages": _parse_messages(payload, last_role="user"),
+                 "message_type": payload.get("message_type"), "chat_id": payload.get("chat_id")}
+        return state, thread_id
+
+    async def _turn(self, scope, receive, send):
+        state, thread_id = self._turn_state(_parse_json(await _read_body(receive)))
+        self._admit_turn()
+        try:
+            # Model work runs on the service's own loop, where its async clients live
+            result = await self.service._runner.arun(self.service.ainvoke(state, thread_id))
+        finally:
+            self.turns_in_flight -= 1
+        await _send_json(send, 200, {**_public_state(result), "reply": result["messages"][-1]["content"]})
+
+    async def _stream(self, scope, receive, send):
+        state, thread_id = self._turn_state(_parse_json(await _read_body(receive)))
+        self._admit_turn()
+        try:
+            events = self.service._runner.aiterate(self.service.astream(state, thread_id))
+            # Closed on every exit, a client disconnect included, so the turn's cleanup
+            # (cancelling speculative drafts, discarding a half-done thread) always runs
+            async with contextlib.aclosing(events):
+                # Wait for the first event before committing to a 200, so saturation still maps to 503
+                try:
+                    first = await anext(events)
+                except StopAsyncIteration:
+                    raise HTTPError(500, "turn produced no output")
+
+                await send({"type": "http.response.start", "status": 200, "headers": [
+                    (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                ]})
+                event = first
+                while True:
+                    kind, payload = event
+                    if kind == "token":
+                        chunk = _sse("token", {"text": payload})
+                    else:
+                        chunk = _sse("state", _public_state(payload))
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    try:
+                        event = await anext(events)
+                    except StopAsyncIteration:
+                        break
+                    except Exception as e:
+                        # Headers are out already; report the failure in-band
+                        print(f"Stream failed: {e}")
+                        await send({"type": "http.response.body", "body": _sse("error", {"error": str(e)}), "more_body": True})
+                        break
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.turns_in_flight -= 1
+
+    async def _list_chats(self, scope, receive, send):
+        await _send_json(send, 200, {"chats": await asyncio.to_thread(self.service.list_saved_chat_details)})
+
+    async def _save_chat(self, scope, receive, send):
+        payload = _parse_json(await _read_body(receive))
+        messages = _parse_messages(payload)
+        name = payload.get("name")
+        if name is not None:
+            name = _chat_name(str(name))
+        if name is None:
+            # The title is settled before saving, so the returned name stays valid for GET /chats/{name}
+            # (no background rename); it falls back to the keyword title if the model call fails
+            if self.service.chat_naming == "llm":
+                name = await self.service._runner.arun(self.service.agenerate_chat_name_llm(messages))
+            else:
+                name = self.service.provisional_chat_name(messages)
+        saved_name = await asyncio.to_thread(self.service.save_chat_history, messages, name, False)
+        await _send_json(send, 201, {"name": saved_name})
+
+    async def _load_chat(self, scope, receive, send, name: str):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        try:
+            tail = int(query["tail"][0]) if "tail" in query else None
+        except ValueError:
+            raise HTTPError(400, "tail must be an integer")
+        if tail is not None and tail < 1:
+            raise HTTPError(400, "tail must be at least 1")
+        messages = await asyncio.to_thread(self.service.load_chat_history, _chat_name(name), tail)
+        if messages is None:
+            raise HTTPError(404, f"no saved chat named {name}")
+        await _send_json(send, 200, {"name": name, "messages": messages})
+
+
+# Module-level app for ASGI servers; the ChatService is created on lifespan startup
+app = ApiApp()
+
+
+# ----------------------- BUILT-IN HTTP SERVER -----------------------
+# Just enough HTTP/1.1 to host the app without extra dependencies: Content-Length request
+# bodies, Content-Length or chunked responses, one request per connection.
+
+async def _handle_connection(asgi_app, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_HEADER_TIMEOUT)
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        headers = []
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(":")
+                headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+        length = int(dict(headers).get(b"content-length", b"0"))
+        if length > MAX_BODY_BYTES:
+            writer.write(b"HTTP/1.1 413 Content Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return
+        body = await reader.readexactly(length) if length else b""
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+        writer.close()
+        return
+
+    path, _, query = target.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+        "method": method.upper(), "path": unquote(path), "raw_path": path.encode("latin-1"),
+        "query_string": query.encode("latin-1"), "headers": headers,
+        "client": writer.get_extra_info("peername"), "server": writer.get_extra_info("sockname"),
+    }
+    request_sent = False
+    chunked = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # One request per connection: after the body, the only thing left is the disconnect
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal chunked
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = message.get("headers", [])
+            chunked = not any(k.lower() == b"content-length" for k, _ in response_headers)
+            try:
+                reason = HTTPStatus(status).phrase
+            except ValueError:
+                reason = ""
+            lines = [f"HTTP/1.1 {status} {reason}".encode("latin-1")]
+            lines += [k + b": " + v for k, v in response_headers]
+            if chunked:
+                lines.append(b"transfer-encoding: chunked")
+            lines.append(b"connection: close")
+            writer.write(b"\r\n".join(lines) + b"\r\n\r\n")
+        elif message["type"] == "http.response.body":
+            data = message.get("body", b"")
+            if chunked:
+                if data:
+                    writer.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                if not message.get("more_body", False):
+                    writer.write(b"0\r\n\r\n")
+            else:
+                writer.write(data)
+            await writer.drain()
+
+    try:
+        await asgi_app(scope, receive, send)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _serve(asgi_app: ApiApp, sock: socket.socket, grace: float):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await asgi_app.startup()
+    server = await asyncio.start_server(functools.partial(_handle_connection, asgi_app), sock=sock)
+    print(f"Worker {os.getpid()} ready")
+    await stop.wait()
+
+    # Stop accepting, let in-flight requests finish, then flush local writes
+    server.close()
+    await asgi_app.shutdown(grace)
+    print(f"Worker {os.getpid()} stopped")
+
+
+def _run_worker(sock: socket.socket, service_factory, max_concurrency: int, grace: float, workers: int = 1):
+    asyncio.run(_serve(ApiApp(service_factory, max_concurrency, workers), sock, grace))
+
+
+def _spawn_worker(sock: socket.socket, service_factory, max_concurrency: int, grace: float, workers: int) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # Child: build everything (model client, event loops, threads) after the fork
+    code = 0
+    try:
+        _run_worker(sock, service_factory, max_concurrency, grace, workers)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = DEFAULT_WORKERS,
+          service_factory=None, max_concurrency: int | None = None, grace: float = DEFAULT_SHUTDOWN_GRACE,
+          backlog: int = DEFAULT_BACKLOG):
+    """Serves the API from `workers` forked processes sharing one listening socket.
+
+    The parent restarts workers that crash, and on SIGTERM/SIGINT asks every worker to
+    drain, killing any still running `grace` seconds (plus a margin) later.
+    """
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("API_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+    sock = socket.create_server((host, port), backlog=backlog)
+    print(f"Serving on http://{host}:{sock.getsockname()[1]} with {workers} worker(s)")
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        _run_worker(sock, service_factory, max_concurrency, grace)
+        return
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    children = {_spawn_worker(sock, service_factory, max_concurrency, grace, workers) for _ in range(workers)}
+    while not stopping:
+        time.sleep(0.2)
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                break
+            children.discard(pid)
+            if not stopping:
+                print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+                children.add(_spawn_worker(sock, service_factory, max_concurrency, grace, workers))
+
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + grace + 5.0
+    while children and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            children.discard(pid)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        print(f"Worker {pid} did not drain in time; killing it")
+        os.kill(pid, signal.SIGKILL)
+    sock.close()
+
+
+def fake_service_factory(latency: float, tokens_per_second: float = 0.0):
+    """ChatService factory backed by FakeChatModel, for running the API offline."""
+    def build():
+        from benchmarks.fake_llm import FakeChatModel
+        from main import ChatService
+
+        service = ChatService()
+        service.llm = FakeChatModel(latency=latency, tokens_per_second=tokens_per_second)
+        return service
+    return build
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve ChatService over HTTP.")
+    parser.add_argument("--host", default=os.getenv("API_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", DEFAULT_PORT)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", DEFAULT_WORKERS)),
+                        help="Worker processes, each with its own warm ChatService.")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="Turns in flight per worker before new ones get 503 (default API_MAX_CONCURRENCY or 32).")
+    parser.add_argument("--grace", type=float, default=float(os.getenv("API_SHUTDOWN_GRACE", DEFAULT_SHUTDOWN_GRACE)),
+                        help="Seconds a worker waits for in-flight requests on shutdown.")
+    parser.add_argument("--fake-llm", type=float, metavar="LATENCY", default=None,
+                        help="Use FakeChatModel with this latency in seconds instead of Gemini.")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Fake model streaming speed.")
+    args = parser.parse_args()
+
+    factory = None
+    if args.fake_llm is not None:
+        os.environ.setdefault("GEMINI_API_KEY", "offline-fake-llm")
+        factory = fake_service_factory(args.fake_llm, args.tokens_per_second)
+    serve(args.host, args.port, args.workers, factory, args.max_concurrency, args.grace)
+
+
+if __name__ == "__main__":
+    main()
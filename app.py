@@ -1,8 +1,14 @@
 import streamlit as st
 from main import ChatService, ChatState
+from chat_store import ChatStore, WriteBehindQueue
+from session_store import SessionMessages
+from llm_admission import LLMUnavailableError
+from metrics import metrics
 from supabase import create_client, Client
 import os
-from datetime import datetime
+import functools
+import uuid
+from itertools import chain
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,6 +20,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Messages rendered at once; "Show earlier messages" widens the window by this much
+MESSAGE_WINDOW = int(os.getenv("MESSAGE_WINDOW", "30"))
+
 SUPABASE_URL = os.getenv("VITE_SUPABASE_URL")
 SUPABASE_KEY = os.getenv("VITE_SUPABASE_SUPABASE_ANON_KEY")
 
@@ -23,9 +32,22 @@ def get_supabase_client() -> Client:
 
 @st.cache_resource
 def get_chat_service():
-    return ChatService()
+    service = ChatService()
+    # Load the model client and graph while the page renders and the user types
+    service.warm_up(background=True)
+    return service
+
+@st.cache_resource
+def get_chat_store() -> ChatStore:
+    return ChatStore(get_supabase_client())
+
+@st.cache_resource
+def get_write_queue() -> WriteBehindQueue:
+    return WriteBehindQueue(get_chat_store())
 
 supabase = get_supabase_client()
+chat_store = get_chat_store()
+write_queue = get_write_queue()
 chat_service = get_chat_service()
 
 st.markdown("""
@@ -291,27 +313,46 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 if "messages" not in st.session_state:
-    st.session_state["messages"] = []
+    # Bounded in memory; older turns spill to disk (SESSION_MAX_MESSAGES, SESSION_SPILL_DIR)
+    st.session_state["messages"] = SessionMessages()
 if "current_chat_id" not in st.session_state:
     st.session_state["current_chat_id"] = None
 if "current_chat_name" not in st.session_state:
     st.session_state["current_chat_name"] = "New Chat"
+if "chat_list_pages" not in st.session_state:
+    st.session_state["chat_list_pages"] = 1
+if "pending_title" not in st.session_state:
+    st.session_state["pending_title"] = None
+if "visible_messages" not in st.session_state:
+    st.session_state["visible_messages"] = MESSAGE_WINDOW
+if "thread_id" not in st.session_state:
+    # Graph checkpoint and rolling summary key, private to this session and replaced whenever another chat is shown
+    st.session_state["thread_id"] = uuid.uuid4().hex
 
 def load_chat_from_db(chat_id: str):
     try:
-        chat_response = supabase.table("chats").select("*").eq("id", chat_id).single().execute()
-        messages_response = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at").execute()
+        # Make sure queued turns for this chat are stored before reading it back
+        write_queue.flush()
+        # One request for the chat and its latest messages; older ones are paged in on demand
+        chat, messages, older_cursor = chat_store.load_chat(chat_id)
 
-        if chat_response.data and messages_response.data:
+        if chat and messages:
             st.session_state["current_chat_id"] = chat_id
-            st.session_state["current_chat_name"] = chat_response.data["name"]
-            st.session_state["messages"] = [
-                {"role": msg["role"], "content": msg["content"]}
-                for msg in messages_response.data
-            ]
+            st.session_state["current_chat_name"] = chat["name"]
+            st.session_state["messages"].reset(messages, older_cursor)
+            st.session_state["thread_id"] = uuid.uuid4().hex
+            st.session_state["visible_messages"] = MESSAGE_WINDOW
     except Exception as e:
         st.error(f"Error loading chat: {e}")
 
+def load_older_messages():
+    try:
+        session = st.session_state["messages"]
+        older, older_cursor = chat_store.load_older_messages(st.session_state["current_chat_id"], session.remote_cursor)
+        session.prepend_remote(older, older_cursor)
+    except Exception as e:
+        st.error(f"Error loading earlier messages: {e}")
+
 def save_chat_to_db():
     if not st.session_state["messages"]:
         st.warning("Cannot save an empty chat.")
@@ -320,44 +361,128 @@ def save_chat_to_db():
     try:
         with st.spinner("Saving chat..."):
             if st.session_state["current_chat_id"]:
-                chat_id = st.session_state["current_chat_id"]
-                supabase.table("chats").update({
-                    "updated_at": datetime.now().isoformat()
-                }).eq("id", chat_id).execute()
+                chat_store.touch_chat(st.session_state["current_chat_id"])
             else:
-                generated_name = chat_service.generate_chat_name_llm(st.session_state["messages"])
-
-                chat_response = supabase.table("chats").insert({
-                    "name": generated_name
-                }).execute()
+                # Saved at once under a keyword title; the LLM title replaces it in the background
+                recent = st.session_state["messages"].tail()
+                provisional_name = chat_service.provisional_chat_name(recent)
 
-                chat_id = chat_response.data[0]["id"]
+                # Chat row and messages (spilled ones included) go out in one RPC (or a few batched inserts)
+                chat_id = chat_store.create_chat(provisional_name, st.session_state["messages"].all())
                 st.session_state["current_chat_id"] = chat_id
-                st.session_state["current_chat_name"] = generated_name
-
-                for msg in st.session_state["messages"]:
-                    supabase.table("messages").insert({
-                        "chat_id": chat_id,
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    }).execute()
+                st.session_state["current_chat_name"] = provisional_name
+                title_future = chat_service.schedule_chat_title(recent, lambda title: rename_db_chat(chat_id, title))
+                if title_future is not None:
+                    st.session_state["pending_title"] = (chat_id, title_future)
 
+            invalidate_chat_list()
             st.success(f"Chat saved: **{st.session_state['current_chat_name']}**")
             st.rerun()
     except Exception as e:
         st.error(f"Error saving chat: {e}")
 
+def rename_db_chat(chat_id: str, title: str) -> str:
+    chat_store.rename_chat(chat_id, title)
+    return title
+
+def apply_pending_title():
+    """Shows a background title once it is stored; it lands on the next rerun after it completes."""
+    pending = st.session_state["pending_title"]
+    if pending is None or not pending[1].done():
+        return
+    chat_id, future = pending
+    st.session_state["pending_title"] = None
+    title = future.result()
+    if title:
+        if st.session_state["current_chat_id"] == chat_id:
+            st.session_state["current_chat_name"] = title
+        get_chat_page.clear()
+        search_chats.clear()
+
 def new_chat():
-    st.session_state["messages"] = []
+    st.session_state["messages"].reset()
     st.session_state["current_chat_id"] = None
     st.session_state["current_chat_name"] = "New Chat"
+    st.session_state["visible_messages"] = MESSAGE_WINDOW
+    st.session_state["thread_id"] = uuid.uuid4().hex
+    invalidate_chat_list()
 
-def get_all_chats():
-    try:
-        response = supabase.table("chats").select("*").order("updated_at", desc=True).execute()
-        return response.data
-    except:
-        return []
+def message_html(role: str, content: str) -> str:
+    if role == "user":
+        return f"""
+                <div class="message-container user-container">
+                    <div class="message-bubble user-bubble">
+                        <div class="message-role">You</div>
+                        {content}
+                    </div>
+                </div>
+            """
+    return f"""
+                <div class="message-container assistant-container">
+                    <div class="message-bubble assistant-bubble">
+                        <div class="message-role">NEURA</div>
+                        {content}
+                    </div>
+                </div>
+            """
+
+@st.cache_resource
+def get_message_html_cache():
+    # Streamlit re-executes this script on every rerun; an lru_cache defined at top level would be
+    # rebuilt (and emptied) each time, so the cache is held as a resource instead
+    return functools.lru_cache(maxsize=4096)(message_html)
+
+def cached_message_html(role: str, content: str) -> str:
+    """Bubble HTML of a finished message, keyed by role and content so each one is built once."""
+    return get_message_html_cache()(role, content)
+
+def show_earlier_messages():
+    """Widens the window over in-memory messages, paging older ones in (spill file first, then the database) once all are shown."""
+    session = st.session_state["messages"]
+    missing = st.session_state["visible_messages"] + MESSAGE_WINDOW - session.in_memory
+    if missing > 0:
+        missing -= session.page_in(missing)
+        if missing > 0 and not session.spilled and session.remote_cursor is not None:
+            load_older_messages()
+    st.session_state["visible_messages"] += MESSAGE_WINDOW
+
+# The chat area is a fragment, so sending a message or paging re-runs only it, not the
+# sidebar; Streamlit versions without st.fragment re-run the whole script instead
+_fragment = getattr(st, "fragment", None)
+chat_fragment = _fragment if _fragment is not None else (lambda func: func)
+
+def rerun_chat_area():
+    if _fragment is not None:
+        st.rerun(scope="fragment")
+    else:
+        st.rerun()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_chat_page(cursor: tuple[str, str] | None) -> tuple[list, tuple[str, str] | None]:
+    # Errors propagate so a failed listing is never cached in place of the real page
+    return chat_store.list_chats(cursor=cursor)
+
+def get_loaded_chats() -> tuple[list, bool]:
+    """Returns the chats on all pages loaded so far and whether more pages exist."""
+    chats, cursor = [], None
+    for _ in range(st.session_state["chat_list_pages"]):
+        page, cursor = get_chat_page(cursor)
+        chats.extend(page)
+        if cursor is None:
+            break
+    return chats, cursor is not None
+
+def invalidate_chat_list():
+    get_chat_page.clear()
+    search_chats.clear()
+    st.session_state["chat_list_pages"] = 1
+
+@st.cache_data(ttl=30, show_spinner=False)
+def search_chats(query: str) -> list[dict]:
+    """Ranked message search across saved chats, cached briefly per query."""
+    return chat_service.search(query, chat_store=chat_store)
+
+apply_pending_title()
 
 with st.sidebar:
     st.markdown('<div class="sidebar-title">🧠 NEURA</div>', unsafe_allow_html=True)
@@ -375,19 +500,67 @@ with st.sidebar:
     st.markdown("---")
 
     st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
-    st.markdown('<div class="sidebar-section-title">Chat History</div>', unsafe_allow_html=True)
-    chats = get_all_chats()
-    if chats:
-        for chat in chats:
-            if st.button(f"💬 {chat['name']}", key=f"chat_{chat['id']}"):
-                load_chat_from_db(chat['id'])
+    st.markdown('<div class="sidebar-section-title">Search</div>', unsafe_allow_html=True)
+    search_query = st.text_input("Search messages", key="search_query", placeholder="Search messages...",
+                                 label_visibility="collapsed")
+    if search_query.strip():
+        try:
+            results = search_chats(search_query.strip())
+            if not results:
+                st.caption("No matching messages")
+        except Exception as e:
+            results = []
+            st.caption(f"Search failed: {e}")
+        for i, hit in enumerate(results):
+            if st.button(f"🔎 {hit['chat_name']}", key=f"search_{i}_{hit['message_id']}",
+                         help=f"{hit['role'].capitalize()}: {hit['snippet']}"):
+                load_chat_from_db(hit['chat_id'])
                 st.rerun()
-    else:
-        st.caption("No saved chats yet")
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown("---")
 
+    st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+    st.markdown('<div class="sidebar-section-title">Chat History</div>', unsafe_allow_html=True)
+    try:
+        chats, has_more = get_loaded_chats()
+        if not chats:
+            st.caption("No saved chats yet")
+    except Exception as e:
+        chats, has_more = [], False
+        st.caption(f"Could not load chat history: {e}")
+    for chat in chats:
+        preview = chat.get("last_message_preview") or ""
+        if st.button(f"💬 {chat['name']}", key=f"chat_{chat['id']}",
+                     help=f"{chat.get('message_count', 0)} messages · {preview}"):
+            load_chat_from_db(chat['id'])
+            st.rerun()
+    if has_more and st.button("Load more", key="chat_list_more"):
+        st.session_state["chat_list_pages"] += 1
+        st.rerun()
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    st.markdown("---")
+
+    if os.getenv("SHOW_METRICS", "").lower() in ("1", "true", "yes"):
+        with st.expander("📊 Diagnostics"):
+            snapshot = metrics.snapshot()
+            for name in ("node_seconds", "llm_seconds", "db_seconds"):
+                rows = [
+                    {"series": ",".join(str(v) for v in entry["labels"].values()), "count": entry["count"],
+                     "p50 ms": round(entry["p50"] * 1000, 1), "p95 ms": round(entry["p95"] * 1000, 1),
+                     "p99 ms": round(entry["p99"] * 1000, 1)}
+                    for entry in snapshot["histograms"].get(name, [])
+                ]
+                if rows:
+                    st.caption(name)
+                    st.dataframe(rows, hide_index=True)
+            st.download_button("Prometheus metrics", metrics.prometheus_text(), file_name="neura_metrics.prom")
+            st.download_button("JSON snapshot", metrics.to_json(), file_name="neura_metrics.json")
+            st.caption("session memory")
+            st.json(st.session_state["messages"].memory_report())
+        st.markdown("---")
+
     st.markdown("""
         <div style="padding: 15px; background: rgba(102, 126, 234, 0.1); border-radius: 12px; border: 1px solid rgba(102, 126, 234, 0.2);">
             <div style="font-size: 14px; font-weight: 600; margin-bottom: 10px; color: #ffffff !important;">About NEURA</div>
@@ -411,66 +584,81 @@ st.markdown(f"""
     </div>
 """, unsafe_allow_html=True)
 
-if not st.session_state["messages"]:
-    st.markdown("""
-        <div class="empty-state">
-            <div class="empty-state-icon">💬</div>
-            <div class="empty-state-text">Start a conversation</div>
-            <div class="empty-state-subtext">I'm here to help with logical analysis or emotional support</div>
-        </div>
-    """, unsafe_allow_html=True)
-else:
-    for msg in st.session_state["messages"]:
-        if msg["role"] == "user":
-            st.markdown(f"""
-                <div class="message-container user-container">
-                    <div class="message-bubble user-bubble">
-                        <div class="message-role">You</div>
-                        {msg["content"]}
-                    </div>
-                </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-                <div class="message-container assistant-container">
-                    <div class="message-bubble assistant-bubble">
-                        <div class="message-role">NEURA</div>
-                        {msg["content"]}
-                    </div>
-                </div>
-            """, unsafe_allow_html=True)
-
-st.markdown('</div>', unsafe_allow_html=True)
-
-if prompt := st.chat_input("Type your message..."):
-    st.session_state["messages"].append({"role": "user", "content": prompt})
-
-    with st.spinner("NEURA is thinking..."):
-        state_to_invoke = {"messages": st.session_state["messages"], "message_type": None}
+@chat_fragment
+def chat_area():
+    session = st.session_state["messages"]
+    if not session:
+        st.markdown("""
+            <div class="empty-state">
+                <div class="empty-state-icon">💬</div>
+                <div class="empty-state-text">Start a conversation</div>
+                <div class="empty-state-subtext">I'm here to help with logical analysis or emotional support</div>
+            </div>
+        """, unsafe_allow_html=True)
+    else:
+        hidden = max(0, session.in_memory - st.session_state["visible_messages"])
+        if (hidden or session.has_older()) and st.button("Show earlier messages", key="older_messages"):
+            show_earlier_messages()
+            rerun_chat_area()
+        # One element for the whole window instead of one per message
+        window = session.tail(st.session_state["visible_messages"])
+        st.markdown("".join(cached_message_html(msg["role"], msg["content"]) for msg in window),
+                    unsafe_allow_html=True)
+
+    if prompt := st.chat_input("Type your message..."):
+        session.append({"role": "user", "content": prompt})
+        st.markdown(message_html("user", prompt), unsafe_allow_html=True)
+
+        reply_placeholder = st.empty()
+        thread_id = st.session_state["thread_id"] if chat_service.checkpointing else None
 
         try:
-            state = chat_service.invoke(state_to_invoke)
-            st.session_state["messages"] = state["messages"]
+            # A checkpointed thread gets just the new message, and the agents' window only if it
+            # has to be seeded; without checkpoints the window (far more than the token budget) goes
+            if thread_id is None:
+                messages, offset = session.agent_window()
+            else:
+                messages, offset = [{"role": "user", "content": prompt}], None
+            state_to_invoke = {
+                "messages": messages,
+                "message_type": None,
+                "chat_id": st.session_state["current_chat_id"],
+                "conversation_id": st.session_state["thread_id"],
+                "history_offset": offset
+            }
+            events = chat_service.stream(state_to_invoke, thread_id, history=session.agent_window)
+            # The spinner only covers the wait for the first token; the bubble then fills in as tokens arrive
+            with st.spinner("NEURA is thinking..."):
+                first_event = next(events)
+
+            reply = ""
+            for event, payload in chain([first_event], events):
+                if event == "token":
+                    reply += payload
+                    reply_placeholder.markdown(message_html("assistant", reply), unsafe_allow_html=True)
+                else:
+                    state = payload
+            # Swap the sent user message for the stored pair, which carries its message_type
+            session.pop()
+            session.extend(state["messages"][-2:])
 
             if st.session_state["current_chat_id"]:
-                last_msg = state["messages"][-1]
-                supabase.table("messages").insert({
-                    "chat_id": st.session_state["current_chat_id"],
-                    "role": "user",
-                    "content": prompt
-                }).execute()
-                supabase.table("messages").insert({
-                    "chat_id": st.session_state["current_chat_id"],
-                    "role": last_msg["role"],
-                    "content": last_msg["content"]
-                }).execute()
-                supabase.table("chats").update({
-                    "updated_at": datetime.now().isoformat()
-                }).eq("id", st.session_state["current_chat_id"]).execute()
+                # Persisted in the background so the reply renders without waiting on the database;
+                # the user message carries the message_type the classifier picked
+                write_queue.enqueue_messages(st.session_state["current_chat_id"], state["messages"][-2:])
+
+        except LLMUnavailableError:
+            st.warning("NEURA is getting a lot of requests right now. Please try again in a moment.")
+            if session.in_memory:
+                session.pop()
 
         except Exception as e:
             st.error(f"Error: {e}")
-            if st.session_state["messages"]:
-                st.session_state["messages"].pop()
+            if session.in_memory:
+                session.pop()
+
+        rerun_chat_area()
 
-    st.rerun()
+chat_area()
+
+st.markdown('</div>', unsafe_allow_html=True)
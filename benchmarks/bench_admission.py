@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.fake_llm import FakeChatModel
+from llm_admission import AdmissionController, LLMUnavailableError
+
+# ----------------------- ADMISSION CONTROL BENCHMARK -----------------------
+# Fires a burst of concurrent requests at a fake model with a slow tail and injected 429s,
+# with and without retries and hedging, and reports success rate and latency percentiles.
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+async def run_scenario(controller: AdmissionController, model: FakeChatModel, requests: int,
+                       concurrency: int, hedge: bool) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with gate:
+            start = time.perf_counter()
+            try:
+                await controller.call(lambda: model.ainvoke("benchmark"), hedge=hedge)
+                latencies.append(time.perf_counter() - start)
+            except LLMUnavailableError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stats = controller.stats()
+    return {
+        "success_rate": len(latencies) / requests,
+        "p50_s": percentile(latencies, 0.50),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "seconds": elapsed,
+        "model_calls": model.calls,
+        "retries": stats["retries"],
+        "hedges": stats["hedges"],
+        "hedge_wins": stats["hedge_wins"],
+    }
+
+
+def run(args) -> dict:
+    scenarios = {
+        "no_retries": dict(max_retries=0),
+        "retries": dict(max_retries=args.retries),
+        "retries_hedged": dict(max_retries=args.retries, hedge_after="p95"),
+    }
+    results = {}
+    for name, options in scenarios.items():
+        model = FakeChatModel(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                              failure_rate=args.failure_rate, seed=args.seed)
+        controller = AdmissionController(rate=args.rate, max_in_flight=args.max_in_flight,
+                                         base_backoff=args.latency, **options)
+        results[name] = asyncio.run(run_scenario(controller, model, args.requests, args.concurrency,
+                                                 hedge=options.get("hedge_after") is not None))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM admission control against a fake model.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency in seconds.")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="Share of calls hitting the slow tail.")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Extra latency of slow calls.")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="Share of calls failing with a 429.")
+    parser.add_argument("--rate", type=float, default=None, help="Token bucket rate in requests/s.")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'scenario':<16} {'success':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'calls':>6} {'retries':>7} {'hedges':>6}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['success_rate']:>8.1%} {r['p50_s']:>7.3f} {r['p95_s']:>7.3f} {r['p99_s']:>7.3f} "
+              f"{r['model_calls']:>6} {r['retries']:>7} {r['hedges']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import json
+import time
+
+from benchmarks.fake_supabase import FakeSupabase
+from chat_store import ChatStore
+
+# ----------------------- PERSISTENCE BENCHMARK -----------------------
+# Compares saving a new chat one message per request (the original save_chat_to_db loop)
+# against batched array inserts and the save_chat_with_messages RPC.
+
+
+def make_messages(n: int) -> list[dict]:
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " * 20} for i in range(n)]
+
+
+def save_per_row(client, name: str, messages: list) -> str:
+    chat_id = client.table("chats").insert({"name": name}).execute().data[0]["id"]
+    for msg in messages:
+        client.table("messages").insert({
+            "chat_id": chat_id,
+            "role": msg["role"],
+            "content": msg["content"]
+        }).execute()
+    return chat_id
+
+
+def save_batched(client, name: str, messages: list) -> str:
+    return ChatStore(client, use_rpc=False).create_chat(name, messages)
+
+
+def save_rpc(client, name: str, messages: list) -> str:
+    return ChatStore(client, use_rpc=True).create_chat(name, messages)
+
+
+STRATEGIES = {"per_row": save_per_row, "batched": save_batched, "rpc": save_rpc}
+
+
+def run(sizes: list[int], latency: float) -> list[dict]:
+    results = []
+    for size in sizes:
+        messages = make_messages(size)
+        for strategy, save in STRATEGIES.items():
+            client = FakeSupabase(latency=latency)
+            start = time.perf_counter()
+            chat_id = save(client, "Benchmark", messages)
+            elapsed = time.perf_counter() - start
+
+            stored = [m for m in client.tables["messages"] if m["chat_id"] == chat_id]
+            ordered = sorted(stored, key=lambda m: m["created_at"])
+            assert len(stored) == size, f"{strategy} stored {len(stored)} of {size} messages"
+            results.append({
+                "strategy": strategy,
+                "messages": size,
+                "requests": client.requests,
+                "seconds": elapsed,
+                "order_preserved": [m["content"] for m in ordered] == [m["content"] for m in messages],
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat persistence strategies against a fake Supabase.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 200, 2000])
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated round trip in seconds.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.latency)
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'strategy':<10} {'messages':>8} {'requests':>8} {'seconds':>9} {'ordered':>8}")
+    for r in results:
+        print(f"{r['strategy']:<10} {r['messages']:>8} {r['requests']:>8} {r['seconds']:>9.3f} {str(r['order_preserved']):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# ----------------------- STARTUP BENCHMARK -----------------------
+# Measures cold start in fresh interpreters: importing main, constructing ChatService, the
+# warm-up of the model client and graph, and the first and second turn against the fake
+# model. The "cli" entry point mirrors run_chatbot(); "streamlit" adds the imports app.py
+# needs on top (streamlit and supabase are timed only when installed). The real Gemini client
+# is built with a dummy key so its import cost is counted; turns then run on FakeChatModel.
+#     python -m benchmarks.bench_startup --repeat 5 --think-time 1
+
+ENTRY_POINTS = ("cli", "streamlit")
+PHASES = ("import_deps_s", "import_main_s", "construct_s", "warm_up_s", "first_token_s", "first_turn_s",
+          "second_turn_s")
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ----------------------- CHILD PROCESS -----------------------
+
+def _timed_import(module: str) -> float | None:
+    if importlib.util.find_spec(module) is None:
+        return None
+    start = time.perf_counter()
+    __import__(module)
+    return time.perf_counter() - start
+
+
+def run_child(entry_point: str, warm_up: bool, think_time: float) -> dict:
+    """Runs one cold start in this (fresh) interpreter and returns the phase timings."""
+    result = {}
+    if entry_point == "streamlit":
+        result["import_deps_s"] = sum(filter(None, (_timed_import(m) for m in ("streamlit", "supabase", "chat_store"))))
+
+    start = time.perf_counter()
+    import main
+    result["import_main_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    service = main.ChatService()
+    result["construct_s"] = time.perf_counter() - start
+
+    warm_up_started = time.perf_counter()
+    warm_up_thread = service.warm_up(background=True) if warm_up else None
+    service.list_saved_chat_details()
+    time.sleep(think_time)
+
+    # The user submits the first message; anything not warmed up yet is on the critical path
+    submitted = time.perf_counter()
+    if warm_up_thread is not None:
+        warm_up_thread.join()
+    else:
+        service.warm_up()
+    result["warm_up_s"] = time.perf_counter() - warm_up_started
+
+    from benchmarks.fake_llm import FakeChatModel
+    service.llm = FakeChatModel(seed=0)
+
+    state = {"messages": [{"role": "user", "content": "How should I plan my week around exams?"}],
+             "message_type": None}
+    for event, payload in service.stream(state):
+        if event == "token" and "first_token_s" not in result:
+            result["first_token_s"] = time.perf_counter() - submitted
+        elif event == "state":
+            state = payload
+    result["first_turn_s"] = time.perf_counter() - submitted
+
+    state["messages"] = state["messages"] + [{"role": "user", "content": "And the week after?"}]
+    start = time.perf_counter()
+    service.invoke(state)
+    result["second_turn_s"] = time.perf_counter() - start
+    return result
+
+
+# ----------------------- PARENT -----------------------
+
+def measure(entry_point: str, warm_up: bool, think_time: float, repeat: int) -> dict:
+    """Median phase timings over `repeat` fresh interpreters, plus the whole process wall time."""
+    from benchmarks.suite import BENCH_ENV
+
+    env = {**os.environ, **BENCH_ENV, "PYTHONPATH": os.pathsep.join(filter(None, [PACKAGE_DIR, os.getenv("PYTHONPATH")]))}
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--child", entry_point, "--think-time", str(think_time)]
+    if not warm_up:
+        command.append("--no-warm-up")
+
+    runs = []
+    for _ in range(repeat):
+        # A scratch working directory keeps the run away from real chat history
+        with tempfile.TemporaryDirectory() as scratch:
+            start = time.perf_counter()
+            output = subprocess.run(command, cwd=scratch, env=env, capture_output=True, text=True, check=True).stdout
+            wall = time.perf_counter() - start
+        run = json.loads(output.strip().splitlines()[-1])
+        run["process_s"] = wall
+        runs.append(run)
+
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start and first-turn latency in fresh interpreters.")
+    parser.add_argument("entry_points", nargs="*", default=list(ENTRY_POINTS), help=f"Any of {', '.join(ENTRY_POINTS)}.")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per entry point; medians are reported.")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="Seconds between startup and the first message, during which warm-up can run.")
+    parser.add_argument("--no-warm-up", action="store_true", help="Build the client and graph on the first turn instead.")
+    parser.add_argument("--child", choices=ENTRY_POINTS, help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, not args.no_warm_up, args.think_time)))
+        return
+
+    unknown = set(args.entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        parser.error(f"unknown entry point(s): {', '.join(sorted(unknown))}")
+
+    results = {entry_point: measure(entry_point, not args.no_warm_up, args.think_time, args.repeat)
+               for entry_point in args.entry_points}
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    columns = [phase for phase in PHASES + ("process_s",) if any(phase in r for r in results.values())]
+    print(f"{'entry point':<12}" + "".join(f"{c.removesuffix('_s'):>14}" for c in columns))
+    for entry_point, r in results.items():
+        print(f"{entry_point:<12}" + "".join(f"{r[c]:>14.3f}" if c in r else f"{'-':>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
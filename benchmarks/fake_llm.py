@@ -0,0 +1,163 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import PrivateAttr
+
+# ----------------------- FAKE CHAT MODEL -----------------------
+# Drop-in stand-in for ChatGoogleGenerativeAI with injected latency, streaming speed and
+# failures, so ChatService can be exercised and benchmarked offline:
+#     chat_service.llm = FakeChatModel(latency=0.3, tokens_per_second=80, failure_rate=0.1)
+
+_EMOTIONAL_WORDS = {"sad", "anxious", "anxiety", "lonely", "depressed", "stressed", "scared", "afraid", "hurt",
+                    "angry", "upset", "cry", "crying", "feel", "feeling", "feelings", "overwhelmed", "grief"}
+_WORD_RE = re.compile(r"[A-Za-z']+")
+
+
+class FakeRateLimitError(Exception):
+    """Mimics an upstream 429."""
+
+    status_code = 429
+
+
+def _text_of(message) -> str:
+    content = message["content"] if isinstance(message, dict) else getattr(message, "content", message)
+    return content if isinstance(content, str) else str(content)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps instead of calling an API.
+
+    Each call waits `latency` seconds (plus a `slow_latency` tail with probability
+    `slow_rate`) before the first token, then emits words at `tokens_per_second`
+    (0 = all at once). With probability `failure_rate` the call raises FakeRateLimitError
+    after the first-token latency.
+    """
+
+    latency: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    tokens_per_second: float = 0.0
+    failure_rate: float = 0.0
+    reply: str = "Here is a thoughtful and helpful answer to your message."
+    seed: int | None = None
+
+    _rng: random.Random = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default=None)
+    _calls: int = PrivateAttr(default=0)
+    _failures: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    # --- Simulated behaviour ---
+
+    def _plan(self) -> tuple[float, bool]:
+        """Draws this call's first-token delay and whether it fails."""
+        with self._lock:
+            self._calls += 1
+            delay = self.latency
+            if self.slow_rate and self._rng.random() < self.slow_rate:
+                delay += self.slow_latency
+            fail = bool(self.failure_rate) and self._rng.random() < self.failure_rate
+            if fail:
+                self._failures += 1
+        return delay, fail
+
+    def _words(self) -> list[str]:
+        words = self.reply.split(" ")
+        return [w if i == len(words) - 1 else w + " " for i, w in enumerate(words)]
+
+    def _message(self, messages) -> AIMessage:
+        input_tokens = sum(len(_text_of(m)) // 4 + 1 for m in messages)
+        output_tokens = len(self._words())
+        return AIMessage(content=self.reply, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+        })
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    # --- BaseChatModel hooks ---
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, fail = self._plan()
+        time.sleep(delay)
+        if fail:
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (injected)")
+        time.sleep(self._token_delay() * len(self._words()))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, fail = self._plan()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (injected)")
+        await asyncio.sleep(self._token_delay() * len(self._words()))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, fail = self._plan()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (injected)")
+        for word in self._words():
+            if self.tokens_per_second:
+                await asyncio.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                await run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+    # --- Structured output ---
+
+    def with_structured_output(self, schema, **kwargs):
+        """Fills the schema heuristically: message_type from emotional keywords, other fields from the last message."""
+        fields = list(schema.model_fields)
+
+        def build(messages):
+            text = _text_of(messages[-1]) if isinstance(messages, list) else str(messages)
+            # Prompts that embed a transcript end with "Role: text"; use that last line
+            text = re.sub(r"^\w+:\s*", "", (text.strip().splitlines() or [""])[-1])
+            words = _WORD_RE.findall(text)
+            if "message_type" in fields:
+                emotional = any(w.lower() in _EMOTIONAL_WORDS for w in words)
+                return schema(message_type="emotional" if emotional else "logical")
+            title = "_".join(w.capitalize() for w in words[:3]) or "Fake_Chat"
+            return schema(**{field: title for field in fields})
+
+        def invoke(messages):
+            delay, fail = self._plan()
+            time.sleep(delay)
+            if fail:
+                raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (injected)")
+            return build(messages)
+
+        async def ainvoke(messages):
+            delay, fail = self._plan()
+            await asyncio.sleep(delay)
+            if fail:
+                raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (injected)")
+            return build(messages)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
@@ -0,0 +1,320 @@
+import copy
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# ----------------------- IN-MEMORY SUPABASE STAND-IN -----------------------
+# Mimics the subset of the supabase-py / PostgREST query builder used by the app, with a
+# configurable per-request latency standing in for the network round trip.
+
+
+class FakeResponse:
+    def __init__(self, data, count: int | None = None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Chainable query builder; nothing runs until execute()."""
+
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table_name = table
+        self.operation = "select"
+        self.payload = None
+        self.columns = "*"
+        self.filters = []
+        self.orders = []
+        self.limit_count = None
+        self.single_row = False
+        self.embedded_orders = {}
+        self.embedded_limits = {}
+
+    # --- Operations ---
+
+    def select(self, columns: str = "*", count: str | None = None):
+        self.operation = "select"
+        self.columns = columns
+        return self
+
+    def insert(self, rows):
+        self.operation = "insert"
+        self.payload = rows
+        return self
+
+    def update(self, values: dict):
+        self.operation = "update"
+        self.payload = values
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    # --- Modifiers ---
+
+    def eq(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def lt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def gt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def is_(self, column: str, value):
+        value = None if value in ("null", None) else value
+        self.filters.append(lambda row: row.get(column) is value)
+        return self
+
+    def or_(self, filters: str):
+        self.filters.append(_parse_logic("or", filters))
+        return self
+
+    def order(self, column: str, desc: bool = False, foreign_table: str | None = None):
+        if foreign_table is not None:
+            self.embedded_orders.setdefault(foreign_table, []).append((column, desc))
+        else:
+            self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int, foreign_table: str | None = None):
+        if foreign_table is not None:
+            self.embedded_limits[foreign_table] = count
+        else:
+            self.limit_count = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    # --- Execution ---
+
+    def _matches(self, row: dict) -> bool:
+        return all(f(row) for f in self.filters)
+
+    def _project(self, row: dict) -> dict:
+        if self.columns.strip() == "*":
+            return dict(row)
+        projected = {}
+        for column in _split_top_level(self.columns):
+            column = column.strip()
+            match = re.fullmatch(r"(\w+)\((.*)\)", column, re.S)
+            if match:
+                projected[match.group(1)] = self._embed(row, match.group(1), match.group(2))
+            else:
+                projected[column] = row.get(column)
+        return projected
+
+    def _embed(self, row: dict, table: str, columns: str) -> list[dict]:
+        """Resolves an embedded resource such as chats -> messages(...)."""
+        foreign_key = EMBEDDED_RELATIONS[(self.table_name, table)]
+        children = [r for r in self.client.tables.get(table, []) if r.get(foreign_key) == row["id"]]
+        children = _sort_rows(children, self.embedded_orders.get(table, []))
+        if table in self.embedded_limits:
+            children = children[:self.embedded_limits[table]]
+        names = [c.strip() for c in columns.split(",")]
+        return [dict(r) if names == ["*"] else {c: r.get(c) for c in names} for r in children]
+
+    def execute(self) -> FakeResponse:
+        self.client._round_trip()
+        with self.client.lock:
+            rows = self.client.tables.setdefault(self.table_name, [])
+            if self.operation == "insert":
+                payload = self.payload if isinstance(self.payload, list) else [self.payload]
+                inserted = [self.client._new_row(self.table_name, r) for r in payload]
+                rows.extend(inserted)
+                self.client._after_insert(self.table_name, inserted)
+                return FakeResponse(copy.deepcopy(inserted))
+            if self.operation == "update":
+                updated = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(self.payload)
+                        updated.append(copy.deepcopy(row))
+                return FakeResponse(updated)
+            if self.operation == "delete":
+                kept = [r for r in rows if not self._matches(r)]
+                deleted = [r for r in rows if self._matches(r)]
+                rows[:] = kept
+                return FakeResponse(deleted)
+
+            result = _sort_rows([r for r in rows if self._matches(r)], self.orders)
+            if self.limit_count is not None:
+                result = result[:self.limit_count]
+            result = [self._project(r) for r in result]
+            if self.single_row:
+                if len(result) != 1:
+                    raise RuntimeError(f"Expected a single row, got {len(result)}")
+                return FakeResponse(result[0])
+            return FakeResponse(result, count=len(result))
+
+
+# Embedded resources the fake can resolve: (parent table, child table) -> child foreign key
+EMBEDDED_RELATIONS = {("chats", "messages"): "chat_id"}
+
+
+def _sort_rows(rows: list[dict], orders: list[tuple[str, bool]]) -> list[dict]:
+    rows = list(rows)
+    for column, desc in reversed(orders):
+        rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+    return rows
+
+
+# --- PostgREST logical filter parsing, e.g. 'a.lt."x",and(a.eq."x",id.lt.5)' ---
+
+_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+}
+
+
+def _split_top_level(text: str) -> list[str]:
+    parts, depth, quoted, current = [], 0, False, ""
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += ch
+    parts.append(current)
+    return parts
+
+
+def _parse_condition(text: str):
+    match = re.fullmatch(r"(and|or)\((.*)\)", text, re.S)
+    if match:
+        return _parse_logic(match.group(1), match.group(2))
+    column, op, value = text.split(".", 2)
+    value = value[1:-1] if value.startswith('"') and value.endswith('"') else value
+    compare = _OPERATORS[op]
+    return lambda row: compare(row.get(column), value)
+
+
+def _parse_logic(kind: str, text: str):
+    conditions = [_parse_condition(part) for part in _split_top_level(text)]
+    if kind == "and":
+        return lambda row: all(c(row) for c in conditions)
+    return lambda row: any(c(row) for c in conditions)
+
+
+class FakeRpc:
+    def __init__(self, client: "FakeSupabase", name: str, params: dict):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        self.client._round_trip()
+        if self.name not in self.client.rpcs:
+            raise RuntimeError(f"Could not find the function {self.name}")
+        with self.client.lock:
+            return FakeResponse(self.client.rpcs[self.name](self.client, **self.params))
+
+
+def _save_chat_with_messages(client: "FakeSupabase", p_name: str, p_messages: list) -> str:
+    chat = client._new_row("chats", {"name": p_name})
+    client.tables["chats"].append(chat)
+    rows = [client._new_row("messages", {**msg, "chat_id": chat["id"]}) for msg in p_messages]
+    client.tables["messages"].extend(rows)
+    client._after_insert("messages", rows)
+    return chat["id"]
+
+
+def _search_messages(client: "FakeSupabase", p_query: str, p_limit: int = 20) -> list[dict]:
+    """Scores messages by matched query terms; a stand-in for the tsvector search RPC."""
+    terms = re.findall(r"\w+", p_query.lower())
+    chats = {c["id"]: c for c in client.tables["chats"]}
+    hits = []
+    for row in client.tables["messages"]:
+        words = re.findall(r"\w+", row["content"].lower())
+        if terms and all(any(w.startswith(t) for w in words) for t in terms):
+            score = sum(words.count(t) for t in terms) / (1 + len(words))
+            hits.append({
+                "chat_id": row["chat_id"],
+                "chat_name": chats[row["chat_id"]]["name"] if row["chat_id"] in chats else None,
+                "message_id": row["id"],
+                "role": row["role"],
+                "created_at": row["created_at"],
+                "snippet": row["content"][:120],
+                "score": score,
+            })
+    hits.sort(key=lambda h: (h["score"], h["created_at"]), reverse=True)
+    return hits[:p_limit]
+
+
+def _set_message_types(client: "FakeSupabase", p_labels: dict) -> int:
+    updated = 0
+    for row in client.tables["messages"]:
+        if row["id"] in p_labels:
+            row["message_type"] = p_labels[row["id"]]
+            updated += 1
+    return updated
+
+
+class FakeSupabase:
+    """In-memory replacement for supabase.Client counting every simulated round trip."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.tables = {"chats": [], "messages": []}
+        self.rpcs = {"save_chat_with_messages": _save_chat_with_messages, "search_messages": _search_messages,
+                     "set_message_types": _set_message_types}
+        self.lock = threading.RLock()
+
+    def _round_trip(self):
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _new_row(self, table: str, values: dict) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        row = {"id": str(uuid.uuid4()), "created_at": now}
+        if table == "chats":
+            row.update({"updated_at": now, "message_count": 0, "last_message_preview": None})
+        row.update(copy.deepcopy(values))
+        return row
+
+    def _after_insert(self, table: str, rows: list[dict]):
+        """Emulates the triggers that keep chats.message_count and last_message_preview current."""
+        if table != "messages":
+            return
+        chats = {c["id"]: c for c in self.tables["chats"]}
+        for row in sorted(rows, key=lambda r: r["created_at"]):
+            chat = chats.get(row["chat_id"])
+            if chat is not None:
+                chat["message_count"] += 1
+                chat["last_message_preview"] = row["content"][:120]
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict | None = None) -> FakeRpc:
+        return FakeRpc(self, name, params or {})
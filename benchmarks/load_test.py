@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import time
+
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.suite import BENCH_ENV, percentile
+from llm_admission import AdmissionController, DEFAULT_MAX_IN_FLIGHT
+
+# ----------------------- LOAD GENERATOR -----------------------
+# Replays recorded conversations as N concurrent synthetic users against an in-process
+# ChatService backed by the fake model. Each user works through a conversation turn by
+# turn, carrying the growing history, with think time between turns. Users start
+# staggered over the ramp-up, and only turns finished after the ramp-up count towards
+# sustained throughput.
+#     python -m benchmarks.load_test --users 1 10 50 --duration 30
+
+DEFAULT_SOURCES = ["requests.jsonl", "memory", "chat_history"]
+
+
+# ----------------------- CORPUS -----------------------
+
+def _conversation_from_records(records: list) -> list[str]:
+    return [r["content"].strip() for r in records
+            if isinstance(r, dict) and r.get("role") == "user" and str(r.get("content", "")).strip()]
+
+
+def _read_file(path: str) -> list[list[str]]:
+    """Returns the conversations in one file as lists of user messages."""
+    with open(path, 'r') as f:
+        if path.endswith(".jsonl"):
+            records = [json.loads(line) for line in f if line.strip()]
+            # Request logs hold one independent prompt per line; chat logs one message per line
+            if records and all("body" in r for r in records):
+                return [[f"{r.get('title', '')}\n{r['body']}".strip()] for r in records if r.get("body")]
+            return [_conversation_from_records(records)]
+        data = json.load(f)
+    return [_conversation_from_records(data.get("messages", []) if isinstance(data, dict) else data)]
+
+
+def load_corpus(sources: list[str]) -> list[list[str]]:
+    """Collects conversations (lists of user messages) from files and directories, skipping missing ones."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(glob.glob(os.path.join(source, "*.json")) + glob.glob(os.path.join(source, "*.jsonl"))))
+        elif os.path.exists(source):
+            paths.append(source)
+
+    conversations = []
+    for path in paths:
+        try:
+            conversations.extend(c for c in _read_file(path) if c)
+        except (OSError, json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Skipping {path}: {e}")
+    return conversations
+
+
+# ----------------------- LOAD RUN -----------------------
+
+def make_service(args):
+    from main import ChatService
+
+    # A private controller per run so levels do not share queues or latency history
+    admission = AdmissionController(max_in_flight=args.max_in_flight)
+    service = ChatService(admission=admission)
+    service.llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                                slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                                failure_rate=args.failure_rate, seed=args.seed)
+    service.graph = service._build_graph()
+    return service
+
+
+async def _user(service, conversation: list[str], start_delay: float, deadline: float,
+                think_time: float, rng: random.Random, turns: list):
+    await asyncio.sleep(start_delay)
+    state = {"messages": [], "message_type": None}
+    while time.monotonic() < deadline:
+        for text in conversation:
+            if time.monotonic() >= deadline:
+                return
+            state["messages"] = state["messages"] + [{"role": "user", "content": text}]
+            start = time.monotonic()
+            try:
+                state = await service.ainvoke(state)
+                turns.append((time.monotonic(), time.monotonic() - start, None))
+            except Exception as e:
+                turns.append((time.monotonic(), time.monotonic() - start, type(e).__name__))
+                state["messages"] = state["messages"][:-1]
+            if think_time:
+                await asyncio.sleep(rng.expovariate(1.0 / think_time))
+        # Start the conversation over as a fresh chat
+        state = {"messages": [], "message_type": None}
+
+
+def run_level(users: int, corpus: list[list[str]], args) -> dict:
+    service = make_service(args)
+    rng = random.Random(args.seed)
+    turns = []
+
+    async def run_all():
+        start = time.monotonic()
+        deadline = start + args.ramp_up + args.duration
+        await asyncio.gather(*(
+            _user(service, rng.choice(corpus), args.ramp_up * i / users, deadline, args.think_time,
+                  random.Random(args.seed + i), turns)
+            for i in range(users)
+        ))
+        return start
+
+    started = service._runner.run(run_all())
+    steady_from = started + args.ramp_up
+    steady = [(latency, error) for finished, latency, error in turns if finished >= steady_from]
+    latencies = [latency for latency, error in steady if error is None]
+    admission = service.get_admission_stats()
+    model_calls = admission["attempts"] or 1
+    return {
+        "users": users,
+        "turns": len(steady),
+        "errors": sum(1 for _, error in steady if error is not None),
+        "turns_per_s": len(latencies) / args.duration,
+        "p50_s": percentile(latencies, 0.50),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "queue_delay_ms": (admission["rate_wait_s"] + admission["slot_wait_s"]) / model_calls * 1000,
+        "model_calls": admission["attempts"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded conversations as concurrent users.")
+    parser.add_argument("--sources", nargs="+", default=DEFAULT_SOURCES,
+                        help="Files or directories of saved chats / request logs to replay.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50], help="Concurrency levels to run.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per level, after ramp-up.")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which users start.")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between a user's turns.")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake model latency in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--slow-rate", type=float, default=0.02)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache and classification memo on.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    env = dict(BENCH_ENV)
+    if args.cache:
+        env.pop("RESPONSE_CACHE")
+        env.pop("CLASSIFICATION_MEMO")
+    os.environ.update(env)
+
+    corpus = load_corpus(args.sources)
+    if not corpus:
+        parser.error(f"no conversations found in {', '.join(args.sources)}")
+    if not args.json:
+        print(f"Replaying {len(corpus)} conversation(s), {sum(len(c) for c in corpus)} user turn(s)")
+
+    results = [run_level(users, corpus, args) for users in args.users]
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'users':>6} {'turns/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'queue ms':>9} {'errors':>7}")
+    for r in results:
+        print(f"{r['users']:>6} {r['turns_per_s']:>8.2f} {r['p50_s']:>7.3f} {r['p95_s']:>7.3f} "
+              f"{r['p99_s']:>7.3f} {r['queue_delay_ms']:>9.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
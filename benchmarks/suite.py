@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.fake_supabase import FakeSupabase
+from chat_store import ChatStore, WriteBehindQueue
+
+# ----------------------- OFFLINE BENCHMARK SUITE -----------------------
+# Times ChatService turns, local chat persistence and the Supabase persistence used by the
+# app against deterministic fakes, reports throughput, latency percentiles and allocations,
+# and compares the results with a stored JSON baseline:
+#     python -m benchmarks.suite --save-baseline
+#     python -m benchmarks.suite --check            # exits 1 on a regression
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "suite.json")
+DEFAULT_THRESHOLD = 0.25
+
+# Benchmarks measure the pipeline itself, so caches and the local classifier stay out of the way
+BENCH_ENV = {
+    "GEMINI_API_KEY": "offline-benchmark",
+    "RESPONSE_CACHE": "off",
+    "CLASSIFICATION_MEMO": "off",
+    "LOCAL_CLASSIFIER_PATH": os.path.join(tempfile.gettempdir(), "neura-bench-no-classifier.json"),
+    "SPECULATION_MODE": "off",
+}
+
+CASES = {}
+
+
+def case(name: str):
+    """Registers a benchmark: a function of (ops, options, region) returning per-operation latencies
+    in seconds. Fixtures are built outside `with region:`, which wraps only the measured loop."""
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+class Region:
+    """The measured part of a case: its wall time and, when tracing, its allocation peak."""
+
+    def __init__(self, trace_allocations: bool = False):
+        self.trace_allocations = trace_allocations
+        self.elapsed = 0.0
+        self.alloc_peak = 0
+        self.alloc_retained = 0
+
+    def __enter__(self):
+        gc.collect()
+        if self.trace_allocations:
+            tracemalloc.start()
+            self._before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        if self.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.alloc_peak = peak - self._before
+            self.alloc_retained = current - self._before
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def conversation(i: int, turns: int = 4) -> list[dict]:
+    """A short, distinct conversation ending on a user message."""
+    messages = []
+    for t in range(turns):
+        messages.append({"role": "user", "content": f"Question {i}.{t}: how should I plan my week around exams?"})
+        messages.append({"role": "assistant", "content": f"Answer {i}.{t}: break the work into focused blocks."})
+    messages.append({"role": "user", "content": f"Follow-up {i}: I feel anxious about the first one."})
+    return messages
+
+
+def make_service(options: dict):
+    from main import ChatService
+
+    service = ChatService()
+    service.llm = FakeChatModel(latency=options["llm_latency"], tokens_per_second=options["tokens_per_second"],
+                                seed=0)
+    service.graph = service._build_graph()
+    return service
+
+
+# ----------------------- CHAT SERVICE -----------------------
+
+@case("chat_invoke")
+def bench_chat_invoke(ops: int, options: dict, region: Region) -> list[float]:
+    service = make_service(options)
+    latencies = []
+    with region:
+        for i in range(ops):
+            start = time.perf_counter()
+            service.invoke({"messages": conversation(i), "message_type": None})
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@case("chat_invoke_concurrent")
+def bench_chat_invoke_concurrent(ops: int, options: dict, region: Region) -> list[float]:
+    service = make_service(options)
+    latencies = []
+
+    async def turn(i: int):
+        start = time.perf_counter()
+        await service.ainvoke({"messages": conversation(i), "message_type": None})
+        latencies.append(time.perf_counter() - start)
+
+    async def run_all():
+        await asyncio.gather(*(turn(i) for i in range(ops)))
+
+    with region:
+        service._runner.run(run_all())
+    return latencies
+
+
+@case("chat_stream_first_token")
+def bench_chat_stream_first_token(ops: int, options: dict, region: Region) -> list[float]:
+    service = make_service(options)
+    latencies = []
+    with region:
+        for i in range(ops):
+            start = time.perf_counter()
+            events = service.stream({"messages": conversation(i), "message_type": None})
+            next(events)
+            latencies.append(time.perf_counter() - start)
+            for _ in events:
+                pass
+    return latencies
+
+
+# ----------------------- LOCAL PERSISTENCE -----------------------
+
+class _ScratchChatDir:
+    """Runs the local store in a temporary working directory with a fresh chat index."""
+
+    def __enter__(self):
+        import main
+
+        self._main = main
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        main._chat_index = None
+        return self
+
+    def __exit__(self, *exc):
+        self._main.chat_log_writer.close()
+        self._main._chat_index = None
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+
+@case("local_save")
+def bench_local_save(ops: int, options: dict, region: Region) -> list[float]:
+    latencies = []
+    with _ScratchChatDir():
+        service = make_service(options)
+        chats = [conversation(i, turns=options["chat_turns"]) for i in range(ops)]
+        with region:
+            for messages in chats:
+                start = time.perf_counter()
+                service.save_chat_history(messages, "Benchmark")
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@case("local_append")
+def bench_local_append(ops: int, options: dict, region: Region) -> list[float]:
+    latencies = []
+    with _ScratchChatDir():
+        service = make_service(options)
+        name = service.save_chat_history(conversation(0, turns=options["chat_turns"]), "Benchmark")
+        turns = [[{"role": "user", "content": f"More {i}"}, {"role": "assistant", "content": f"Reply {i}"}]
+                 for i in range(ops)]
+        with region:
+            for turn in turns:
+                start = time.perf_counter()
+                service.append_chat_history(name, turn)
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@case("local_load")
+def bench_local_load(ops: int, options: dict, region: Region) -> list[float]:
+    latencies = []
+    with _ScratchChatDir():
+        service = make_service(options)
+        name = service.save_chat_history(conversation(0, turns=options["chat_turns"]), "Benchmark")
+        with region:
+            for _ in range(ops):
+                start = time.perf_counter()
+                service.load_chat_history(name)
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@case("local_list")
+def bench_local_list(ops: int, options: dict, region: Region) -> list[float]:
+    latencies = []
+    with _ScratchChatDir():
+        service = make_service(options)
+        for i in range(50):
+            service.save_chat_history(conversation(i, turns=2), f"Chat_{i}")
+        with region:
+            for _ in range(ops):
+                start = time.perf_counter()
+                service.list_saved_chats()
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+# ----------------------- SUPABASE PERSISTENCE -----------------------
+# The ChatStore calls behind app.py's save_chat_to_db, load_chat_from_db, the sidebar and the
+# write-behind queue, against the in-memory client with a simulated round trip.
+
+def _seeded_store(options: dict, chats: int = 0) -> tuple[ChatStore, list[str]]:
+    store = ChatStore(FakeSupabase(latency=options["db_latency"]))
+    chat_ids = [store.create_chat(f"Chat {i}", conversation(i, turns=options["chat_turns"])) for i in range(chats)]
+    return store, chat_ids
+
+
+@case("db_create_chat")
+def bench_db_create_chat(ops: int, options: dict, region: Region) -> list[float]:
+    store, _ = _seeded_store(options)
+    chats = [conversation(i, turns=options["chat_turns"]) for i in range(ops)]
+    latencies = []
+    with region:
+        for i, messages in enumerate(chats):
+            start = time.perf_counter()
+            store.create_chat(f"Chat {i}", messages)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@case("db_load_chat")
+def bench_db_load_chat(ops: int, options: dict, region: Region) -> list[float]:
+    store, chat_ids = _seeded_store(options, chats=20)
+    latencies = []
+    with region:
+        for i in range(ops):
+            start = time.perf_counter()
+            store.load_chat(chat_ids[i % len(chat_ids)])
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@case("db_list_chats")
+def bench_db_list_chats(ops: int, options: dict, region: Region) -> list[float]:
+    store, _ = _seeded_store(options, chats=100)
+    latencies = []
+    with region:
+        for _ in range(ops):
+            start = time.perf_counter()
+            store.list_chats()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@case("db_write_behind_turn")
+def bench_db_write_behind_turn(ops: int, options: dict, region: Region) -> list[float]:
+    store, chat_ids = _seeded_store(options, chats=1)
+    queue = WriteBehindQueue(store, flush_interval=0.05)
+    turns = [[{"role": "user", "content": f"More {i}"}, {"role": "assistant", "content": f"Reply {i}"}]
+             for i in range(ops)]
+    latencies = []
+    try:
+        with region:
+            for turn in turns:
+                # What the user waits for is the enqueue; the flush happens off the request path
+                start = time.perf_counter()
+                queue.enqueue_messages(chat_ids[0], turn)
+                latencies.append(time.perf_counter() - start)
+        queue.flush()
+    finally:
+        queue.close()
+    return latencies
+
+
+# ----------------------- RUNNER -----------------------
+
+def measure_repeated(name: str, ops: int, options: dict, repeat: int) -> dict:
+    """Runs a case `repeat` times and keeps the median of every metric."""
+    runs = [measure(name, ops, options) for _ in range(repeat)]
+    return {metric: sorted(run[metric] for run in runs)[len(runs) // 2] for metric in runs[0]}
+
+
+def measure(name: str, ops: int, options: dict) -> dict:
+    """Times a case's measured loop, then traces allocations of the loop in a separate, shorter run.
+
+    Neither pass includes fixture setup or teardown.
+    """
+    func = CASES[name]
+    timed = Region()
+    latencies = func(ops, options, timed)
+
+    # Allocation pass, separate so tracemalloc overhead does not skew the timings
+    alloc_ops = max(1, ops // 5)
+    traced = Region(trace_allocations=True)
+    try:
+        func(alloc_ops, options, traced)
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    return {
+        "ops": len(latencies),
+        "throughput_ops_s": len(latencies) / timed.elapsed if timed.elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "alloc_peak_kib": traced.alloc_peak / 1024,
+        "alloc_retained_kib_per_op": traced.alloc_retained / 1024 / alloc_ops,
+    }
+
+
+# Metric -> True when higher is better
+# Tail percentiles are reported but too noisy on shared machines to gate on
+CHECKED_METRICS = {"throughput_ops_s": True, "p50_ms": False, "alloc_peak_kib": False}
+# Latency changes smaller than this are scheduler noise, whatever their relative size
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+def compare(results: dict, baseline: dict, threshold: float,
+            min_latency_delta_ms: float = MIN_LATENCY_DELTA_MS) -> list[str]:
+    """Returns a description of every checked metric that regressed by more than `threshold`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in CHECKED_METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            if metric.endswith("_ms") and new - old < min_latency_delta_ms:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > threshold:
+                regressions.append(f"{name}.{metric}: {old:.3f} -> {new:.3f} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("cases", nargs="*", help=f"Cases to run (default: all). Available: {', '.join(CASES)}")
+    parser.add_argument("--ops", type=int, default=50, help="Operations per case.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median of each metric is kept.")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="Fake model latency in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Fake model streaming rate.")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Simulated Supabase round trip in seconds.")
+    parser.add_argument("--chat-turns", type=int, default=20, help="Turns per chat in persistence cases.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline.")
+    parser.add_argument("--check", action="store_true", help="Fail if any case regressed past --threshold.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative regression, e.g. 0.25 for 25%%.")
+    parser.add_argument("--min-latency-delta-ms", type=float, default=MIN_LATENCY_DELTA_MS,
+                        help="Ignore latency regressions smaller than this many milliseconds.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    os.environ.update(BENCH_ENV)
+    options = {"llm_latency": args.llm_latency, "tokens_per_second": args.tokens_per_second,
+               "db_latency": args.db_latency, "chat_turns": args.chat_turns}
+    results = {name: measure_repeated(name, args.ops, options, args.repeat) for name in (args.cases or CASES)}
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(f"{'case':<26} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak KiB':>9}")
+        for name, r in results.items():
+            print(f"{name:<26} {r['throughput_ops_s']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                  f"{r['p99_ms']:>8.2f} {r['alloc_peak_kib']:>9.1f}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save-baseline first.")
+            sys.exit(1)
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_latency_delta_ms)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import chat_log
+
+# ----------------------- LOCAL CHAT MANIFEST -----------------------
+# SQLite index of the local chat store: one row per chat with its message count, size and
+# timestamps, a per-name counter so duplicate names resolve without probing the disk, and
+# an FTS5 full-text index over message content. Every change is a single transaction, and
+# the index can be rebuilt from the directory.
+
+INDEX_FILENAME = ".index.sqlite"
+DEFAULT_SEARCH_LIMIT = 20
+
+_SUFFIX_RE = re.compile(r"^(.*)_(\d+)$")
+_TERM_RE = re.compile(r"\w+")
+_CHAT_COLUMNS = ("name", "message_count", "byte_size", "created_at", "updated_at")
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chats (
+        name TEXT PRIMARY KEY,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        byte_size INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS name_counters (
+        base TEXT PRIMARY KEY,
+        next_suffix INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY,
+        chat_name TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_chat ON messages(chat_name, position);
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id', tokenize='porter unicode61', prefix='2 3'
+    );
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+"""
+
+
+def fts_query(text: str) -> str | None:
+    """Turns free text into an FTS5 query: every term must match, the last one as a prefix.
+
+    Single-character prefixes match nearly everything, so a one-letter last term is matched exactly.
+    """
+    terms = [f'"{t}"' for t in _TERM_RE.findall(text.lower())]
+    if not terms:
+        return None
+    if len(terms[-1]) > 3:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _chat_file(directory: str, chat_name: str) -> str | None:
+    for path in (chat_log.log_path(chat_name, directory), chat_log.legacy_path(chat_name, directory)):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class ChatIndex:
+    """Manifest and full-text index of saved chats, stored next to them in CHAT_HISTORY_DIR."""
+
+    def __init__(self, directory: str = chat_log.CHAT_HISTORY_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, INDEX_FILENAME),
+                                     check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        # An index from before full-text search has chats but no messages_fts yet
+        has_fts = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone() is not None
+        self._conn.executescript(_SCHEMA)
+        if not has_fts:
+            self.rebuild()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # --- Queries ---
+
+    def list_names(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM chats ORDER BY name")]
+
+    def list_chats(self) -> list[dict]:
+        """Returns every chat's metadata, sorted by name."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(_CHAT_COLUMNS)} FROM chats ORDER BY name").fetchall()
+        return [dict(zip(_CHAT_COLUMNS, row)) for row in rows]
+
+    def get(self, chat_name: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_CHAT_COLUMNS)} FROM chats WHERE name = ?", (chat_name,)
+            ).fetchone()
+        return dict(zip(_CHAT_COLUMNS, row)) if row else None
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+        """Returns the best-matching messages (BM25), each with its chat, position and a highlighted snippet."""
+        match = fts_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT m.chat_name, m.position, m.role,
+                       snippet(messages_fts, 0, '**', '**', '…', 16), bm25(messages_fts)
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ?
+                ORDER BY bm25(messages_fts)
+                LIMIT ?
+            """, (match, limit)).fetchall()
+        # bm25() is lower-is-better; flip it so a higher score means a better match
+        return [
+            {"chat_name": name, "position": position, "role": role, "snippet": snippet, "score": -score}
+            for name, position, role, snippet, score in rows
+        ]
+
+    # --- Updates ---
+
+    def reserve_name(self, chat_name: str) -> str:
+        """Claims a unique chat name, appending _1, _2, ... on collision.
+
+        The next free suffix per base name is stored, so resolving a collision is a couple
+        of indexed lookups instead of probing the disk once per existing duplicate.
+        """
+        now = _now()
+        with self._transaction() as conn:
+            candidate = chat_name
+            if self._taken(candidate):
+                row = conn.execute("SELECT next_suffix FROM name_counters WHERE base = ?", (chat_name,)).fetchone()
+                suffix = row[0] if row else 1
+                candidate = f"{chat_name}_{suffix}"
+                # Only loops if someone created the suffixed name by hand
+                while self._taken(candidate):
+                    suffix += 1
+                    candidate = f"{chat_name}_{suffix}"
+                conn.execute(
+                    "INSERT INTO name_counters (base, next_suffix) VALUES (?, ?) "
+                    "ON CONFLICT(base) DO UPDATE SET next_suffix = excluded.next_suffix",
+                    (chat_name, suffix + 1)
+                )
+            conn.execute(
+                "INSERT INTO chats (name, message_count, byte_size, created_at, updated_at) VALUES (?, 0, 0, ?, ?)",
+                (candidate, now, now)
+            )
+        return candidate
+
+    def _taken(self, chat_name: str) -> bool:
+        in_index = self._conn.execute("SELECT 1 FROM chats WHERE name = ?", (chat_name,)).fetchone() is not None
+        return in_index or chat_log.chat_exists(chat_name, self.directory)
+
+    @staticmethod
+    def _index_messages(conn, chat_name: str, messages: list, start: int):
+        conn.executemany(
+            "INSERT INTO messages (chat_name, position, role, content) VALUES (?, ?, ?, ?)",
+            [(chat_name, start + i, msg["role"], msg["content"]) for i, msg in enumerate(messages)]
+        )
+
+    def record_write(self, chat_name: str, messages: list, byte_size: int):
+        """Records a full rewrite of a chat and reindexes its messages."""
+        now = _now()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO chats (name, message_count, byte_size, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET message_count = excluded.message_count, "
+                "byte_size = excluded.byte_size, updated_at = excluded.updated_at",
+                (chat_name, len(messages), byte_size, now, now)
+            )
+            conn.execute("DELETE FROM messages WHERE chat_name = ?", (chat_name,))
+            self._index_messages(conn, chat_name, messages, 0)
+
+    def record_append(self, chat_name: str, messages: list, byte_size: int):
+        """Records messages appended to a chat; byte_size is the file size after the append."""
+        now = _now()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT message_count FROM chats WHERE name = ?", (chat_name,)).fetchone()
+            start = row[0] if row else 0
+            conn.execute(
+                "INSERT INTO chats (name, message_count, byte_size, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET message_count = excluded.message_count, "
+                "byte_size = excluded.byte_size, updated_at = excluded.updated_at",
+                (chat_name, start + len(messages), byte_size, now, now)
+            )
+            self._index_messages(conn, chat_name, messages, start)
+
+    def record_rename(self, chat_name: str, new_name: str):
+        """Moves a chat's metadata and indexed messages to a name claimed with reserve_name()."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM chats WHERE name = ?", (new_name,))
+            conn.execute("UPDATE chats SET name = ? WHERE name = ?", (new_name, chat_name))
+            conn.execute("UPDATE messages SET chat_name = ? WHERE chat_name = ?", (new_name, chat_name))
+
+    def remove(self, chat_name: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM chats WHERE name = ?", (chat_name,))
+            conn.execute("DELETE FROM messages WHERE chat_name = ?", (chat_name,))
+
+    def rebuild(self) -> int:
+        """Rebuilds the manifest and search index from the chat files on disk. Returns the number of chats indexed."""
+        chats, counters = [], {}
+        for chat_name in chat_log.list_chat_names(self.directory):
+            stat = os.stat(_chat_file(self.directory, chat_name))
+            chats.append((chat_name, chat_log.read_chat(chat_name, self.directory) or [], stat))
+            match = _SUFFIX_RE.match(chat_name)
+            if match:
+                base, suffix = match.group(1), int(match.group(2))
+                counters[base] = max(counters.get(base, 1), suffix + 1)
+
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM chats")
+            conn.execute("DELETE FROM name_counters")
+            conn.execute("DELETE FROM messages")
+            conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('delete-all')")
+            conn.executemany(
+                "INSERT INTO chats (name, message_count, byte_size, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(
+                    chat_name, len(messages), stat.st_size,
+                    datetime.fromtimestamp(min(stat.st_ctime, stat.st_mtime), timezone.utc).isoformat(),
+                    datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+                ) for chat_name, messages, stat in chats]
+            )
+            conn.executemany("INSERT INTO name_counters (base, next_suffix) VALUES (?, ?)", list(counters.items()))
+            for chat_name, messages, _ in chats:
+                self._index_messages(conn, chat_name, messages, 0)
+        return len(chats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local chat manifest.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild the manifest from the chat files.")
+    rebuild_parser.add_argument("--dir", default=chat_log.CHAT_HISTORY_DIR)
+    list_parser = subparsers.add_parser("list", help="Show indexed chats with their metadata.")
+    list_parser.add_argument("--dir", default=chat_log.CHAT_HISTORY_DIR)
+    search_parser = subparsers.add_parser("search", help="Full-text search over saved messages.")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT)
+    search_parser.add_argument("--dir", default=chat_log.CHAT_HISTORY_DIR)
+    args = parser.parse_args()
+
+    index = ChatIndex(args.dir)
+    if args.command == "rebuild":
+        print(f"Indexed {index.rebuild()} chat(s) in {args.dir}/")
+    elif args.command == "search":
+        for hit in index.search(args.query, args.limit):
+            print(f"{hit['chat_name']} #{hit['position'] + 1} ({hit['role']}): {hit['snippet']}")
+    else:
+        for chat in index.list_chats():
+            print(f"{chat['name']:<40} {chat['message_count']:>6} msgs {chat['byte_size']:>9} B  {chat['updated_at']}")
+
+
+if __name__ == "__main__":
+    main()
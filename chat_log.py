@@ -0,0 +1,217 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+
+# ----------------------- APPEND-ONLY CHAT LOG -----------------------
+# Local chats are stored as JSONL, one message per line, so a turn is a single append and
+# the tail of a chat can be read without parsing the whole file. Legacy pretty-printed
+# .json files are still read transparently until they are migrated.
+
+CHAT_HISTORY_DIR = "chat_history"
+LOG_EXT = ".jsonl"
+LEGACY_EXT = ".json"
+
+_TAIL_BLOCK_SIZE = 8192
+
+
+def log_path(chat_name: str, directory: str = CHAT_HISTORY_DIR) -> str:
+    return os.path.join(directory, f"{chat_name}{LOG_EXT}")
+
+
+def legacy_path(chat_name: str, directory: str = CHAT_HISTORY_DIR) -> str:
+    return os.path.join(directory, f"{chat_name}{LEGACY_EXT}")
+
+
+def chat_exists(chat_name: str, directory: str = CHAT_HISTORY_DIR) -> bool:
+    return os.path.exists(log_path(chat_name, directory)) or os.path.exists(legacy_path(chat_name, directory))
+
+
+def list_chat_names(directory: str = CHAT_HISTORY_DIR) -> list[str]:
+    """Lists chat names stored in either format."""
+    names = set()
+    for f in os.listdir(directory):
+        for ext in (LOG_EXT, LEGACY_EXT):
+            if f.endswith(ext):
+                names.add(f[:-len(ext)])
+    return sorted(names)
+
+
+def _encode(msg: dict) -> str:
+    return json.dumps(msg, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _read_legacy(path: str) -> list:
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data.get("messages", []) if isinstance(data, dict) else data
+
+
+def _read_tail_lines(path: str, n: int) -> list[bytes]:
+    """Reads the last n non-empty lines by scanning backwards from the end of the file."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b""
+        while position > 0 and buffer.count(b"\n") <= n:
+            step = min(_TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+    return [line for line in buffer.split(b"\n") if line.strip()][-n:]
+
+
+def read_chat(chat_name: str, directory: str = CHAT_HISTORY_DIR, tail: int | None = None) -> list | None:
+    """Reads a chat (or only its last `tail` messages) from JSONL, falling back to legacy JSON.
+
+    Raises ValueError unless tail is None or at least 1.
+    """
+    if tail is not None and tail < 1:
+        raise ValueError(f"tail must be at least 1, got {tail}")
+    path = log_path(chat_name, directory)
+    if os.path.exists(path):
+        if tail is not None:
+            return [json.loads(line) for line in _read_tail_lines(path, tail)]
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    path = legacy_path(chat_name, directory)
+    if os.path.exists(path):
+        messages = _read_legacy(path)
+        return messages if tail is None else messages[-tail:]
+    return None
+
+
+def write_chat(chat_name: str, messages: list, directory: str = CHAT_HISTORY_DIR) -> int:
+    """Writes a whole chat atomically (temp file + rename) and returns its size in bytes."""
+    path = log_path(chat_name, directory)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write("".join(_encode(msg) for msg in messages).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+
+def rename_chat(chat_name: str, new_name: str, directory: str = CHAT_HISTORY_DIR):
+    """Renames a chat's file, keeping its format. The new name must not be taken."""
+    for path_of in (log_path, legacy_path):
+        path = path_of(chat_name, directory)
+        if os.path.exists(path):
+            os.rename(path, path_of(new_name, directory))
+            return
+    raise FileNotFoundError(f"No saved chat named {chat_name}")
+
+
+class ChatLogWriter:
+    """Appends messages to chat logs, batching fsyncs.
+
+    Appends reach the OS immediately; fsync runs once `fsync_every` appends have piled up
+    or `fsync_interval` seconds have passed, and on flush()/close().
+    """
+
+    def __init__(self, directory: str = CHAT_HISTORY_DIR, fsync_every: int = 8, fsync_interval: float = 1.0):
+        self.directory = directory
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._files = {}
+        self._unsynced = {}
+        self._last_sync = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def append(self, chat_name: str, messages: list) -> int:
+        """Appends messages to a chat, converting a legacy JSON chat to JSONL first. Returns the new file size."""
+        with self._lock:
+            f = self._files.get(chat_name)
+            if f is None:
+                legacy = legacy_path(chat_name, self.directory)
+                if not os.path.exists(log_path(chat_name, self.directory)) and os.path.exists(legacy):
+                    write_chat(chat_name, _read_legacy(legacy), self.directory)
+                    os.remove(legacy)
+                f = open(log_path(chat_name, self.directory), 'ab')
+                self._files[chat_name] = f
+                self._last_sync[chat_name] = time.monotonic()
+
+            f.write("".join(_encode(msg) for msg in messages).encode("utf-8"))
+            f.flush()
+            self._unsynced[chat_name] = self._unsynced.get(chat_name, 0) + len(messages)
+            if (self._unsynced[chat_name] >= self.fsync_every
+                    or time.monotonic() - self._last_sync[chat_name] >= self.fsync_interval):
+                self._sync(chat_name)
+            return f.tell()
+
+    def _sync(self, chat_name: str):
+        os.fsync(self._files[chat_name].fileno())
+        self._unsynced[chat_name] = 0
+        self._last_sync[chat_name] = time.monotonic()
+
+    def flush(self):
+        """Fsyncs every chat with unsynced appends."""
+        with self._lock:
+            for chat_name, count in self._unsynced.items():
+                if count:
+                    self._sync(chat_name)
+
+    def close(self, chat_name: str | None = None):
+        """Fsyncs and closes one chat's file, or all of them."""
+        with self._lock:
+            names = [chat_name] if chat_name is not None else list(self._files)
+            for name in names:
+                f = self._files.pop(name, None)
+                if f is None:
+                    continue
+                if self._unsynced.pop(name, 0):
+                    os.fsync(f.fileno())
+                self._last_sync.pop(name, None)
+                f.close()
+
+
+# ----------------------- MIGRATION -----------------------
+
+def migrate_directory(directory: str = CHAT_HISTORY_DIR, keep: bool = False) -> list[str]:
+    """Converts legacy .json chats to .jsonl, verifying each before removing the original."""
+    migrated = []
+    for f in sorted(os.listdir(directory)):
+        if not f.endswith(LEGACY_EXT):
+            continue
+        chat_name = f[:-len(LEGACY_EXT)]
+        if os.path.exists(log_path(chat_name, directory)):
+            print(f"Skipping {f}: {chat_name}{LOG_EXT} already exists")
+            continue
+
+        messages = _read_legacy(os.path.join(directory, f))
+        write_chat(chat_name, messages, directory)
+        if read_chat(chat_name, directory) != messages:
+            os.remove(log_path(chat_name, directory))
+            print(f"Skipping {f}: converted file did not round-trip")
+            continue
+        if not keep:
+            os.remove(os.path.join(directory, f))
+        migrated.append(chat_name)
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local JSONL chat log.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Convert legacy .json chats to .jsonl.")
+    migrate_parser.add_argument("--dir", default=CHAT_HISTORY_DIR)
+    migrate_parser.add_argument("--keep", action="store_true", help="Keep the original .json files.")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        from chat_index import ChatIndex
+
+        migrated = migrate_directory(args.dir, keep=args.keep)
+        # File sizes changed, so refresh the manifest
+        ChatIndex(args.dir).rebuild()
+        print(f"Migrated {len(migrated)} chat(s) in {args.dir}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import math
+import re
+from collections import Counter
+from datetime import datetime
+
+# ----------------------- LOCAL CHAT NAMER -----------------------
+# Keyword titles without a model call: words in the last few messages are scored by TF-IDF
+# and the top ones become the title. IDF weights come from the local classifier's
+# vocabulary when one is trained; otherwise each message counts as a document.
+
+DEFAULT_MAX_WORDS = 3
+DEFAULT_RECENT_MESSAGES = 6
+
+# Assistant replies inform the topic but should not outvote what the user wrote
+ROLE_WEIGHTS = {"user": 1.0, "assistant": 0.4}
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z'-]+")
+
+STOPWORDS = frozenset("""
+    a about above after again against all also am an and any anyone anything are aren't as at be because
+    been before being below between both but by can can't cannot could couldn't did didn't do does
+    doesn't doing don't down during each even ever every everything few for from further get gets
+    getting give go going gonna got had hadn't has hasn't have haven't having he he'd he'll he's her
+    here here's hers herself him himself his how how's however i i'd i'll i'm i've if in into is isn't
+    it it's its itself just keep kind know last let let's like lot make many may maybe me might more
+    most much must mustn't my myself need next no nor not nothing now of off often on once one only or
+    other ought our ours ourselves out over own please really right same say see shall shan't she she'd
+    she'll she's should shouldn't so some someone something still such sure take tell than thank thanks
+    that that's the their theirs them themselves then there there's these they they'd they'll they're
+    they've thing things think this those though through to too try under until up us very want was
+    wasn't way we we'd we'll we're we've well were weren't what what's when when's where where's whether
+    which while who who's whom why why's will with won't would wouldn't yeah yes yet you you'd you'll
+    you're you've your yours yourself yourselves
+""".split())
+
+
+def fallback_name() -> str:
+    return datetime.now().strftime("Chat_%Y-%m-%d_%H%M%S")
+
+
+def _words(text: str) -> list[str]:
+    return [w.strip("'-").lower() for w in _WORD_RE.findall(text)
+            if len(w) > 2 and w.lower() not in STOPWORDS]
+
+
+def keywords(messages: list, max_words: int = DEFAULT_MAX_WORDS, idf: dict[str, float] | None = None,
+             recent: int = DEFAULT_RECENT_MESSAGES) -> list[str]:
+    """Returns the top TF-IDF keywords of the last `recent` messages, best first."""
+    documents = [(ROLE_WEIGHTS.get(msg.get("role"), 0.0), _words(str(msg.get("content", ""))))
+                 for msg in messages[-recent:]]
+    documents = [(weight, words) for weight, words in documents if weight and words]
+    if not documents:
+        return []
+
+    tf, first_seen = Counter(), {}
+    for weight, words in documents:
+        for word in words:
+            tf[word] += weight
+            first_seen.setdefault(word, len(first_seen))
+
+    if idf:
+        # Words the classifier never saw are rarer than anything it did
+        unseen = max(idf.values())
+        weights = {word: idf.get(word, unseen) for word in tf}
+    else:
+        df = Counter(word for _, words in documents for word in set(words))
+        weights = {word: math.log((1 + len(documents)) / (1 + df[word])) + 1 for word in tf}
+
+    ranked = sorted(tf, key=lambda word: (-tf[word] * weights[word], first_seen[word]))
+    return ranked[:max_words]
+
+
+def keyword_chat_name(messages: list, max_words: int = DEFAULT_MAX_WORDS, idf: dict[str, float] | None = None) -> str:
+    """A filename-safe title such as Exam_Stress_Sleep, or a timestamped name when nothing stands out."""
+    words = keywords(messages, max_words, idf)
+    name = "_".join(re.sub(r"[^A-Za-z0-9-]", "", word).capitalize() for word in words).strip("_")
+    return name or fallback_name()
@@ -0,0 +1,410 @@
+import atexit
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+from metrics import metrics
+
+# ----------------------- SUPABASE CHAT STORE -----------------------
+# Database access for the Streamlit app, kept free of Streamlit so it can be reused and
+# benchmarked against an in-memory PostgREST stand-in.
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 30
+DEFAULT_MESSAGE_PAGE_SIZE = 50
+SAVE_CHAT_RPC = "save_chat_with_messages"
+SEARCH_MESSAGES_RPC = "search_messages"
+DEFAULT_SEARCH_LIMIT = 20
+SET_MESSAGE_TYPES_RPC = "set_message_types"
+
+# Only what the sidebar renders; message_count and last_message_preview are kept up to date by triggers
+CHAT_LIST_COLUMNS = "id,name,updated_at,message_count,last_message_preview"
+MESSAGE_COLUMNS = "id,role,content,created_at"
+
+
+def message_rows(chat_id: str | None, messages: list, start: datetime | None = None) -> list[dict]:
+    """Builds message rows with strictly increasing created_at values.
+
+    Rows inserted in one request would otherwise share the same default now() and lose
+    their order when read back by created_at.
+    """
+    start = start or datetime.now(timezone.utc)
+    rows = []
+    for i, msg in enumerate(messages):
+        row = {
+            "role": msg["role"],
+            "content": msg["content"],
+            "created_at": (start + timedelta(microseconds=i)).isoformat(),
+        }
+        if chat_id is not None:
+            row["chat_id"] = chat_id
+        if msg.get("message_type"):
+            row["message_type"] = msg["message_type"]
+        rows.append(row)
+    return rows
+
+
+def _is_permanent_error(error: Exception) -> bool:
+    """True for Postgres errors a retry cannot fix: bad data (22xxx), constraint violations (23xxx)
+    and schema mismatches (42xxx)."""
+    code = str(getattr(error, "code", "") or "")
+    return len(code) == 5 and code[:2] in ("22", "23", "42")
+
+
+def _is_missing_function(error: Exception) -> bool:
+    """True when PostgREST reports that an RPC is not deployed (PGRST202 / 404), as opposed to a call that failed."""
+    code = str(getattr(error, "code", "") or "")
+    return code in ("PGRST202", "404") or "PGRST202" in str(error) or "Could not find the function" in str(error)
+
+
+class ChatStore:
+    """Reads and writes chats and messages through a Supabase client."""
+
+    def __init__(self, client, batch_size: int = DEFAULT_BATCH_SIZE, use_rpc: bool = True):
+        self.client = client
+        self.batch_size = batch_size
+        self.use_rpc = use_rpc
+        # Tracked separately: a project may have one bulk RPC deployed and not the other
+        self.use_set_types_rpc = use_rpc
+
+    @metrics.timed("db_seconds", op="insert_rows")
+    def insert_rows(self, rows: list[dict]):
+        """Inserts prepared message rows as array inserts of at most batch_size rows each."""
+        for i in range(0, len(rows), self.batch_size):
+            self.client.table("messages").insert(rows[i:i + self.batch_size]).execute()
+
+    def insert_messages(self, chat_id: str, messages: list, start: datetime | None = None):
+        """Inserts messages as array inserts of at most batch_size rows each."""
+        self.insert_rows(message_rows(chat_id, messages, start))
+
+    @metrics.timed("db_seconds", op="create_chat")
+    def create_chat(self, name: str, messages: list) -> str:
+        """Creates a chat with its messages and returns the new chat id.
+
+        Uses the save_chat_with_messages RPC (chat row and first batch in one transaction)
+        and falls back to a chat insert plus batched message inserts if it is not deployed.
+        Any other RPC error is raised: the transaction may have committed before it, and a
+        fallback insert would then create the chat twice.
+        """
+        start = datetime.now(timezone.utc)
+        first, rest = messages[:self.batch_size], messages[self.batch_size:]
+
+        chat_id = None
+        if self.use_rpc:
+            try:
+                response = self.client.rpc(SAVE_CHAT_RPC, {
+                    "p_name": name,
+                    "p_messages": message_rows(None, first, start),
+                }).execute()
+                chat_id = response.data
+            except Exception as e:
+                if not _is_missing_function(e):
+                    raise
+                print(f"Bulk save RPC unavailable, falling back to batched inserts: {e}")
+                self.use_rpc = False
+
+        if chat_id is None:
+            chat_response = self.client.table("chats").insert({"name": name}).execute()
+            chat_id = chat_response.data[0]["id"]
+            rest = messages
+
+        if rest:
+            self.insert_messages(chat_id, rest, start + timedelta(microseconds=len(messages) - len(rest)))
+        return chat_id
+
+    @metrics.timed("db_seconds", op="touch_chat")
+    def touch_chat(self, chat_id: str):
+        """Bumps a chat's updated_at."""
+        self.client.table("chats").update({
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }).eq("id", chat_id).execute()
+
+    @metrics.timed("db_seconds", op="rename_chat")
+    def rename_chat(self, chat_id: str, name: str):
+        """Sets a chat's name without bumping updated_at, so a late title does not reorder the list."""
+        self.client.table("chats").update({"name": name}).eq("id", chat_id).execute()
+
+    @metrics.timed("db_seconds", op="list_chats")
+    def list_chats(self, limit: int = DEFAULT_PAGE_SIZE,
+                   cursor: tuple[str, str] | None = None) -> tuple[list[dict], tuple[str, str] | None]:
+        """Returns one page of chats, most recently updated first, and the cursor for the next page.
+
+        Keyset pagination on (updated_at, id) so each page is an index range scan no matter
+        how deep the user scrolls.
+        """
+        query = self.client.table("chats").select(CHAT_LIST_COLUMNS)
+        if cursor is not None:
+            updated_at, chat_id = cursor
+            query = query.or_(f'updated_at.lt."{updated_at}",and(updated_at.eq."{updated_at}",id.lt.{chat_id})')
+        response = query.order("updated_at", desc=True).order("id", desc=True).limit(limit).execute()
+
+        rows = response.data or []
+        next_cursor = (rows[-1]["updated_at"], rows[-1]["id"]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    @metrics.timed("db_seconds", op="load_chat")
+    def load_chat(self, chat_id: str,
+                  limit: int = DEFAULT_MESSAGE_PAGE_SIZE) -> tuple[dict, list[dict], tuple[str, str] | None]:
+        """Loads a chat and its latest messages in one request.
+
+        Returns the chat row, its most recent messages in chronological order and a cursor
+        for load_older_messages(), or None when the whole history is loaded.
+        """
+        response = (
+            self.client.table("chats")
+            .select(f"id,name,messages({MESSAGE_COLUMNS})")
+            .eq("id", chat_id)
+            .order("created_at", desc=True, foreign_table="messages")
+            .order("id", desc=True, foreign_table="messages")
+            .limit(limit, foreign_table="messages")
+            .single()
+            .execute()
+        )
+        chat = response.data
+        messages, cursor = _page_of_messages(chat.pop("messages", None) or [], limit)
+        return chat, messages, cursor
+
+    @metrics.timed("db_seconds", op="load_older_messages")
+    def load_older_messages(self, chat_id: str, cursor: tuple[str, str],
+                            limit: int = DEFAULT_MESSAGE_PAGE_SIZE) -> tuple[list[dict], tuple[str, str] | None]:
+        """Loads the page of messages just before the cursor, served by the (chat_id, created_at, id) index."""
+        created_at, message_id = cursor
+        response = (
+            self.client.table("messages")
+            .select(MESSAGE_COLUMNS)
+            .eq("chat_id", chat_id)
+            .or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{message_id})')
+            .order("created_at", desc=True)
+            .order("id", desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return _page_of_messages(response.data or [], limit)
+
+    @metrics.timed("db_seconds", op="search_messages")
+    def search_messages(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+        """Ranked full-text search over message content, served by the GIN index on messages.content_tsv."""
+        if not query.strip():
+            return []
+        response = self.client.rpc(SEARCH_MESSAGES_RPC, {"p_query": query, "p_limit": limit}).execute()
+        return response.data or []
+
+    @metrics.timed("db_seconds", op="list_unclassified_messages")
+    def list_unclassified_messages(self, limit: int = DEFAULT_BATCH_SIZE,
+                                   cursor: tuple[str, str] | None = None) -> tuple[list[dict], tuple[str, str] | None]:
+        """Returns one page of user messages without a message_type, oldest first, and the next cursor.
+
+        Keyset pagination on (created_at, id), served by the partial idx_messages_unclassified index.
+        """
+        query = (
+            self.client.table("messages")
+            .select("id,content,created_at")
+            .eq("role", "user")
+            .is_("message_type", "null")
+        )
+        if cursor is not None:
+            created_at, message_id = cursor
+            query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{message_id})')
+        response = query.order("created_at").order("id").limit(limit).execute()
+
+        rows = response.data or []
+        next_cursor = (rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    @metrics.timed("db_seconds", op="set_message_types")
+    def set_message_types(self, labels: dict[str, str]):
+        """Writes message_type for many messages, given as {message_id: label}.
+
+        Uses the set_message_types RPC (one statement for the whole batch) and falls back
+        to one update per label if it is not deployed; other RPC errors are raised.
+        """
+        if not labels:
+            return
+        if self.use_set_types_rpc:
+            try:
+                self.client.rpc(SET_MESSAGE_TYPES_RPC, {"p_labels": labels}).execute()
+                return
+            except Exception as e:
+                if not _is_missing_function(e):
+                    raise
+                print(f"Bulk message_type RPC unavailable, falling back to per-label updates: {e}")
+                self.use_set_types_rpc = False
+
+        by_label = {}
+        for message_id, label in labels.items():
+            by_label.setdefault(label, []).append(message_id)
+        for label, ids in by_label.items():
+            for i in range(0, len(ids), self.batch_size):
+                self.client.table("messages").update({"message_type": label}).in_("id", ids[i:i + self.batch_size]).execute()
+
+
+# ----------------------- MESSAGE PAGING HELPERS -----------------------
+
+def _page_of_messages(rows_newest_first: list[dict], limit: int) -> tuple[list[dict], tuple[str, str] | None]:
+    """Turns a newest-first page into chronological messages plus the cursor for older ones."""
+    rows = list(reversed(rows_newest_first))
+    cursor = (rows[0]["created_at"], rows[0]["id"]) if rows and len(rows) == limit else None
+    return [{"role": r["role"], "content": r["content"]} for r in rows], cursor
+
+
+# ----------------------- WRITE-BEHIND QUEUE -----------------------
+
+class WriteBehindQueue:
+    """Persists per-turn messages on a background thread so replies render without waiting on the database.
+
+    Pending messages are grouped per chat; each flush writes one array insert and one
+    updated_at bump per chat. Chats are flushed independently, in enqueue order, and a
+    failed chat keeps its messages at the head of its queue and is retried with jittered
+    exponential backoff, so ordering per chat_id is preserved. A batch that fails with a
+    permanent error, or `max_attempts` times, is moved to `dead_letters` with a logged error
+    so the chat's later messages are not stuck behind it.
+    """
+
+    def __init__(self, store: ChatStore, flush_interval: float = 0.5, max_pending: int = 50,
+                 base_backoff: float = 0.5, max_backoff: float = 30.0, max_attempts: int = 8):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max(1, max_attempts)
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "failures": 0, "dead_lettered": 0}
+        # Most recent (chat_id, rows, error) batches given up on
+        self.dead_letters = deque(maxlen=100)
+
+        self._pending = OrderedDict()
+        self._failures = {}
+        self._retry_at = {}
+        self._in_flight = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue_messages(self, chat_id: str, messages: list):
+        """Queues messages for a chat; created_at is fixed now so ordering does not depend on flush time."""
+        rows = message_rows(chat_id, messages)
+        with self._condition:
+            self._pending.setdefault(chat_id, []).extend(rows)
+            self.stats["enqueued"] += len(rows)
+            if self.pending_count() >= self.max_pending:
+                self._condition.notify_all()
+
+    def pending_count(self, chat_id: str | None = None) -> int:
+        if chat_id is not None:
+            return len(self._pending.get(chat_id, []))
+        return sum(len(rows) for rows in self._pending.values())
+
+    def flush(self, timeout: float | None = 10.0) -> bool:
+        """Wakes the writer and waits until nothing is pending. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._retry_at.clear()
+            self._condition.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout: float | None = 10.0):
+        """Flushes outstanding writes and stops the writer thread."""
+        if self._closed:
+            return
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _is_ready(self, chat_id: str, now: float) -> bool:
+        return self._retry_at.get(chat_id, 0) <= now
+
+    def _until_retry(self, now: float) -> float:
+        """Seconds until the first pending chat may be written again."""
+        return max(0.0, min(self._retry_at.get(chat_id, 0) for chat_id in self._pending) - now)
+
+    def _take_ready(self) -> list[tuple[str, list]]:
+        now = time.monotonic()
+        ready = [(chat_id, rows) for chat_id, rows in self._pending.items() if self._is_ready(chat_id, now)]
+        for chat_id, _ in ready:
+            del self._pending[chat_id]
+        self._in_flight += len(ready)
+        return ready
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                size_triggered = (self.pending_count() >= self.max_pending
+                                  and any(self._is_ready(chat_id, now) for chat_id in self._pending))
+                if not self._closed and not size_triggered:
+                    self._condition.wait(self.flush_interval)
+                elif self._closed and self._pending and not any(self._is_ready(chat_id, now) for chat_id in self._pending):
+                    # Closing mid-backoff: sleep until the next retry is due rather than spinning
+                    self._condition.wait(self._until_retry(now))
+                if self._closed and not self._pending:
+                    return
+                batches = self._take_ready()
+
+            for chat_id, rows in batches:
+                self._write(chat_id, rows)
+
+    def _write(self, chat_id: str, rows: list):
+        written = 0
+        try:
+            # Chunk here rather than in the store so a failure only requeues the unwritten rows
+            for i in range(0, len(rows), self.store.batch_size):
+                self.store.insert_rows(rows[i:i + self.store.batch_size])
+                written = i + len(rows[i:i + self.store.batch_size])
+        except Exception as e:
+            failed_end = written + self.store.batch_size
+            with self._condition:
+                failures = self._failures.get(chat_id, 0) + 1
+                dead = None
+                if _is_permanent_error(e) or failures >= self.max_attempts:
+                    # Give up on the failing chunk only; the rows after it go straight back
+                    dead, remaining = rows[written:failed_end], rows[failed_end:]
+                    self.dead_letters.append((chat_id, dead, str(e)))
+                    self.stats["dead_lettered"] += len(dead)
+                    self._failures.pop(chat_id, None)
+                    self._retry_at.pop(chat_id, None)
+                else:
+                    remaining = rows[written:]
+                    self._failures[chat_id] = failures
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** (failures - 1))
+                    self._retry_at[chat_id] = time.monotonic() + random.uniform(0, delay)
+                # Put the batch back ahead of anything queued since, keeping per-chat order
+                remaining += self._pending.pop(chat_id, [])
+                if remaining:
+                    self._pending[chat_id] = remaining
+                    self._pending.move_to_end(chat_id, last=False)
+                self.stats["written"] += written
+                self.stats["failures"] += 1
+                self._in_flight -= 1
+                self._condition.notify_all()
+            if dead is not None:
+                print(f"Write-behind gave up on {len(dead)} message(s) for chat {chat_id} "
+                      f"after {failures} attempt(s): {e}")
+            else:
+                print(f"Write-behind flush for chat {chat_id} failed (attempt {failures}): {e}")
+            return
+
+        try:
+            self.store.touch_chat(chat_id)
+        except Exception as e:
+            # Messages are already stored; the next flush for this chat bumps updated_at again
+            print(f"Write-behind updated_at bump for chat {chat_id} failed: {e}")
+
+        with self._condition:
+            self._failures.pop(chat_id, None)
+            self._retry_at.pop(chat_id, None)
+            self.stats["written"] += written
+            self.stats["batches"] += 1
+            self._in_flight -= 1
+            self._condition.notify_all()
+
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from chat_store import ChatStore, DEFAULT_BATCH_SIZE
+from local_classifier import LocalClassifier, DEFAULT_MODEL_PATH
+
+# ----------------------- MESSAGE TYPE BACKFILL -----------------------
+# Labels stored user messages that have no message_type. Unclassified rows are read from
+# Supabase in keyset pages and classified concurrently (the local classifier when it is
+# confident, the LLM classifier otherwise). Labels are written back with one bulk update per
+# page. After every page the cursor goes to a checkpoint file, so an interrupted run resumes
+# where it stopped:
+#     python -m classify_backfill --page-size 500 --concurrency 8
+#     python -m classify_backfill --local-only      # no LLM calls, local classifier labels everything
+
+DEFAULT_CHECKPOINT_PATH = os.path.join("cache", "message_type_backfill.json")
+
+
+class Checkpoint:
+    """Backfill progress on disk: the last fully written cursor and running totals."""
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self.cursor = None
+        self.stats = {"pages": 0, "seen": 0, "labeled": 0, "failed": 0}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.cursor = tuple(data["cursor"]) if data.get("cursor") else None
+            self.stats.update(data.get("stats", {}))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = {"cursor": self.cursor, "stats": self.stats,
+                "updated_at": datetime.now(timezone.utc).isoformat()}
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.cursor = None
+        self.stats = {key: 0 for key in self.stats}
+
+
+def local_labeler(model: LocalClassifier):
+    """Batch labeler that uses only the local classifier, whatever its confidence."""
+    def label(texts: list[str]) -> list[str | None]:
+        return [model.predict(text)[0] for text in texts]
+    return label
+
+
+def service_labeler(chat_service, max_concurrency: int):
+    """Batch labeler that goes through ChatService: local classifier first, LLM below the threshold."""
+    def label(texts: list[str]) -> list[str | None]:
+        return chat_service.classify_batch(texts, max_concurrency)
+    return label
+
+
+def backfill(store: ChatStore, label, checkpoint: Checkpoint, page_size: int = DEFAULT_BATCH_SIZE,
+             max_pages: int | None = None) -> dict:
+    """Classifies unlabeled user messages page by page, checkpointing after each bulk write.
+
+    `label` maps a list of texts to labels (None for failures, which stay unlabeled).
+    Returns the running totals.
+    """
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        start = time.perf_counter()
+        rows, next_cursor = store.list_unclassified_messages(page_size, checkpoint.cursor)
+        if not rows:
+            break
+
+        labels = label([row["content"] for row in rows])
+        updates = {row["id"]: value for row, value in zip(rows, labels) if value is not None}
+        store.set_message_types(updates)
+
+        # Failed rows are behind the cursor now; a run with --restart picks them up again
+        checkpoint.cursor = (rows[-1]["created_at"], rows[-1]["id"])
+        checkpoint.stats["pages"] += 1
+        checkpoint.stats["seen"] += len(rows)
+        checkpoint.stats["labeled"] += len(updates)
+        checkpoint.stats["failed"] += len(rows) - len(updates)
+        checkpoint.save()
+        pages += 1
+        print(f"Page {checkpoint.stats['pages']}: {len(updates)}/{len(rows)} labeled "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        if next_cursor is None:
+            break
+    return checkpoint.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill messages.message_type for stored user messages.")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows read and written per page.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Classifier calls in flight per page.")
+    parser.add_argument("--local-only", action="store_true", help="Label with the local classifier only (no LLM).")
+    parser.add_argument("--model", default=os.getenv("LOCAL_CLASSIFIER_PATH", DEFAULT_MODEL_PATH),
+                        help="Local classifier model path.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Progress file used to resume.")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the oldest row.")
+    parser.add_argument("--max-pages", type=int, default=None, help="Stop after this many pages.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from supabase import create_client
+    store = ChatStore(create_client(os.getenv("VITE_SUPABASE_URL"), os.getenv("VITE_SUPABASE_SUPABASE_ANON_KEY")))
+
+    if args.local_only:
+        model = LocalClassifier.load(args.model)
+        if model is None:
+            parser.error(f"no local classifier found at {args.model}")
+        label = local_labeler(model)
+    else:
+        from main import ChatService
+        label = service_labeler(ChatService(local_classifier_path=args.model), args.concurrency)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.clear()
+    elif checkpoint.cursor is not None:
+        print(f"Resuming after message {checkpoint.cursor[1]} ({checkpoint.stats['seen']} rows done)")
+
+    stats = backfill(store, label, checkpoint, args.page_size, args.max_pages)
+    print(json.dumps(stats, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ----------------------- CONVERSATION MEMORY -----------------------
+# Packs as much recent history as fits a token budget into each agent prompt and folds
+# older turns into a rolling summary. The summary is only recomputed when the window
+# slides past it, and is cached per chat, so prompt size stays roughly constant however
+# long the chat gets.
+
+DEFAULT_TOKEN_BUDGET = 3000
+DEFAULT_SUMMARY_SLACK = 6
+DEFAULT_MAX_CHATS = 1024
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) that needs no tokenizer round trip."""
+    return len(text) // 4 + 1
+
+
+def _message_tokens(msg: dict) -> int:
+    # Role markers and separators cost a few tokens per message
+    return estimate_tokens(msg["content"]) + 4
+
+
+def _fingerprint(messages: list) -> str:
+    digest = hashlib.sha256()
+    for msg in messages:
+        digest.update(msg["role"].encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(msg["content"].encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class _SummaryState:
+    # covered: absolute position (in the whole conversation) the summary runs up to, exclusive;
+    # boundary: fingerprint of the last covered message, checked while it is still in view
+    __slots__ = ("covered", "summary", "boundary")
+
+    def __init__(self, covered: int = 0, summary: str = "", boundary: str = ""):
+        self.covered = covered
+        self.summary = summary
+        self.boundary = boundary
+
+
+class ContextBuilder:
+    """Builds token-budgeted agent prompts with an incrementally maintained summary of older turns.
+
+    `summarize` is an async callable taking (previous_summary, messages_to_fold) and returning
+    the new summary text. Callers may pass a window of the conversation rather than all of it;
+    `offset` is the window's position in the conversation, so the summary survives the window
+    sliding forward or growing backwards.
+    """
+
+    def __init__(self, summarize, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 summary_slack: int = DEFAULT_SUMMARY_SLACK, max_chats: int = DEFAULT_MAX_CHATS):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.summary_slack = summary_slack
+        self.max_chats = max_chats
+        self.stats = {"builds": 0, "summaries": 0, "summarized_messages": 0, "summary_failures": 0}
+        self._states = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def chat_key(state: dict) -> str:
+        """Identifies the chat: its conversation id, its saved id, or else a hash of its opening message."""
+        if state.get("conversation_id"):
+            return f"conversation:{state['conversation_id']}"
+        if state.get("chat_id"):
+            return f"id:{state['chat_id']}"
+        return "first:" + _fingerprint(state["messages"][:1])
+
+    def _window_start(self, system_prompt: str, summary: str, messages: list) -> int:
+        """Index of the oldest message that fits the budget next to the system prompt and summary."""
+        used = estimate_tokens(system_prompt) + estimate_tokens(summary)
+        start = len(messages)
+        while start > 0:
+            cost = _message_tokens(messages[start - 1])
+            # The latest message is always sent, even if it alone exceeds the budget
+            if used + cost > self.token_budget and start < len(messages):
+                break
+            used += cost
+            start -= 1
+        # Keep the window opening on a user turn; a dangling assistant reply goes to the summary
+        while start < len(messages) - 1 and messages[start]["role"] != "user":
+            start += 1
+        return start
+
+    def _get_state(self, key: str, messages: list, offset: int) -> _SummaryState:
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+        if state is None or state.covered > offset + len(messages):
+            return _SummaryState(offset)
+        if state.covered > offset:
+            # A different or edited history under the same key invalidates the summary
+            if _fingerprint(messages[state.covered - offset - 1:state.covered - offset]) != state.boundary:
+                return _SummaryState(offset)
+        elif state.covered < offset:
+            # The window's head was trimmed past the summary; carry it forward from the new head
+            return _SummaryState(offset, state.summary)
+        return state
+
+    def _store_state(self, key: str, state: _SummaryState):
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_chats:
+                self._states.popitem(last=False)
+
+    async def _fold(self, key: str, state: _SummaryState, messages: list, offset: int, upto: int) -> _SummaryState:
+        """Folds messages up to absolute position `upto` into the summary."""
+        # Concurrent builds for the same chat (e.g. speculative agents) share one summarization
+        task_key = (key, state.covered, state.boundary, upto)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._inflight.get(task_key)
+            if task is None or task.get_loop() is not loop:
+                task = loop.create_task(self.summarize(state.summary, messages[state.covered - offset:upto - offset]))
+                self._inflight[task_key] = task
+                created = True
+            else:
+                created = False
+        try:
+            summary = await asyncio.shield(task)
+        finally:
+            if created:
+                with self._lock:
+                    self._inflight.pop(task_key, None)
+
+        if created:
+            with self._lock:
+                self.stats["summaries"] += 1
+                self.stats["summarized_messages"] += upto - state.covered
+        new_state = _SummaryState(upto, summary, _fingerprint(messages[upto - offset - 1:upto - offset]))
+        self._store_state(key, new_state)
+        return new_state
+
+    async def cover(self, key: str, messages: list, offset: int, upto: int):
+        """Folds everything before absolute position `upto` into the summary, e.g. before the
+        caller drops those messages."""
+        state = self._get_state(key, messages, offset)
+        if state.covered < upto:
+            await self._fold(key, state, messages, offset, upto)
+
+    async def build(self, key: str, system_prompt: str, messages: list, offset: int = 0) -> list[dict]:
+        """Returns the prompt messages: system prompt (plus summary) followed by the recent window.
+
+        `messages` starts at position `offset` of the conversation.
+        """
+        with self._lock:
+            self.stats["builds"] += 1
+        state = self._get_state(key, messages, offset)
+        covered = state.covered - offset
+
+        start = max(self._window_start(system_prompt, state.summary, messages), covered)
+        if start > covered:
+            # Fold a few extra turns at once so the summary is not recomputed on every turn
+            upto = min(start + self.summary_slack, len(messages) - 1)
+            while upto > start and messages[upto]["role"] != "user":
+                upto -= 1
+            try:
+                state = await self._fold(key, state, messages, offset, offset + upto)
+                start = state.covered - offset
+            except Exception as e:
+                # Answer with the previous summary and the budgeted window; the fold is retried next turn
+                print(f"Warning: summarizing older messages failed, continuing without them: {e}")
+                with self._lock:
+                    self.stats["summary_failures"] += 1
+
+        system = system_prompt
+        if state.summary:
+            system += f"\n\nSummary of the earlier conversation:\n{state.summary}"
+        return [{"role": "system", "content": system}] + [
+            {"role": msg["role"], "content": msg["content"]} for msg in messages[start:]
+        ]
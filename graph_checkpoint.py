@@ -0,0 +1,85 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+# ----------------------- GRAPH CHECKPOINTS -----------------------
+# Conversation state kept by the graph between turns, keyed by thread id, so each turn
+# appends only its new messages. LangGraph's InMemorySaver keeps every checkpoint
+# of every thread forever; this one keeps each thread's latest checkpoint and evicts the least
+# recently used threads. A thread that was evicted is simply seeded again with the full history.
+# Each thread also keeps only its newest `max_messages` messages: like the app's session memory, far
+# more than the agents' token budget. ChatService trims them in batches at the end of a turn, once the
+# rolling summary covers the messages it drops.
+
+DEFAULT_MAX_THREADS = 256
+DEFAULT_MAX_MESSAGES = 200
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """In-memory checkpointer holding the latest checkpoint of up to `max_threads` threads,
+    plus the per-thread message cap (`max_messages`) ChatService trims them to."""
+
+    def __init__(self, max_threads: int | None = None, max_messages: int | None = None):
+        super().__init__()
+        if max_threads is None:
+            max_threads = int(os.getenv("GRAPH_MAX_THREADS", DEFAULT_MAX_THREADS))
+        if max_messages is None:
+            max_messages = int(os.getenv("GRAPH_MAX_THREAD_MESSAGES", DEFAULT_MAX_MESSAGES))
+        self.max_threads = max(1, max_threads)
+        self.max_messages = max(2, max_messages)
+        self._threads = OrderedDict()
+        # Threads with a turn in progress; never evicted
+        self._pinned = Counter()
+        # Current blob version per (thread, namespace, channel)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+
+            # Earlier checkpoints, their pending writes and superseded channel values are never read again
+            checkpoints = self.storage[thread_id][checkpoint_ns]
+            for checkpoint_id in [cid for cid in checkpoints if cid != checkpoint["id"]]:
+                del checkpoints[checkpoint_id]
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            for channel, version in new_versions.items():
+                previous = self._versions.get((thread_id, checkpoint_ns, channel))
+                if previous is not None and previous != version:
+                    self.blobs.pop((thread_id, checkpoint_ns, channel, previous), None)
+                self._versions[(thread_id, checkpoint_ns, channel)] = version
+
+            self._threads[thread_id] = None
+            self._threads.move_to_end(thread_id)
+            if len(self._threads) > self.max_threads:
+                for evicted in [t for t in self._threads if t not in self._pinned][:len(self._threads) - self.max_threads]:
+                    del self._threads[evicted]
+                    self._delete(evicted)
+        return result
+
+    def pin(self, thread_id: str):
+        with self._lock:
+            self._pinned[thread_id] += 1
+
+    def unpin(self, thread_id: str):
+        with self._lock:
+            self._pinned[thread_id] -= 1
+            if self._pinned[thread_id] <= 0:
+                del self._pinned[thread_id]
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+            self._delete(thread_id)
+
+    def _delete(self, thread_id: str):
+        super().delete_thread(thread_id)
+        for key in [key for key in self._versions if key[0] == thread_id]:
+            del self._versions[key]
+
+    def thread_count(self) -> int:
+        return len(self._threads)
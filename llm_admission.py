@@ -0,0 +1,322 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# ----------------------- LLM ADMISSION CONTROL -----------------------
+# Every ChatService call to the model goes through one AdmissionController: a token bucket
+# caps the request rate, a slot limit caps concurrent requests, retryable upstream errors
+# are retried with jittered exponential backoff, and slow idempotent calls can be hedged
+# with a duplicate request. State is guarded by thread locks rather than asyncio primitives
+# so the same controller works from any event loop.
+
+DEFAULT_MAX_IN_FLIGHT = 16
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BASE_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 20.0
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAME_HINTS = ("RateLimit", "ResourceExhausted", "ServiceUnavailable", "ServerError",
+                         "DeadlineExceeded", "Timeout", "TooManyRequests")
+_LATENCY_WINDOW = 500
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when a model call still fails with a retryable error after every retry."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for throttling, timeouts and transient server errors, looking through chained causes."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        for attr in ("code", "status_code", "status"):
+            if getattr(error, attr, None) in RETRYABLE_STATUS_CODES:
+                return True
+        if any(hint in type(error).__name__ for hint in _RETRYABLE_NAME_HINTS):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class TokenBucket:
+    """Requests-per-second limiter that reserves tokens ahead, so waiters are served in arrival order."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def try_take(self) -> bool:
+        """Takes a token only if one is available right now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class _Slots:
+    """Counting semaphore usable from any event loop; waiters are served FIFO."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            # The slot was already handed to us; pass it on
+            if handed_over:
+                self.release()
+            raise
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return True
+            return False
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.in_flight -= 1
+                return
+            # Hand the slot straight to the next waiter; in_flight stays the same
+            loop, future = self._waiters.popleft()
+        loop.call_soon_threadsafe(_resolve_waiter, future)
+
+
+def _resolve_waiter(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """Rate limit, concurrency cap, retries and optional hedging for model calls.
+
+    `rate` is requests per second (None disables the bucket). `hedge_after` is None (off),
+    "p95"-style adaptive hedging, or a fixed delay in seconds after which a duplicate request
+    is sent for calls that allow it; the first response wins and the other is cancelled.
+    Adaptive thresholds come from the latencies of calls with the same label, so a slow call
+    kind never sets the threshold for a fast one. Hedges only go out when a slot and a rate
+    token are free right away.
+    """
+
+    def __init__(self, rate: float | None = None, burst: float | None = None,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_backoff: float = DEFAULT_BASE_BACKOFF, max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 hedge_after: float | str | None = None, hedge_min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.slots = _Slots(max_in_flight)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.hedge_quantile = None
+        self.hedge_delay = None
+        if isinstance(hedge_after, str):
+            self.hedge_quantile = float(hedge_after.lower().lstrip("p")) / 100
+        elif hedge_after is not None:
+            self.hedge_delay = float(hedge_after)
+        self.hedge_min_samples = hedge_min_samples
+
+        # Recent successful call latencies per label
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "hedges": 0, "hedge_wins": 0,
+                       "rate_wait_s": 0.0, "slot_wait_s": 0.0}
+
+    # --- Public API ---
+
+    async def call(self, factory, hedge: bool = False, can_retry=None, label: str = "default"):
+        """Runs `factory()` (a coroutine function making one model request) under admission control.
+
+        Retryable failures are retried with full-jitter exponential backoff; the last one is
+        re-raised as LLMUnavailableError. Other errors propagate unchanged. `can_retry`, if
+        given, is asked before each retry; when it returns False (e.g. a streamed reply has
+        already shown tokens) the failure is final. `label` names the kind of call its latency
+        is tracked under.
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(factory, hedge, label)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt >= self.max_retries or (can_retry is not None and not can_retry()):
+                    self._count("failures")
+                    raise LLMUnavailableError(f"Model unavailable after {attempt + 1} attempt(s): {e}") from e
+                attempt += 1
+                self._count("retries")
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, delay))
+
+    def hedge_threshold(self, label: str = "default") -> float | None:
+        """Seconds after which a hedge of a `label` call is sent, or None while hedging is off
+        or that label is still warming up."""
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        if self.hedge_quantile is None:
+            return None
+        with self._lock:
+            latencies = self._latencies.get(label, ())
+            if len(latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            labels = list(self._latencies)
+        stats["in_flight"] = self.slots.in_flight
+        stats["max_in_flight"] = self.slots.limit
+        stats["hedge_threshold_s"] = {label: self.hedge_threshold(label) for label in labels}
+        return stats
+
+    # --- Internals ---
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    async def _admit(self):
+        start = time.perf_counter()
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+        admitted = time.perf_counter()
+        await self.slots.acquire()
+        with self._lock:
+            self._stats["rate_wait_s"] += admitted - start
+            self._stats["slot_wait_s"] += time.perf_counter() - admitted
+            self._stats["attempts"] += 1
+
+    async def _timed(self, factory, label: str):
+        start = time.perf_counter()
+        result = await factory()
+        with self._lock:
+            latencies = self._latencies.get(label)
+            if latencies is None:
+                latencies = self._latencies[label] = deque(maxlen=_LATENCY_WINDOW)
+            latencies.append(time.perf_counter() - start)
+        return result
+
+    def _launch(self, factory, label: str) -> asyncio.Future:
+        task = asyncio.ensure_future(self._timed(factory, label))
+        # A done callback (unlike try/finally) also runs when the task is cancelled before it starts
+        task.add_done_callback(self._release_slot)
+        return task
+
+    def _release_slot(self, task: asyncio.Future):
+        self.slots.release()
+        if not task.cancelled():
+            task.exception()  # the caller handles it; avoids "exception was never retrieved" noise
+
+    async def _attempt(self, factory, hedge: bool, label: str):
+        await self._admit()
+        tasks = [self._launch(factory, label)]
+        primary = tasks[0]
+        try:
+            threshold = self.hedge_threshold(label) if hedge else None
+            if threshold is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+            if done or not self._try_admit_hedge():
+                return await primary
+
+            self._count("hedges")
+            backup = self._launch(factory, label)
+            tasks.append(backup)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count("hedge_wins")
+                        return task.result()
+            # Both failed: surface the primary's error
+            return primary.result()
+        finally:
+            # Cancels the losing hedge, or everything if the caller itself was cancelled
+            for task in tasks:
+                task.cancel()
+
+    def _try_admit_hedge(self) -> bool:
+        if not self.slots.try_acquire():
+            return False
+        if self.bucket is not None and not self.bucket.try_take():
+            self.slots.release()
+            return False
+        self._count("attempts")
+        return True
+
+
+_shared_controller = None
+_shared_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Returns the process-wide controller, configured on first use from LLM_RATE_LIMIT (requests/s,
+    0 = unlimited), LLM_BURST, LLM_MAX_IN_FLIGHT, LLM_MAX_RETRIES and LLM_HEDGE ("off", "p95" or seconds)."""
+    global _shared_controller
+    with _shared_controller_lock:
+        if _shared_controller is None:
+            rate = float(os.getenv("LLM_RATE_LIMIT", "0")) or None
+            burst = os.getenv("LLM_BURST")
+            hedge = os.getenv("LLM_HEDGE", "off").lower()
+            if hedge in ("", "off", "0"):
+                hedge_after = None
+            elif hedge.startswith("p"):
+                hedge_after = hedge
+            else:
+                hedge_after = float(hedge)
+            _shared_controller = AdmissionController(
+                rate=rate,
+                burst=float(burst) if burst else None,
+                max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                hedge_after=hedge_after,
+            )
+        return _shared_controller
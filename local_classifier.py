@@ -0,0 +1,263 @@
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import re
+import time
+from collections import Counter
+
+# ----------------------- LOCAL MESSAGE CLASSIFIER -----------------------
+# A small TF-IDF + logistic regression model that runs in-process on CPU.
+# ChatService consults it before the LLM classifier and only falls back to
+# the LLM when the local prediction is not confident enough.
+
+LABELS = ("logical", "emotional")
+DEFAULT_MODEL_PATH = os.path.join("models", "local_classifier.json")
+DEFAULT_LABELS_PATH = os.path.join("models", "classifier_labels.jsonl")
+DEFAULT_THRESHOLD = 0.85
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercases the text and returns unigram and bigram features."""
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class LocalClassifier:
+    """Binary emotional/logical classifier over sparse TF-IDF features."""
+
+    def __init__(self, idf: dict[str, float], weights: dict[str, float], bias: float):
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+
+    # --- Inference ---
+
+    def _features(self, text: str) -> dict[str, float]:
+        counts = Counter(t for t in tokenize(text) if t in self.idf)
+        feats = {t: c * self.idf[t] for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in feats.values()))
+        if norm:
+            feats = {t: v / norm for t, v in feats.items()}
+        return feats
+
+    def predict_proba(self, text: str) -> float:
+        """Returns the probability that the message is emotional."""
+        feats = self._features(text)
+        z = self.bias + sum(self.weights.get(t, 0.0) * v for t, v in feats.items())
+        return _sigmoid(z)
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """Returns (label, confidence) where confidence is in [0.5, 1.0]."""
+        p = self.predict_proba(text)
+        return ("emotional", p) if p >= 0.5 else ("logical", 1.0 - p)
+
+    # --- Training ---
+
+    @classmethod
+    def train(cls, texts: list[str], labels: list[str], epochs: int = 30,
+              learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 0) -> "LocalClassifier":
+        """Fits the model with plain SGD on log-loss."""
+        doc_freq = Counter()
+        for text in texts:
+            doc_freq.update(set(tokenize(text)))
+        n_docs = len(texts)
+        idf = {t: math.log((1 + n_docs) / (1 + df)) + 1.0 for t, df in doc_freq.items()}
+
+        model = cls(idf, {}, 0.0)
+        samples = [(model._features(t), 1.0 if y == "emotional" else 0.0) for t, y in zip(texts, labels)]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(samples)
+            lr = learning_rate / (1 + epoch * 0.1)
+            for feats, y in samples:
+                z = model.bias + sum(model.weights.get(t, 0.0) * v for t, v in feats.items())
+                grad = _sigmoid(z) - y
+                for t, v in feats.items():
+                    w = model.weights.get(t, 0.0)
+                    model.weights[t] = w - lr * (grad * v + l2 * w)
+                model.bias -= lr * grad
+        return model
+
+    # --- Persistence ---
+
+    def save(self, path: str = DEFAULT_MODEL_PATH):
+        """Saves the model as JSON."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({"idf": self.idf, "weights": self.weights, "bias": self.bias}, f)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MODEL_PATH) -> "LocalClassifier | None":
+        """Loads a saved model, or returns None if there is none."""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls(data["idf"], data["weights"], data["bias"])
+
+
+# ----------------------- LABELED DATA -----------------------
+
+def collect_user_messages(sources: list[str]) -> list[str]:
+    """Collects distinct user messages from saved chat files and directories."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(glob.glob(os.path.join(source, "*.json")) + glob.glob(os.path.join(source, "*.jsonl"))))
+        elif os.path.exists(source):
+            paths.append(source)
+
+    seen, texts = set(), []
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                if path.endswith(".jsonl"):
+                    messages = [json.loads(line) for line in f if line.strip()]
+                else:
+                    data = json.load(f)
+                    messages = data.get("messages", []) if isinstance(data, dict) else data
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        for msg in messages:
+            text = msg.get("content", "").strip()
+            if msg.get("role") == "user" and text and text not in seen:
+                seen.add(text)
+                texts.append(text)
+    return texts
+
+
+def read_labels(path: str) -> tuple[list[str], list[str]]:
+    """Reads a JSONL file of {"text", "label"} records."""
+    texts, labels = [], []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("label") in LABELS:
+                texts.append(record["text"])
+                labels.append(record["label"])
+    return texts, labels
+
+
+def evaluate(model: LocalClassifier, texts: list[str], labels: list[str], threshold: float) -> dict:
+    """Reports agreement between the local model and the LLM labels."""
+    total = len(texts)
+    agree = confident = confident_agree = 0
+    start = time.perf_counter()
+    for text, label in zip(texts, labels):
+        predicted, confidence = model.predict(text)
+        agree += predicted == label
+        if confidence >= threshold:
+            confident += 1
+            confident_agree += predicted == label
+    elapsed = time.perf_counter() - start
+    return {
+        "samples": total,
+        "agreement": agree / total if total else 0.0,
+        "threshold": threshold,
+        "coverage": confident / total if total else 0.0,
+        "confident_agreement": confident_agree / confident if confident else 0.0,
+        "avg_predict_us": elapsed / total * 1e6 if total else 0.0,
+    }
+
+
+# ----------------------- COMMAND LINE -----------------------
+
+def _label_command(args):
+    from main import ChatService
+
+    texts = collect_user_messages(args.sources)
+    done = set()
+    if os.path.exists(args.labels):
+        done = set(read_labels(args.labels)[0])
+
+    chat_service = ChatService()
+    os.makedirs(os.path.dirname(args.labels) or ".", exist_ok=True)
+    with open(args.labels, 'a') as f:
+        for text in texts:
+            if text in done:
+                continue
+            try:
+                label = chat_service.classify_with_llm(text)
+            except Exception as e:
+                print(f"Error labeling message: {e}")
+                continue
+            f.write(json.dumps({"text": text, "label": label}) + "\n")
+    print(f"Labels written to {args.labels}")
+
+
+def _train_command(args):
+    texts, labels = read_labels(args.labels)
+    if not texts:
+        print(f"No labeled messages found in {args.labels}.")
+        return
+
+    # Hold out a slice for an honest agreement estimate before refitting on everything
+    indices = list(range(len(texts)))
+    random.Random(args.seed).shuffle(indices)
+    n_eval = int(len(indices) * args.eval_fraction)
+    eval_idx, train_idx = indices[:n_eval], indices[n_eval:]
+
+    if eval_idx:
+        model = LocalClassifier.train([texts[i] for i in train_idx], [labels[i] for i in train_idx], seed=args.seed)
+        report = evaluate(model, [texts[i] for i in eval_idx], [labels[i] for i in eval_idx], args.threshold)
+        print("Held-out agreement with LLM labels:")
+        print(json.dumps(report, indent=4))
+
+    model = LocalClassifier.train(texts, labels, seed=args.seed)
+    model.save(args.model)
+    print(f"Model trained on {len(texts)} messages and saved to {args.model}")
+
+
+def _eval_command(args):
+    model = LocalClassifier.load(args.model)
+    if model is None:
+        print(f"No model found at {args.model}.")
+        return
+    texts, labels = read_labels(args.labels)
+    print(json.dumps(evaluate(model, texts, labels, args.threshold), indent=4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate the local message classifier.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    label_parser = subparsers.add_parser("label", help="Label saved user messages with the LLM classifier.")
+    label_parser.add_argument("sources", nargs="*", default=["chat_history", "memory"])
+    label_parser.add_argument("--labels", default=DEFAULT_LABELS_PATH)
+    label_parser.set_defaults(func=_label_command)
+
+    train_parser = subparsers.add_parser("train", help="Train the local model from LLM labels.")
+    train_parser.add_argument("--labels", default=DEFAULT_LABELS_PATH)
+    train_parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    train_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    train_parser.add_argument("--eval-fraction", type=float, default=0.2)
+    train_parser.add_argument("--seed", type=int, default=0)
+    train_parser.set_defaults(func=_train_command)
+
+    eval_parser = subparsers.add_parser("eval", help="Report agreement between the local model and LLM labels.")
+    eval_parser.add_argument("--labels", default=DEFAULT_LABELS_PATH)
+    eval_parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    eval_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    eval_parser.set_defaults(func=_eval_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
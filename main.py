@@ -1,56 +1,502 @@
 from dotenv import load_dotenv
 from typing_extensions import TypedDict
-from langgraph.graph import StateGraph, START, END
 import os
-import json
-from datetime import datetime
-from typing import Literal
-from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import threading
+import time
+import weakref
+from typing import Annotated, Literal
+import chat_log
+from chat_namer import keyword_chat_name
+from chat_index import ChatIndex, DEFAULT_SEARCH_LIMIT
+from local_classifier import LocalClassifier, DEFAULT_MODEL_PATH, DEFAULT_THRESHOLD
+from conversation_memory import ContextBuilder, DEFAULT_TOKEN_BUDGET
+from llm_admission import AdmissionController, LLMUnavailableError, get_admission_controller
+from metrics import metrics
+from response_cache import (ResponseCache, ClassificationMemo, create_response_cache, get_classification_memo,
+                            cache_key, normalize_prompt)
 
 # ----------------------- PERSISTENCE UTILITIES -----------------------
-CHAT_HISTORY_DIR = "chat_history"
+CHAT_HISTORY_DIR = chat_log.CHAT_HISTORY_DIR
+
+# Per-turn appends to local chats; fsyncs are batched
+chat_log_writer = chat_log.ChatLogWriter(CHAT_HISTORY_DIR)
+
+_chat_index = None
+_chat_index_lock = threading.Lock()
 
 def ensure_chat_history_dir():
     """Ensures the chat history directory exists."""
     os.makedirs(CHAT_HISTORY_DIR, exist_ok=True)
 
+def get_chat_index() -> ChatIndex:
+    """Returns the manifest of local chats, building it from the directory on first use."""
+    global _chat_index
+    with _chat_index_lock:
+        if _chat_index is None:
+            _chat_index = ChatIndex(CHAT_HISTORY_DIR)
+        return _chat_index
+
 def list_saved_chats() -> list[str]:
-    """Lists all saved chat filenames (without the .json extension)."""
-    ensure_chat_history_dir()
-    return sorted([f.replace(".json", "") for f in os.listdir(CHAT_HISTORY_DIR) if f.endswith(".json")])
+    """Lists all saved chat names (JSONL chats and legacy JSON chats)."""
+    return get_chat_index().list_names()
+
+def rename_chat_history(chat_name: str, new_name: str) -> str:
+    """Renames a saved chat, resolving collisions like a save does. Returns the name used."""
+    if new_name == chat_name:
+        return chat_name
+    index = get_chat_index()
+    final_name = index.reserve_name(new_name)
+    try:
+        chat_log_writer.close(chat_name)
+        chat_log.rename_chat(chat_name, final_name, CHAT_HISTORY_DIR)
+    except Exception:
+        index.remove(final_name)
+        raise
+    index.record_rename(chat_name, final_name)
+    return final_name
+
+# ----------------------- STRUCTURED OUTPUT SCHEMAS -----------------------
+# pydantic, langgraph and the Gemini client take most of the import time, so they are
+# imported on first use. Schemas are built once per process and shared by every ChatService.
+
+@functools.cache
+def _chat_name_schema():
+    """Pydantic schema for keyword extraction."""
+    from pydantic import BaseModel, Field
+
+    class ChatNameGenerator(BaseModel):
+        chat_name: str = Field(
+            ...,
+            description="A concise, keyword-based title (max 3 words) for the conversation."
+        )
+    return ChatNameGenerator
+
+@functools.cache
+def _classifier_schema():
+    """Pydantic schema for the emotional/logical classifier."""
+    from pydantic import BaseModel, Field
+
+    class MessageClassifier(BaseModel):
+        message_type: Literal["emotional", "logical"] = Field(
+            ...,
+            description="Classify whether the message requires an emotional (therapist) or logical response"
+        )
+    return MessageClassifier
+
+@functools.cache
+def _token_tracker_class():
+    """Callback handler noting whether a model call has streamed any tokens yet."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenTracker(BaseCallbackHandler):
+        run_inline = True
+
+        def __init__(self):
+            self.streamed = False
 
-# Pydantic schema for keyword extraction
-class ChatNameGenerator(BaseModel):
-    chat_name: str = Field(
-        ...,
-        description="A concise, keyword-based title (max 3 words) for the conversation."
-    )
+        def on_llm_new_token(self, token, **kwargs):
+            self.streamed = True
+    return TokenTracker
+
+class ReplyInterruptedError(LLMUnavailableError):
+    """Raised when a streamed reply fails after some of its tokens were already shown."""
+
+def __getattr__(name: str):
+    # Keeps `from main import ChatNameGenerator` working without importing pydantic eagerly
+    if name == "ChatNameGenerator":
+        return _chat_name_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ----------------------- CORE CHAT SERVICE -----------------------
 
+THERAPIST_PROMPT = """You are a compassionate therapist. Focus on the emotional aspects of the user's message.
+                            Show empathy, validate their feelings, and help them process their emotions.
+                            Ask thoughtful questions to help them explore their feelings more deeply.
+                            Avoid giving logical solutions unless explicitly asked."""
+
+LOGICAL_PROMPT = """You are a purely logical assistant. Focus only on facts and information.
+                Provide clear, concise answers based on logic and evidence.
+                Do not address emotions or provide emotional support.
+                Be direct and straightforward in your responses."""
+
+# Speculative execution modes: "off" runs classifier then agent, "likely" starts the
+# predicted agent alongside the classifier, "both" starts both agents alongside it.
+SPECULATION_MODES = ("off", "likely", "both")
+
+# Chat naming modes: "llm" saves under a keyword title and swaps in an LLM title in the
+# background, "local" keeps the keyword title and never calls the model for names.
+CHAT_NAMING_MODES = ("llm", "local")
+
+# Graph checkpointing: "memory" keeps each chat's state in the graph between turns, so turns
+# with a thread_id send only their new messages; "off" leaves every turn stateless.
+CHECKPOINTER_MODES = ("memory", "off")
+
+# Concurrent classifier calls per batch; the admission controller's limits still apply on top
+DEFAULT_BATCH_CONCURRENCY = 8
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an assistant.
+                Update the existing summary with the new messages. Keep facts the user shared, their feelings,
+                open questions and anything the assistant promised. Stay under 200 words."""
+
+def append_messages(left: list, right: list | dict) -> list:
+    """The messages reducer, operator.add as a Python function: LangGraph inspects the reducer's
+    signature on every graph build, and a builtin's costs a copy of sys.modules.
+
+    A {"drop": n} update removes the n oldest messages instead (see _atrim_history).
+    """
+    if isinstance(right, dict):
+        return left[right["drop"]:]
+    return left + right
+
 # Define state (TypedDict is placed globally as it's used for the Graph definition)
 class ChatState(TypedDict):
-    messages: list
+    # Append-only: nodes return just the messages they add
+    messages: Annotated[list, append_messages]
     message_type: str | None
+    chat_id: str | None
+    # Stable id the rolling summary is kept under, and the position of messages[0] in the
+    # whole conversation when only a window of it is passed
+    conversation_id: str | None
+    history_offset: int | None
+    therapist_draft: str | None
+    logical_draft: str | None
+
+class _SpeculationRace:
+    """Per-turn rendezvous between the classifier and the speculative agents."""
+
+    def __init__(self):
+        self.message_type = None
+        self.launched = 0
+        # Branches whose draft was dropped; their tokens must never reach the stream
+        self.discarded = set()
+        self._lock = threading.Lock()
+        self._waiters = []
+
+    def decide(self, message_type: str):
+        with self._lock:
+            self.message_type = message_type
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_resolve, waiter, message_type)
+
+    def discard(self, message_type: str) -> bool:
+        """Drops a branch's draft so the tokens it streamed are never shown.
+
+        Returns False if the classifier already chose that branch, in which case they may have been.
+        """
+        with self._lock:
+            if self.message_type == message_type:
+                return False
+            self.discarded.add(message_type)
+            return True
+
+    async def decided(self) -> str:
+        """Waits for the classifier's decision."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        with self._lock:
+            if self.message_type is not None:
+                return self.message_type
+            self._waiters.append((loop, waiter))
+        return await waiter
+
+    async def wait_for(self, task: asyncio.Task, message_type: str) -> bool:
+        """Waits until the task finishes or the classifier picks the other branch.
+
+        Cancels the task and returns False if the other branch wins.
+        """
+        decision = asyncio.ensure_future(self.decided())
+        await asyncio.wait({task, decision}, return_when=asyncio.FIRST_COMPLETED)
+        if decision.done() and decision.result() != message_type:
+            task.cancel()
+            return False
+        decision.cancel()
+        await asyncio.wait({task})
+        return True
+
+def _resolve(waiter: asyncio.Future, value):
+    if not waiter.done():
+        waiter.set_result(value)
+
+async def _with_decision(events, race: _SpeculationRace):
+    """Passes a graph's stream events through, adding ("decided", message_type) as soon as
+    the classifier decides rather than when its superstep ends."""
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async with contextlib.aclosing(events):
+                async for event in events:
+                    queue.put_nowait(event)
+        except Exception as e:
+            queue.put_nowait(("error", e))
+        else:
+            queue.put_nowait(("end", None))
+
+    async def decision():
+        queue.put_nowait(("decided", await race.decided()))
+
+    tasks = [asyncio.create_task(pump()), asyncio.create_task(decision())]
+    try:
+        while True:
+            mode, chunk = await queue.get()
+            if mode == "end":
+                return
+            if mode == "error":
+                raise chunk
+            yield mode, chunk
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _aclose_when_idle(agen):
+    # A consumer cancelled mid-step leaves the step finishing its cancellation; closing
+    # before then fails with "asynchronous generator is already running"
+    while agen.ag_running:
+        await asyncio.sleep(0)
+    await agen.aclose()
+
+class _BackgroundLoop:
+    """Event loop on a daemon thread that backs the synchronous API.
+
+    Every sync call is scheduled onto the same loop, so concurrent sessions share it and
+    the model's async clients stay bound to a single loop.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="chat-service-loop", daemon=True).start()
+            return self._loop
+
+    def run(self, coro):
+        """Runs a coroutine on the background loop and blocks until it finishes."""
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("Synchronous ChatService API called from its own event loop; use the async API instead.")
+        return self.submit(coro).result()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedules a coroutine on the background loop without waiting for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def arun(self, coro):
+        """Runs a coroutine on the background loop and awaits it from another event loop."""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def aiterate(self, agen):
+        """Drives an async generator on the background loop from another event loop."""
+        try:
+            while True:
+                try:
+                    yield await self.arun(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            await self.arun(_aclose_when_idle(agen))
+
+    def iterate(self, agen):
+        """Drives an async generator on the background loop as a regular generator."""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
 
 class ChatService:
-    def __init__(self, model_name: str = "gemini-2.5-flash"):
+    def __init__(self, model_name: str = "gemini-2.5-flash",
+                 local_classifier_path: str | None = None,
+                 classifier_threshold: float | None = None,
+                 speculation: str | None = None,
+                 response_cache: ResponseCache | None = None,
+                 classification_memo: ClassificationMemo | None = None,
+                 context_token_budget: int | None = None,
+                 admission: AdmissionController | None = None,
+                 chat_naming: str | None = None,
+                 checkpointer=None):
         # Load environment variables
         load_dotenv()
-        
-        self.llm = ChatGoogleGenerativeAI(
-            model=model_name,
-            google_api_key=os.getenv("GEMINI_API_KEY")
+
+        # The model client, its structured-output runnables and the graph are built on first
+        # use (or by warm_up()), keeping construction free of the heavy imports
+        self.model_name = model_name
+        self._llm = None
+        self._structured_llms = {}
+        self._graph = None
+        self._thread_graph = None
+        self._build_lock = threading.RLock()
+        # Rate limit, concurrency cap, retries and hedging shared by every model call in the process
+        self.admission = admission if admission is not None else get_admission_controller()
+
+        # Local fast-path classifier; the LLM classifier is only used below the confidence threshold
+        if local_classifier_path is None:
+            local_classifier_path = os.getenv("LOCAL_CLASSIFIER_PATH", DEFAULT_MODEL_PATH)
+        if classifier_threshold is None:
+            classifier_threshold = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", DEFAULT_THRESHOLD))
+        self.local_classifier = LocalClassifier.load(local_classifier_path)
+        self.classifier_threshold = classifier_threshold
+
+        # Speculative execution trades extra agent calls for one less round trip on the critical path
+        self.speculation = (speculation or os.getenv("SPECULATION_MODE", "off")).lower()
+        if self.speculation not in SPECULATION_MODES:
+            raise ValueError(f"Unknown speculation mode: {self.speculation}")
+        self._speculation_lock = threading.Lock()
+
+        # Saves never wait on a title; LLM titles replace the keyword title when they arrive
+        self.chat_naming = (chat_naming or os.getenv("CHAT_NAMING", "llm")).lower()
+        if self.chat_naming not in CHAT_NAMING_MODES:
+            raise ValueError(f"Unknown chat naming mode: {self.chat_naming}")
+        self._title_futures = set()
+        self._title_lock = threading.Lock()
+
+        # Per-thread graph state; a checkpointer passed in (e.g. a SQLite saver) takes precedence
+        self._checkpointer = checkpointer
+        checkpointer_mode = "memory" if checkpointer is not None else os.getenv("GRAPH_CHECKPOINTER", "memory").lower()
+        if checkpointer_mode not in CHECKPOINTER_MODES:
+            raise ValueError(f"Unknown graph checkpointer: {checkpointer_mode}")
+        self.checkpointing = checkpointer_mode != "off"
+        # One turn at a time per thread, so each reads the checkpoint the previous one wrote
+        self._thread_locks = weakref.WeakValueDictionary()
+
+        self.speculation_stats = {"turns": 0, "launched": 0, "used": 0, "wasted": 0, "mispredicted": 0}
+
+        # Agent replies are cached below the graph so every entry point benefits
+        self.response_cache = response_cache if response_cache is not None else create_response_cache()
+        # LLM classifications are memoized process-wide, shared by every ChatService instance
+        self.classification_memo = classification_memo if classification_memo is not None else get_classification_memo()
+
+        # Agents see as much recent history as fits the budget, with older turns summarized
+        if context_token_budget is None:
+            context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+        self.context_builder = ContextBuilder(self._asummarize, token_budget=context_token_budget)
+
+        self._runner = _BackgroundLoop()
+
+    # --- Lazy Components ---
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._build_lock:
+                if self._llm is None:
+                    self._llm = self._build_llm()
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm):
+        # Swapping the model (e.g. for a fake in benchmarks) drops runnables built on the old one
+        with self._build_lock:
+            self._llm = llm
+            self._structured_llms = {}
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            with self._build_lock:
+                if self._graph is None:
+                    self._graph = self._build_graph()
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph = graph
+
+    @property
+    def checkpointer(self):
+        if self._checkpointer is None and self.checkpointing:
+            with self._build_lock:
+                if self._checkpointer is None:
+                    from graph_checkpoint import BoundedMemorySaver
+                    self._checkpointer = BoundedMemorySaver()
+        return self._checkpointer
+
+    @property
+    def thread_graph(self):
+        """The graph compiled with the checkpointer, for turns that carry a thread_id."""
+        if not self.checkpointing:
+            raise ValueError("graph checkpointing is off (GRAPH_CHECKPOINTER=off)")
+        if self._thread_graph is None:
+            with self._build_lock:
+                if self._thread_graph is None:
+                    self._thread_graph = self._build_graph(self.checkpointer)
+        return self._thread_graph
+
+    def _build_llm(self):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+            model=self.model_name,
+            google_api_key=os.getenv("GEMINI_API_KEY"),
+            # Retries happen in the admission controller so they respect the shared limits
+            max_retries=1
         )
-        self.graph = self._build_graph()
+
+    def _structured_llm(self, schema):
+        """Returns the model bound to a structured-output schema, built once per model."""
+        runnable = self._structured_llms.get(schema)
+        if runnable is None:
+            with self._build_lock:
+                runnable = self._structured_llms.get(schema)
+                if runnable is None:
+                    runnable = self._structured_llms[schema] = self.llm.with_structured_output(schema)
+        return runnable
+
+    def warm_up(self, background: bool = False) -> threading.Thread | None:
+        """Builds the model client, structured-output runnables and graph ahead of the first turn.
+
+        With background=True the work runs on a daemon thread (returned) so it overlaps with
+        the UI starting up and the user typing.
+        """
+        if background:
+            thread = threading.Thread(target=self.warm_up, name="chat-service-warm-up", daemon=True)
+            thread.start()
+            return thread
+        try:
+            self._structured_llm(_classifier_schema())
+            self._structured_llm(_chat_name_schema())
+            self.graph  # built on first access
+            if self.checkpointing:
+                self.thread_graph
+        except Exception as e:
+            print(f"Error warming up chat service: {e}")
+        return None
 
     # --- Utility Methods ---
 
+    def provisional_chat_name(self, messages: list) -> str:
+        """Keyword title from TF-IDF over the last messages; instant, no model call."""
+        idf = self.local_classifier.idf if self.local_classifier is not None else None
+        return keyword_chat_name(messages, idf=idf)
+
     def generate_chat_name_llm(self, messages: list) -> str:
         """Generates a keyword-based name for the chat history using LLM."""
-        name_llm = self.llm.with_structured_output(ChatNameGenerator)
-        
+        return self._runner.run(self.agenerate_chat_name_llm(messages))
+
+    async def agenerate_chat_name_llm(self, messages: list) -> str:
+        """Async variant of generate_chat_name_llm()."""
+        return await self._agenerate_title(messages) or self.provisional_chat_name(messages)
+
+    async def _agenerate_title(self, messages: list) -> str | None:
+        """Asks the LLM for a filename-safe title; None if the call fails or the title is empty."""
+        name_llm = self._structured_llm(_chat_name_schema())
         history_text = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages[-5:])
 
         prompt = [
@@ -60,154 +506,682 @@ class ChatService:
         ]
         
         try:
-            result = name_llm.invoke(prompt)
+            result = await self._call_llm("chat_name", name_llm, prompt, hedge=True)
             safe_name = "".join(c for c in result.chat_name if c.isalnum() or c in (' ', '_', '-')).strip().replace(" ", "_")
-            return safe_name if safe_name else datetime.now().strftime("Chat_%Y-%m-%d_%H%M%S")
+            return safe_name or None
         except Exception as e:
             print(f"Error generating chat name: {e}")
-            return datetime.now().strftime("Chat_%Y-%m-%d_%HM%S")
-        
-    def save_chat_history(self, messages: list, chat_name: str | None = None) -> str:
-        """Saves the chat history to a JSON file, generating a name if none is provided."""
+            return None
+
+    def schedule_chat_title(self, messages: list, apply) -> concurrent.futures.Future | None:
+        """Generates an LLM title in the background and hands it to apply(title).
+
+        apply runs on a worker thread and returns the name actually used. The returned
+        future resolves to that name, or to None if no title was generated or applying it
+        failed. Returns None without calling the model when chat naming is "local".
+        """
+        if self.chat_naming != "llm":
+            return None
+        messages = list(messages)
+
+        async def run():
+            title = await self._agenerate_title(messages)
+            if title is None:
+                return None
+            try:
+                return await asyncio.to_thread(apply, title)
+            except Exception as e:
+                print(f"Error applying chat title {title}: {e}")
+                return None
+
+        future = self._runner.submit(run())
+        with self._title_lock:
+            self._title_futures.add(future)
+        future.add_done_callback(self._discard_title_future)
+        return future
+
+    def _discard_title_future(self, future: concurrent.futures.Future):
+        with self._title_lock:
+            self._title_futures.discard(future)
+
+    def wait_for_titles(self, timeout: float | None = None) -> bool:
+        """Waits for background titles to be applied. Returns False if some are still pending."""
+        with self._title_lock:
+            pending = set(self._title_futures)
+        return not concurrent.futures.wait(pending, timeout).not_done
+
+    def save_chat_history(self, messages: list, chat_name: str | None = None, refine_title: bool | None = None,
+                          on_renamed=None) -> str:
+        """Saves the chat history to a JSONL file and returns the name used.
+
+        Without a chat_name the chat is saved at once under a keyword title, and the LLM
+        title replaces it in the background (see schedule_chat_title()); on_renamed(name) is
+        called after the rename. refine_title forces or skips that background step.
+        """
         ensure_chat_history_dir()
-        
+
+        if refine_title is None:
+            refine_title = not chat_name
         if not chat_name:
-            chat_name = self.generate_chat_name_llm(messages)
+            chat_name = self.provisional_chat_name(messages)
 
-        final_name = chat_name
+        # The manifest hands out the next free _N suffix on collision
+        index = get_chat_index()
+        final_name = index.reserve_name(chat_name)
+        try:
+            size = chat_log.write_chat(final_name, messages, CHAT_HISTORY_DIR)
+        except Exception:
+            index.remove(final_name)
+            raise
+        index.record_write(final_name, messages, size)
+
+        if refine_title:
+            def apply(title: str) -> str:
+                new_name = rename_chat_history(final_name, title)
+                if on_renamed is not None and new_name != final_name:
+                    on_renamed(new_name)
+                return new_name
+            self.schedule_chat_title(messages, apply)
 
-        file_path = os.path.join(CHAT_HISTORY_DIR, f"{final_name}.json")
-        
-        # Handle filename collision by appending an index
-        counter = 1
-        original_name = final_name
-        while os.path.exists(file_path):
-            final_name = f"{original_name}_{counter}"
-            file_path = os.path.join(CHAT_HISTORY_DIR, f"{final_name}.json")
-            counter += 1
-        
-        with open(file_path, 'w') as f:
-            json.dump(messages, f, indent=4)
-            
         return final_name
 
     @staticmethod
-    def load_chat_history(chat_name: str) -> list | None:
-        """Loads a chat history from a JSON file."""
-        file_path = os.path.join(CHAT_HISTORY_DIR, f"{chat_name}.json")
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        return None
+    def rename_chat_history(chat_name: str, new_name: str) -> str:
+        return rename_chat_history(chat_name, new_name)
+
+    @staticmethod
+    def append_chat_history(chat_name: str, messages: list):
+        """Appends new messages to a saved chat, one line each."""
+        ensure_chat_history_dir()
+        size = chat_log_writer.append(chat_name, messages)
+        get_chat_index().record_append(chat_name, messages, size)
+
+    @staticmethod
+    def load_chat_history(chat_name: str, tail: int | None = None) -> list | None:
+        """Loads a chat history (or only its last `tail` messages) from the local store."""
+        return chat_log.read_chat(chat_name, CHAT_HISTORY_DIR, tail=tail)
 
     @staticmethod
     def list_saved_chats() -> list[str]:
         return list_saved_chats()
 
+    @staticmethod
+    def list_saved_chat_details() -> list[dict]:
+        """Lists saved chats with message count, size and timestamps from the manifest."""
+        return get_chat_index().list_chats()
 
-    # --- Graph Node Methods (Bound to instance) ---
-    def _classify_message(self, state: ChatState):
-        classifier_llm = self.llm.with_structured_output(self._get_classifier_schema())
-        last_message = state['messages'][-1]
+    @staticmethod
+    def search(query: str, limit: int = DEFAULT_SEARCH_LIMIT, chat_store=None) -> list[dict]:
+        """Ranked full-text search over saved messages, best match first.
+
+        Searches the local chat index, or the Supabase messages table when a ChatStore is
+        given. Each hit has chat_name, role, snippet and score, plus chat_id (Supabase) or
+        position (local).
+        """
+        if chat_store is not None:
+            return chat_store.search_messages(query, limit)
+        return get_chat_index().search(query, limit)
+
+
+    def classify_with_llm(self, text: str) -> str:
+        """Classifies a message as 'emotional' or 'logical' using the LLM."""
+        return self._runner.run(self.aclassify_with_llm(text))
+
+    async def aclassify_with_llm(self, text: str) -> str:
+        """Async variant of classify_with_llm()."""
+        classifier_llm = self._structured_llm(_classifier_schema())
 
-        result = classifier_llm.invoke([
+        result = await self._call_llm("classifier", classifier_llm, [
             {"role": "system",
              "content": """Classify the user message as either:
                 - 'emotional': if it asks for emotional support, therapy, deals with feelings, or personal problems
                 - 'logical': if it asks for facts, information, logical analysis, or practical solutions
                 """
             },
-            {"role": "user", "content": last_message['content']}
-        ])
-        return {"message_type": result.message_type}
+            {"role": "user", "content": text}
+        ], hedge=True)
+        return result.message_type
+
+    def get_speculation_stats(self) -> dict:
+        """Returns speculative execution counters, including the share of wasted agent calls."""
+        with self._speculation_lock:
+            stats = dict(self.speculation_stats)
+        stats["mode"] = self.speculation
+        stats["waste_ratio"] = stats["wasted"] / stats["launched"] if stats["launched"] else 0.0
+        return stats
+
+    def _record_speculation(self, **counts):
+        with self._speculation_lock:
+            for key, value in counts.items():
+                self.speculation_stats[key] += value
+
+    def get_admission_stats(self) -> dict:
+        """Returns LLM admission counters: retries, hedges, waits and current in-flight requests."""
+        return self.admission.stats()
+
+    async def _call_llm(self, call: str, runnable, model_input, config: dict | None = None, hedge: bool = False,
+                        streamed: bool = False):
+        """Sends one model request through the admission controller; hedge only idempotent, unstreamed calls.
+
+        A streamed call is not retried once it has emitted tokens, since the retry would stream
+        the reply again after them. Records latency (including admission waits and retries),
+        errors and token usage under `call`.
+        """
+        can_retry = None
+        if streamed:
+            from langchain_core.runnables.config import ensure_config, merge_configs
+
+            tracker = _token_tracker_class()()
+            config = merge_configs(ensure_config(config), {"callbacks": [tracker]})
+            can_retry = lambda: not tracker.streamed
+        start = time.perf_counter()
+        try:
+            result = await self.admission.call(lambda: runnable.ainvoke(model_input, config=config), hedge=hedge,
+                                               can_retry=can_retry, label=call)
+        except Exception as e:
+            metrics.inc("llm_errors_total", call=call)
+            if streamed and tracker.streamed:
+                raise ReplyInterruptedError(f"Reply failed after streaming began: {e}") from e
+            raise
+        finally:
+            metrics.observe("llm_seconds", time.perf_counter() - start, call=call)
+
+        usage = getattr(result, "usage_metadata", None)
+        if usage:
+            metrics.inc("llm_tokens_total", usage.get("input_tokens", 0), call=call, direction="input")
+            metrics.inc("llm_tokens_total", usage.get("output_tokens", 0), call=call, direction="output")
+        return result
+
+    @staticmethod
+    def get_metrics() -> dict:
+        """Returns a JSON-ready snapshot of node, model and database latency histograms and counters."""
+        return metrics.snapshot()
+
+    def get_cache_stats(self) -> dict:
+        """Returns response cache hit/miss counters."""
+        if self.response_cache is None:
+            return {"backend": None}
+        return self.response_cache.stats()
+
+    def get_classification_stats(self) -> dict:
+        """Returns classification memo hit rate and saved classifier latency."""
+        if self.classification_memo is None:
+            return {"backend": None}
+        return self.classification_memo.stats()
+
+    async def _classify_text(self, text: str) -> str:
+        """Classifies with the LLM unless the same normalized text was classified before."""
+        if self.classification_memo is None:
+            metrics.inc("classifications_total", source="llm")
+            return await self.aclassify_with_llm(text)
+
+        message_type = self.classification_memo.get(text)
+        if message_type is None:
+            metrics.inc("classifications_total", source="llm")
+            start = time.perf_counter()
+            message_type = await self.aclassify_with_llm(text)
+            self.classification_memo.set(text, message_type, time.perf_counter() - start)
+        else:
+            metrics.inc("classifications_total", source="memo")
+        return message_type
+
+    async def aclassify(self, text: str) -> str:
+        """Classifies a message with the local classifier when it is confident, otherwise the LLM."""
+        if self.local_classifier is not None:
+            label, confidence = self.local_classifier.predict(text)
+            if confidence >= self.classifier_threshold:
+                metrics.inc("classifications_total", source="local")
+                return label
+        return await self._classify_text(text)
+
+    def classify_batch(self, texts: list[str], max_concurrency: int = DEFAULT_BATCH_CONCURRENCY) -> list[str | None]:
+        """Classifies many messages; see aclassify_batch()."""
+        return self._runner.run(self.aclassify_batch(texts, max_concurrency))
+
+    async def aclassify_batch(self, texts: list[str],
+                              max_concurrency: int = DEFAULT_BATCH_CONCURRENCY) -> list[str | None]:
+        """Classifies many messages with at most max_concurrency LLM calls in flight.
+
+        Calls still go through the admission controller and the classification memo; a
+        message whose classification fails comes back as None.
+        """
+        gate = asyncio.Semaphore(max_concurrency)
+
+        async def one(text: str) -> str | None:
+            async with gate:
+                try:
+                    return await self.aclassify(text)
+                except Exception as e:
+                    print(f"Error classifying message: {e}")
+                    return None
+
+        return list(await asyncio.gather(*(one(text) for text in texts)))
+
+    async def _asummarize(self, previous_summary: str, messages: list) -> str:
+        """Folds messages that left the context window into the rolling summary."""
+        from langgraph.constants import TAG_NOSTREAM
+
+        history_text = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages)
+        reply = await self._call_llm("summary", self.llm, [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{history_text}"}
+        ], config={"tags": [TAG_NOSTREAM]}, hedge=True)  # runs inside an agent node; keep it out of the reply stream
+        return reply.content
+
+    async def _agent_reply(self, agent: str, system_prompt: str, state: ChatState) -> str:
+        messages = await self.context_builder.build(
+            ContextBuilder.chat_key(state), system_prompt, state['messages'], state.get('history_offset') or 0
+        )
+
+        key = None
+        if self.response_cache is not None:
+            key = cache_key(agent, *(f"{m['role']}:{normalize_prompt(m['content'])}" for m in messages))
+            cached = self.response_cache.get(key)
+            metrics.inc("cache_requests_total", cache="response", result="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached
+
+        # Not hedged: agent replies are streamed, and a duplicate would interleave its tokens
+        reply = await self._call_llm(agent, self.llm, messages, streamed=True)
+        if key is not None and isinstance(reply.content, str) and reply.content:
+            self.response_cache.set(key, reply.content)
+        return reply.content
+
+    def _predict_message_type(self, state: ChatState) -> str:
+        """Cheap guess of the classifier's answer, used to pick the branch to speculate on."""
+        if self.local_classifier is not None:
+            return self.local_classifier.predict(state['messages'][-1]['content'])[0]
+        return state.get('message_type') or 'logical'
+
+    # --- Graph Node Methods (Bound to instance) ---
+    # Each node is async; the sync variants run it on the background loop so the compiled
+    # graph also supports graph.invoke()/graph.stream().
+
+    async def _aclassify_message(self, state: ChatState, config=None):
+        message_type = await self.aclassify(state['messages'][-1]['content'])
+
+        race = (config or {}).get("configurable", {}).get("speculation")
+        if race is not None:
+            race.decide(message_type)
+        return {"message_type": message_type}
+
+    def _classify_message(self, state: ChatState, config=None):
+        return self._runner.run(self._aclassify_message(state, config))
+
+    async def _atherapist_agent(self, state: ChatState):
+        reply = await self._agent_reply("therapist_agent", THERAPIST_PROMPT, state)
+        return {"messages": [{"role": "assistant", "content": reply}]}
 
     def _therapist_agent(self, state: ChatState):
-        last_message = state['messages'][-1]
-        messages = [
-            {"role": "system",
-             "content": """You are a compassionate therapist. Focus on the emotional aspects of the user's message.
-                            Show empathy, validate their feelings, and help them process their emotions.
-                            Ask thoughtful questions to help them explore their feelings more deeply.
-                            Avoid giving logical solutions unless explicitly asked."""},
-            {"role": "user", "content": last_message['content']}
-        ]
-        reply = self.llm.invoke(messages)
-        return {"messages": state["messages"] + [{"role": "assistant", "content": reply.content}]}
+        return self._runner.run(self._atherapist_agent(state))
+
+    async def _alogical_agent(self, state: ChatState):
+        reply = await self._agent_reply("logical_agent", LOGICAL_PROMPT, state)
+        return {"messages": [{"role": "assistant", "content": reply}]}
 
     def _logical_agent(self, state: ChatState):
-        last_message = state['messages'][-1]
-        messages = [
-            {"role": "system",
-             "content": """You are a purely logical assistant. Focus only on facts and information.
-                Provide clear, concise answers based on logic and evidence.
-                Do not address emotions or provide emotional support.
-                Be direct and straightforward in your responses."""},
-            {"role": "user", "content": last_message['content']}
-        ]
-        reply = self.llm.invoke(messages)
-        return {"messages": state["messages"] + [{"role": "assistant", "content": reply.content}]}
-    
+        return self._runner.run(self._alogical_agent(state))
+
+    async def _speculate(self, message_type: str, agent: str, system_prompt: str, state: ChatState,
+                         config) -> str | None:
+        """Runs an agent ahead of the classifier and returns its reply if its branch wins."""
+        race = config["configurable"]["speculation"]
+        if self.speculation == "likely" and self._predict_message_type(state) != message_type:
+            return None
+
+        race.launched += 1
+        task = asyncio.create_task(self._agent_reply(agent, system_prompt, state))
+        if not await race.wait_for(task, message_type):
+            # The classifier chose the other branch; the in-flight call has been cancelled
+            return None
+        try:
+            return task.result()
+        except Exception as e:
+            if not race.discard(message_type) and isinstance(e, ReplyInterruptedError):
+                # The branch was chosen, so the draft's tokens went out; the agent must not stream another reply
+                raise
+            print(f"Speculative {message_type} reply failed: {e}")
+            return None
+
+    async def _aspeculative_therapist(self, state: ChatState, config):
+        return {"therapist_draft": await self._speculate("emotional", "therapist_agent", THERAPIST_PROMPT, state, config)}
+
+    def _speculative_therapist(self, state: ChatState, config):
+        return self._runner.run(self._aspeculative_therapist(state, config))
+
+    async def _aspeculative_logical(self, state: ChatState, config):
+        return {"logical_draft": await self._speculate("logical", "logical_agent", LOGICAL_PROMPT, state, config)}
+
+    def _speculative_logical(self, state: ChatState, config):
+        return self._runner.run(self._aspeculative_logical(state, config))
+
+    async def _atrim_history(self, state: ChatState):
+        """Drops a thread's oldest quarter once it is past the checkpointer's message cap.
+
+        The dropped messages are folded into the rolling summary first, so they leave the
+        agents' context only once the summary covers them.
+        """
+        limit = getattr(self.checkpointer, "max_messages", None)
+        messages = state['messages']
+        if limit is None or len(messages) <= limit:
+            return {}
+        drop = len(messages) - (limit - limit // 4)
+        offset = state.get('history_offset') or 0
+        try:
+            await self.context_builder.cover(ContextBuilder.chat_key(state), messages, offset, offset + drop)
+        except Exception as e:
+            # Keep the history whole this turn; trimming is retried on the next one
+            print(f"Warning: summarizing before trimming thread history failed: {e}")
+            return {}
+        return {"messages": {"drop": drop}, "history_offset": offset + drop}
+
+    def _trim_history(self, state: ChatState):
+        return self._runner.run(self._atrim_history(state))
+
+    @staticmethod
+    def _accept_draft(state: ChatState):
+        if state.get('message_type') == 'emotional':
+            reply = state['therapist_draft']
+        else:
+            reply = state['logical_draft']
+        return {"messages": [{"role": "assistant", "content": reply}]}
+
     @staticmethod
     def _router(state: ChatState):
         message_type = state.get('message_type', 'logical')
+        draft = state.get('therapist_draft') if message_type == 'emotional' else state.get('logical_draft')
+        if draft is not None:
+            return {"next": "accept_draft"}
         if message_type == 'emotional':
             return {"next": "therapist_agent"}
         return {"next": "logical_agent"}
 
     @staticmethod
     def _get_classifier_schema():
-        class MessageClassifier(BaseModel):
-            message_type: Literal["emotional", "logical"] = Field(
-                ...,
-                description="Classify whether the message requires an emotional (therapist) or logical response"
-            )
-        return MessageClassifier
+        return _classifier_schema()
 
     # --- Graph Builder ---
 
-    def _build_graph(self):
+    def _build_graph(self, checkpointer=None):
+        from langgraph.graph import StateGraph, START, END
+        from langchain_core.runnables import RunnableLambda
+
         graph_builder = StateGraph(ChatState)
 
-        # Nodes are instance methods, note the use of self.method_name
-        graph_builder.add_node("classifier", self._classify_message)
-        graph_builder.add_node("therapist_agent", self._therapist_agent)
-        graph_builder.add_node("logical_agent", self._logical_agent)
-        graph_builder.add_node("router", self._router)
+        def node(name: str, func, afunc=None):
+            # Every node records its wall time and errors under node_seconds{node=name}
+            timed = metrics.timed("node_seconds", node=name)
+            return timed(func) if afunc is None else RunnableLambda(timed(func), afunc=timed(afunc))
+
+        # Nodes are instance methods with sync and async variants, note the use of self.method_name
+        graph_builder.add_node("classifier", node("classifier", self._classify_message, self._aclassify_message))
+        graph_builder.add_node("therapist_agent", node("therapist_agent", self._therapist_agent, self._atherapist_agent))
+        graph_builder.add_node("logical_agent", node("logical_agent", self._logical_agent, self._alogical_agent))
+        graph_builder.add_node("router", node("router", self._router))
 
         graph_builder.add_edge(START, "classifier")
-        graph_builder.add_edge("classifier", "router")
+
+        # Checkpointed threads end each turn by trimming their history to the saver's cap
+        reply_end = END
+        if checkpointer is not None:
+            graph_builder.add_node("trim_history", node("trim_history", self._trim_history, self._atrim_history))
+            graph_builder.add_edge("trim_history", END)
+            reply_end = "trim_history"
+
+        if self.speculation == "off":
+            graph_builder.add_edge("classifier", "router")
+        else:
+            # Agents start alongside the classifier; the router joins on all three
+            graph_builder.add_node("speculative_therapist", node("speculative_therapist", self._speculative_therapist,
+                                                                 self._aspeculative_therapist))
+            graph_builder.add_node("speculative_logical", node("speculative_logical", self._speculative_logical,
+                                                               self._aspeculative_logical))
+            graph_builder.add_node("accept_draft", node("accept_draft", self._accept_draft))
+            graph_builder.add_edge(START, "speculative_therapist")
+            graph_builder.add_edge(START, "speculative_logical")
+            graph_builder.add_edge(["classifier", "speculative_therapist", "speculative_logical"], "router")
+            graph_builder.add_edge("accept_draft", reply_end)
 
         graph_builder.add_conditional_edges(
             "router",
             lambda state: state.get('next'),
+            {"therapist_agent": "therapist_agent", "logical_agent": "logical_agent", "accept_draft": "accept_draft"}
+            if self.speculation != "off" else
             {"therapist_agent": "therapist_agent", "logical_agent": "logical_agent"}
         )
 
-        graph_builder.add_edge("therapist_agent", END)
-        graph_builder.add_edge("logical_agent", END)
+        graph_builder.add_edge("therapist_agent", reply_end)
+        graph_builder.add_edge("logical_agent", reply_end)
 
-        return graph_builder.compile()
-    
-    # --- Public Execution Method ---
+        return graph_builder.compile(checkpointer=checkpointer)
     
-    def invoke(self, state: dict) -> dict:
-        """Invokes the chat workflow with the given state."""
-        return self.graph.invoke(state)
+    # --- Public Execution Methods ---
+
+    def _start_turn(self, state: dict, thread_id: str | None) -> tuple[dict, dict, "_SpeculationRace | None"]:
+        configurable = {} if thread_id is None else {"thread_id": thread_id}
+        race = None
+        if self.speculation != "off":
+            # Drafts never carry over between turns (nor from a thread's previous checkpoint)
+            race = configurable["speculation"] = _SpeculationRace()
+            state = {**state, "therapist_draft": None, "logical_draft": None}
+        return state, {"configurable": configurable} if configurable else {}, race
+
+    def _turn_graph(self, thread_id: str | None):
+        return self.graph if thread_id is None else self.thread_graph
+
+    async def _discard_thread(self, thread_id: str | None):
+        """Drops a thread whose turn did not complete, so its checkpoint never holds a half turn.
+        The caller's next turn on it sends the whole conversation again."""
+        if thread_id is None:
+            return
+        try:
+            await self.checkpointer.adelete_thread(thread_id)
+        except Exception as e:
+            print(f"Error discarding graph thread {thread_id}: {e}")
+
+    @contextlib.asynccontextmanager
+    async def _thread_turn(self, state: dict, thread_id: str | None, history=None):
+        """Holds the thread for one turn and yields its input trimmed to what the checkpoint lacks.
+
+        Callers may send the whole conversation, a recent tail of it or just the new messages.
+        Whatever repeats the end of the checkpointed history is dropped, so the append-only
+        reducer never duplicates it. A thread without a checkpoint is seeded with all of it, or
+        with `history()` (the conversation's messages and their history_offset) when given.
+        """
+        if thread_id is None:
+            yield state
+            return
+        lock = self._thread_locks.get(thread_id)
+        if lock is None:
+            lock = self._thread_locks[thread_id] = asyncio.Lock()
+        async with lock:
+            checkpointer = self.checkpointer
+            # Keep the thread from being evicted between reading it and the graph resuming it
+            pin = getattr(checkpointer, "pin", None)
+            if pin is not None:
+                pin(thread_id)
+            try:
+                checkpoint = await checkpointer.aget_tuple({"configurable": {"thread_id": thread_id}})
+                if checkpoint is None:
+                    # Seeding: the input (or the caller's history) is the conversation, at its own history_offset
+                    if history is not None:
+                        messages, offset = history()
+                        state = {**state, "messages": messages, "history_offset": offset}
+                    new, state = state["messages"], {**state, "conversation_id": state.get("conversation_id") or thread_id}
+                else:
+                    # Resuming: the checkpoint's own offset and summary key stay in force
+                    stored = checkpoint.checkpoint["channel_values"].get("messages", [])
+                    new = state["messages"][_overlap(stored, state["messages"]):]
+                    state = {k: v for k, v in state.items() if k not in ("history_offset", "conversation_id")}
+                if not new or new[-1].get("role") != "user":
+                    raise ValueError("a thread turn must end with a new user message")
+                yield {**state, "messages": new}
+            finally:
+                if pin is not None:
+                    checkpointer.unpin(thread_id)
+
+    def has_thread(self, thread_id: str) -> bool:
+        """Whether the graph holds a checkpoint for this thread."""
+        return self._runner.run(self.ahas_thread(thread_id))
+
+    async def ahas_thread(self, thread_id: str) -> bool:
+        if not self.checkpointing:
+            return False
+        return await self.checkpointer.aget_tuple({"configurable": {"thread_id": thread_id}}) is not None
+
+    def _finish_turn(self, result: dict, race: "_SpeculationRace | None") -> dict:
+        result = _tag_user_message(result)
+        if race is None:
+            return result
+        draft_key = "therapist_draft" if result.get("message_type") == "emotional" else "logical_draft"
+        used = int(result.get(draft_key) is not None)
+        self._record_speculation(turns=1, launched=race.launched, used=used,
+                                 wasted=race.launched - used, mispredicted=1 - used)
+        return {**result, "therapist_draft": None, "logical_draft": None}
+
+    def invoke(self, state: dict, thread_id: str | None = None, history=None) -> dict:
+        """Invokes the chat workflow with the given state.
+
+        Without a thread_id, state["messages"] is the whole conversation. With one, the messages
+        the thread's checkpoint does not hold yet are appended to it: sending the whole
+        conversation (or a recent tail of it) is always safe, and sending only the new messages
+        works while the thread is checkpointed, or always when `history` is given. `history` is
+        called only when the thread has no checkpoint and returns (messages, history_offset)
+        for the whole conversation, new messages included. The thread's final state is returned.
+        """
+        return self._runner.run(self.ainvoke(state, thread_id, history))
+
+    async def ainvoke(self, state: dict, thread_id: str | None = None, history=None) -> dict:
+        """Async variant of invoke()."""
+        async with self._thread_turn(state, thread_id, history) as state:
+            state, config, race = self._start_turn(state, thread_id)
+            try:
+                result = await self._turn_graph(thread_id).ainvoke(state, config)
+            except BaseException:
+                await self._discard_thread(thread_id)
+                raise
+        return self._finish_turn(result, race)
+
+    def stream(self, state: dict, thread_id: str | None = None, history=None):
+        """Runs the chat workflow, yielding ("token", text) events as the reply is generated
+        and a final ("state", state) event once the turn completes. thread_id and history are
+        as in invoke()."""
+        yield from self._runner.iterate(self.astream(state, thread_id, history))
+
+    async def astream(self, state: dict, thread_id: str | None = None, history=None):
+        """Async variant of stream()."""
+        async with self._thread_turn(state, thread_id, history) as state:
+            state, config, race = self._start_turn(state, thread_id)
+            final_state, streamed, completed = None, False, False
+            events = self._turn_graph(thread_id).astream(state, config, stream_mode=["messages", "values"])
+            if race is not None:
+                events = _with_decision(events, race)
+            # Speculative drafts' tokens wait here until the classifier picks the branch they belong to
+            drafts, decided = {}, None
+            try:
+                async with contextlib.aclosing(events):
+                    async for mode, chunk in events:
+                        if mode == "values":
+                            final_state = chunk
+                            continue
+                        if mode == "decided":
+                            decided = chunk
+                            buffered = drafts.pop(decided, [])
+                            drafts.clear()
+                            if decided in race.discarded:
+                                continue
+                            for text in buffered:
+                                streamed = True
+                                yield "token", text
+                            continue
+                        text = _reply_token(chunk)
+                        if not text:
+                            continue
+                        branch = SPECULATIVE_NODES.get(chunk[1].get("langgraph_node"))
+                        if branch is not None and branch in race.discarded:
+                            drafts.pop(branch, None)
+                            continue
+                        if branch is not None and branch != decided:
+                            if decided is None:
+                                drafts.setdefault(branch, []).append(text)
+                            continue
+                        streamed = True
+                        yield "token", text
+                completed = True
+            finally:
+                if not completed:
+                    # Failed or abandoned mid-turn
+                    await self._discard_thread(thread_id)
 
+        final_state = self._finish_turn(final_state, race)
+        if not streamed:
+            # Replies produced off the streaming path (e.g. cached replies) arrive whole
+            yield "token", final_state["messages"][-1]["content"]
+        yield "state", final_state
+
+
+def _overlap(stored: list, messages: list) -> int:
+    """Length of the longest prefix of `messages` that ends the way `stored` ends.
+
+    Either side may reach further back than the other: a caller's window can start inside
+    the stored history, or before it when the thread was seeded from a shorter window.
+    """
+    keys = [(msg.get("role"), msg.get("content")) for msg in messages]
+    stored_keys = [(msg.get("role"), msg.get("content")) for msg in stored[-len(keys):]] if keys else []
+    for size in range(len(keys), 0, -1):
+        common = min(size, len(stored_keys))
+        if common and keys[size - common:size] == stored_keys[len(stored_keys) - common:]:
+            return size
+    return 0
+
+
+def _tag_user_message(result: dict) -> dict:
+    """Copies the turn's message_type onto the user message it classified, so it gets persisted."""
+    messages = result.get("messages") or []
+    message_type = result.get("message_type")
+    if message_type is None or len(messages) < 2 or messages[-2].get("role") != "user":
+        return result
+    # The list is the finished run's own; replacing one entry beats copying the whole history
+    messages[-2] = {**messages[-2], "message_type": message_type}
+    return result
+
+
+# Nodes whose model tokens make up the assistant reply; classifier output is never streamed
+REPLY_NODES = ("therapist_agent", "logical_agent")
+# Speculative agents and the message type their draft answers; their tokens count once that type wins
+SPECULATIVE_NODES = {"speculative_therapist": "emotional", "speculative_logical": "logical"}
+
+def _reply_token(chunk) -> str:
+    """Extracts reply text from a LangGraph ("messages" mode) chunk, ignoring non-reply nodes."""
+    message, metadata = chunk
+    node = metadata.get("langgraph_node")
+    if node not in REPLY_NODES and node not in SPECULATIVE_NODES:
+        return ""
+    content = message.content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content
+
+
+# How long the console waits on exit for a background title; the chat is already saved
+TITLE_WAIT_SECONDS = 15.0
 
 # Interactive chatbot (Kept for console compatibility)
 def run_chatbot():
-    # Instantiate the service here
+    # Instantiate the service here; the model client loads while the menu is shown
     chat_service = ChatService()
+    chat_service.warm_up(background=True)
     state = None
+    loaded_chat_name = None
     
     while True:
-        saved_chats = chat_service.list_saved_chats()
+        chat_details = chat_service.list_saved_chat_details()
+        saved_chats = [chat["name"] for chat in chat_details]
         print("\n--- NEURA Chatbot ---")
         if saved_chats:
             print("--- Load/View Saved Chats ---")
-            for i, chat_name in enumerate(saved_chats):
-                print(f"[{i+1}] {chat_name}")
+            for i, chat in enumerate(chat_details):
+                print(f"[{i+1}] {chat['name']} ({chat['message_count']} messages, updated {chat['updated_at'][:10]})")
             print("[N] Start New Chat")
             print("[Q] Quit Program")
             
@@ -232,6 +1206,8 @@ def run_chatbot():
                         for msg in messages:
                             print(f"{msg['role'].capitalize()}: {msg['content']}")
                         if input("\nContinue this chat? (y/n): ").lower() == 'y':
+                            loaded_chat_name = chat_name_to_load
+                            print(f"New messages are appended to {chat_name_to_load}. Type 'exit' to quit.")
                             break
                         else:
                             state = None
@@ -254,16 +1230,26 @@ def run_chatbot():
         user_input = input("Message: ")
         
         if user_input.lower() == "exit":
-            if state["messages"]:
+            if loaded_chat_name:
+                # Turns were appended as they happened
+                chat_log_writer.close(loaded_chat_name)
+                print(f"Chat saved as: {loaded_chat_name} in {CHAT_HISTORY_DIR}/")
+            elif state["messages"]:
                 print("\n--- Saving Chat ---")
-                generated_name = chat_service.generate_chat_name_llm(state["messages"])
-                
-                save_name_override = input(f"Chat name determined: {generated_name}. Enter a new name or press Enter to confirm: ")
-                if not save_name_override:
-                    save_name_override = generated_name
-                    
-                saved_name = chat_service.save_chat_history(state["messages"], save_name_override)
-                print(f"Chat saved as: {saved_name}.json in {CHAT_HISTORY_DIR}/")
+                suggested_name = chat_service.provisional_chat_name(state["messages"])
+
+                save_name_override = input(
+                    f"Provisional chat name: {suggested_name}. Enter a name to keep, "
+                    "or press Enter to let the assistant title it: "
+                ).strip()
+
+                # Saved right away; without a typed name it is then upgraded to an LLM title
+                saved_name = chat_service.save_chat_history(
+                    state["messages"], save_name_override or suggested_name, refine_title=not save_name_override,
+                    on_renamed=lambda name: print(f"Chat renamed to: {name}{chat_log.LOG_EXT}")
+                )
+                print(f"Chat saved as: {saved_name}{chat_log.LOG_EXT} in {CHAT_HISTORY_DIR}/")
+                chat_service.wait_for_titles(TITLE_WAIT_SECONDS)
             
             print("Bye 👋")
             break
@@ -271,15 +1257,20 @@ def run_chatbot():
         state['messages'] = state.get('messages', []) + [{"role": "user", "content": user_input}]
         
         try:
-            state = chat_service.invoke(state)
+            print("Assistant: ", end="", flush=True)
+            for event, payload in chat_service.stream(state):
+                if event == "token":
+                    print(payload, end="", flush=True)
+                else:
+                    state = payload
+            print()
         except Exception as e:
-            print(f"An error occurred during graph execution: {e}")
+            print(f"\nAn error occurred during graph execution: {e}")
             state['messages'].pop() 
             continue
 
-        if state.get("messages") and len(state["messages"]) > 0:
-            last_message = state['messages'][-1]
-            print(f"Assistant: {last_message['content']}")
+        if loaded_chat_name:
+            chat_service.append_chat_history(loaded_chat_name, state['messages'][-2:])
 
 if __name__ == "__main__":
     run_chatbot()
\ No newline at end of file
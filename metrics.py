@@ -0,0 +1,178 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from bisect import bisect_left
+
+# ----------------------- METRICS -----------------------
+# In-process latency histograms and counters for graph nodes, model calls and database
+# calls. Recording is a perf_counter pair, a bisect and a locked increment, cheap enough to
+# leave on in production. Snapshots export as Prometheus text or JSON.
+
+NAMESPACE = "neura"
+
+# Upper bounds in seconds, from sub-millisecond cache hits to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are interpolated within the bucket they fall in."""
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: tuple = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - cumulative) / bucket_count)
+            cumulative += bucket_count
+        return self.max
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe store of labelled histograms and counters."""
+
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    # --- Recording ---
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def timed(self, name: str, **labels):
+        """Decorator recording a function's wall time in `name` and its exceptions in `<name>_errors_total`.
+
+        Works on sync and async functions, and keeps the wrapped signature visible to
+        inspect.signature() (LangGraph uses it to decide whether to pass `config`).
+        """
+        errors = name.removesuffix("_seconds") + "_errors_total"
+
+        def decorate(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception:
+                        self.inc(errors, **labels)
+                        raise
+                    finally:
+                        self.observe(name, time.perf_counter() - start, **labels)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    self.inc(errors, **labels)
+                    raise
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    # --- Export ---
+
+    def snapshot(self) -> dict:
+        """Returns every series as plain data: histograms with count, sum, max and p50/p95/p99."""
+        with self._lock:
+            histograms = [(name, labels, h.count, h.sum, h.max, [h.quantile(q) for q in QUANTILES])
+                          for (name, labels), h in self._histograms.items()]
+            counters = list(self._counters.items())
+
+        snapshot = {"timestamp": time.time(), "histograms": {}, "counters": {}}
+        for name, labels, count, total, maximum, quantiles in sorted(histograms):
+            entry = {"labels": dict(labels), "count": count, "sum": total, "max": maximum}
+            entry.update({f"p{int(q * 100)}": value for q, value in zip(QUANTILES, quantiles)})
+            snapshot["histograms"].setdefault(name, []).append(entry)
+        for (name, labels), value in sorted(counters):
+            snapshot["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return snapshot
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def prometheus_text(self) -> str:
+        """Renders all series in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = [(name, labels, list(h.counts), h.count, h.sum, h.bounds)
+                          for (name, labels), h in self._histograms.items()]
+            counters = list(self._counters.items())
+
+        lines, typed = [], set()
+        for name, labels, counts, count, total, bounds in sorted(histograms):
+            metric = f"{self.namespace}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(bounds) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_sum{_label_text(labels)} {total}")
+            lines.append(f"{metric}_count{_label_text(labels)} {count}")
+        for (name, labels), value in sorted(counters):
+            metric = f"{self.namespace}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by ChatService, ChatStore and the app
+metrics = MetricsRegistry()
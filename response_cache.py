@@ -0,0 +1,273 @@
+import abc
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ----------------------- RESPONSE CACHE -----------------------
+# Agent replies keyed on (agent, system prompt, normalized prompt). Backends share the
+# same get/set interface so ChatService does not care where entries live.
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 3600.0
+DEFAULT_CACHE_PATH = os.path.join("cache", "responses.sqlite")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_REPEATED_PUNCT_RE = re.compile(r"([!?.,])\1+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalizes a message so trivially different phrasings share a cache entry."""
+    text = _WHITESPACE_RE.sub(" ", text.strip().lower())
+    return _REPEATED_PUNCT_RE.sub(r"\1", text)
+
+
+def cache_key(*parts: str) -> str:
+    """Hashes the key parts into a fixed-size cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResponseCache(abc.ABC):
+    """Base class for size and TTL bounded string caches with hit/miss counters."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float | None = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def get(self, key: str) -> str | None:
+        """Returns the cached value, or None on a miss or an expired entry."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str):
+        """Stores a value, evicting the least recently used entries beyond max_entries."""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Removes every entry."""
+
+    @abc.abstractmethod
+    def _count(self) -> int:
+        """Number of entries; called with the lock held."""
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        with self._lock:
+            entries, hits, misses, evictions = self._count(), self.hits, self.misses, self.evictions
+        lookups = hits + misses
+        return {
+            "backend": type(self).__name__,
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU cache with per-entry TTL."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float | None = DEFAULT_TTL_SECONDS):
+        super().__init__(max_entries, ttl)
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1], now):
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _count(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """On-disk cache that survives restarts; least recently used entries are evicted first.
+
+    The entry count is kept in memory and only recounted when another connection (e.g. another
+    worker sharing the file) has written to it, so inserts never scan the table.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float | None = DEFAULT_TTL_SECONDS):
+        super().__init__(max_entries, ttl)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._size = 0
+        self._data_version = None
+
+    def _sync_size(self):
+        # data_version changes only when another connection commits to the file
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                if row is not None:
+                    self._sync_size()
+                    self._size -= self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._sync_size()
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            if not exists:
+                self._size += 1
+            excess = self._size - self.max_entries
+            if excess > 0:
+                evicted = self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (excess,)
+                ).rowcount
+                self._size -= evicted
+                self.evictions += evicted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._sync_size()
+            self._size = 0
+
+    def _count(self) -> int:
+        self._sync_size()
+        return self._size
+
+
+def create_response_cache(backend: str | None = None) -> ResponseCache | None:
+    """Builds the cache configured by RESPONSE_CACHE ("memory", "sqlite" or "off")."""
+    backend = (backend or os.getenv("RESPONSE_CACHE", "memory")).lower()
+    max_entries = int(os.getenv("RESPONSE_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL_SECONDS)) or None
+
+    if backend == "off":
+        return None
+    if backend == "memory":
+        return MemoryResponseCache(max_entries, ttl)
+    if backend == "sqlite":
+        return SQLiteResponseCache(os.getenv("RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH), max_entries, ttl)
+    raise ValueError(f"Unknown response cache backend: {backend}")
+
+
+# ----------------------- CLASSIFICATION MEMO -----------------------
+
+class ClassificationMemo:
+    """Memoizes LLM message classifications keyed on the normalized message text."""
+
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return cache_key("classifier", normalize_prompt(text))
+
+    def get(self, text: str) -> str | None:
+        return self.cache.get(self.key(text))
+
+    def set(self, text: str, message_type: str, elapsed: float):
+        """Stores an LLM classification and the time the call took."""
+        self.cache.set(self.key(text), message_type)
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += elapsed
+
+    def stats(self) -> dict:
+        """Returns hit rate and the classifier latency saved by hits."""
+        stats = self.cache.stats()
+        avg_latency = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+        stats["avg_llm_latency_s"] = avg_latency
+        stats["saved_latency_s"] = stats["hits"] * avg_latency
+        return stats
+
+
+DEFAULT_MEMO_ENTRIES = 4096
+DEFAULT_MEMO_TTL_SECONDS = 86400.0
+DEFAULT_MEMO_PATH = os.path.join("cache", "classifications.sqlite")
+
+_shared_memo = None
+_shared_memo_lock = threading.Lock()
+
+
+def get_classification_memo() -> ClassificationMemo | None:
+    """Returns the process-wide classification memo configured by CLASSIFICATION_MEMO
+    ("memory", "sqlite" or "off"), creating it on first use."""
+    global _shared_memo
+    with _shared_memo_lock:
+        if _shared_memo is None:
+            backend = os.getenv("CLASSIFICATION_MEMO", "memory").lower()
+            max_entries = int(os.getenv("CLASSIFICATION_MEMO_SIZE", DEFAULT_MEMO_ENTRIES))
+            ttl = float(os.getenv("CLASSIFICATION_MEMO_TTL", DEFAULT_MEMO_TTL_SECONDS)) or None
+            if backend == "off":
+                return None
+            if backend == "memory":
+                cache = MemoryResponseCache(max_entries, ttl)
+            elif backend == "sqlite":
+                cache = SQLiteResponseCache(os.getenv("CLASSIFICATION_MEMO_PATH", DEFAULT_MEMO_PATH), max_entries, ttl)
+            else:
+                raise ValueError(f"Unknown classification memo backend: {backend}")
+            _shared_memo = ClassificationMemo(cache)
+        return _shared_memo
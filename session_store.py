@@ -0,0 +1,239 @@
+import json
+import os
+import sys
+import uuid
+import weakref
+from array import array
+
+# ----------------------- SESSION MESSAGE STORE -----------------------
+# Per-session conversation memory with a bounded footprint. Messages are held as slotted
+# records instead of dicts, and only the newest `max_in_memory` stay in memory. Older ones
+# spill to a per-session JSONL file and are paged back in when the user scrolls up, so a
+# session's memory stays flat however long the chat gets. Chats loaded from Supabase keep
+# their never-loaded history in the database, paged in through the store's own cursor.
+
+DEFAULT_MAX_IN_MEMORY = 200
+DEFAULT_SPILL_DIR = os.path.join("cache", "sessions")
+
+_ROLES = {role: sys.intern(role) for role in ("user", "assistant", "system")}
+
+
+class MessageRecord:
+    """One chat message; about half the size of the equivalent dict."""
+
+    __slots__ = ("role", "content", "message_type")
+
+    def __init__(self, role: str, content: str, message_type: str | None = None):
+        # Roles are shared strings rather than one copy per message
+        self.role = _ROLES.get(role, role)
+        self.content = content
+        self.message_type = message_type
+
+    @classmethod
+    def from_dict(cls, msg: dict) -> "MessageRecord":
+        return cls(msg["role"], msg["content"], msg.get("message_type"))
+
+    def as_dict(self) -> dict:
+        msg = {"role": self.role, "content": self.content}
+        if self.message_type is not None:
+            msg["message_type"] = self.message_type
+        return msg
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.content)
+
+
+class SpillFile:
+    """Append-only JSONL file of a session's oldest messages, with an offset per message for random reads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = array("q")
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def append(self, records: list[MessageRecord]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'ab') as f:
+            for record in records:
+                line = (json.dumps(record.as_dict(), ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                self._offsets.append(self._size)
+                f.write(line)
+                self._size += len(line)
+
+    def read(self, start: int, stop: int) -> list[MessageRecord]:
+        """Reads messages [start, stop) with a single seek."""
+        if start >= stop:
+            return []
+        end = self._offsets[stop] if stop < len(self._offsets) else self._size
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[start])
+            data = f.read(end - self._offsets[start])
+        return [MessageRecord.from_dict(json.loads(line)) for line in data.splitlines() if line]
+
+    def remove(self):
+        _remove_file(self.path)
+        self._offsets = array("q")
+        self._size = 0
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SessionMessages:
+    """A conversation whose newest messages live in memory and older ones in a spill file.
+
+    Spilling happens in batches of a quarter of the bound, so the in-memory tail (and the
+    history prefix the agents see) only shifts every few turns. Messages paged back in for
+    display never join the agents' window. The spill file is removed with the session.
+    """
+
+    def __init__(self, max_in_memory: int | None = None, spill_dir: str | None = None):
+        if max_in_memory is None:
+            max_in_memory = int(os.getenv("SESSION_MAX_MESSAGES", DEFAULT_MAX_IN_MEMORY))
+        self.max_in_memory = max(1, max_in_memory)
+        spill_dir = spill_dir or os.getenv("SESSION_SPILL_DIR", DEFAULT_SPILL_DIR)
+        self._spill = SpillFile(os.path.join(spill_dir, f"{uuid.uuid4().hex}.jsonl"))
+        self._finalizer = weakref.finalize(self, _remove_file, self._spill.path)
+        self._records = []
+        # Messages before the in-memory tail; the spill file holds at least this many
+        self._spilled = 0
+        # Positions count from the first message the session started with, so they stay put
+        # when older history is loaded in front of it
+        self._prepended = 0
+        # Position of the oldest message in the agents' window
+        self._agent_start = 0
+        # Cursor for history that was never loaded from Supabase
+        self.remote_cursor = None
+
+    # --- Size ---
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._records)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @property
+    def in_memory(self) -> int:
+        return len(self._records)
+
+    @property
+    def spilled(self) -> int:
+        return self._spilled
+
+    def has_older(self) -> bool:
+        """Whether earlier messages exist in the spill file or the database."""
+        return self._spilled > 0 or self.remote_cursor is not None
+
+    # --- Updates ---
+
+    def reset(self, messages: list | None = None, remote_cursor=None):
+        """Replaces the conversation, e.g. when another chat is loaded."""
+        self._spill.remove()
+        self._records = [MessageRecord.from_dict(msg) for msg in messages or []]
+        self._spilled = 0
+        self._prepended = 0
+        self._agent_start = 0
+        self.remote_cursor = remote_cursor
+        self._trim()
+
+    def append(self, message: dict):
+        self._records.append(MessageRecord.from_dict(message))
+        self._trim()
+
+    def extend(self, messages: list):
+        self._records.extend(MessageRecord.from_dict(msg) for msg in messages)
+        self._trim()
+
+    def pop(self) -> dict:
+        return self._records.pop().as_dict()
+
+    def prepend_remote(self, messages: list, remote_cursor):
+        """Adds a page of older messages loaded from the database in front of everything else."""
+        if self._spilled:
+            raise ValueError("page in spilled messages before loading older ones from the database")
+        self._records[:0] = [MessageRecord.from_dict(msg) for msg in messages]
+        self._prepended += len(messages)
+        self.remote_cursor = remote_cursor
+        # Those messages are now ahead of the spill file's contents; start it over
+        self._spill.remove()
+
+    def _first_position(self) -> int:
+        return self._spilled - self._prepended
+
+    def _trim(self):
+        if len(self._records) <= self.max_in_memory:
+            return
+        # Paged-in messages go back to the spill file first; the agents' window only shrinks past the bound
+        window = len(self._records) - max(0, self._agent_start - self._first_position())
+        keep = window if window <= self.max_in_memory else self.max_in_memory - max(1, self.max_in_memory // 4)
+        spill_count = len(self._records) - keep
+        spilling, self._records = self._records[:spill_count], self._records[spill_count:]
+        # Messages paged back in earlier are still in the file; only write the new ones
+        already_stored = max(0, len(self._spill) - self._spilled)
+        if already_stored < len(spilling):
+            self._spill.append(spilling[already_stored:])
+        self._spilled += spill_count
+        self._agent_start = max(self._agent_start, self._first_position())
+
+    def page_in(self, count: int) -> int:
+        """Brings up to `count` spilled messages back into memory. Returns how many were loaded."""
+        count = min(count, self._spilled)
+        if count <= 0:
+            return 0
+        start = self._spilled - count
+        self._records[:0] = self._spill.read(start, self._spilled)
+        self._spilled = start
+        return count
+
+    # --- Reads ---
+
+    def tail(self, n: int | None = None) -> list[dict]:
+        """The newest n in-memory messages (all of them by default) as dicts."""
+        records = self._records if n is None else self._records[-n:] if n > 0 else []
+        return [record.as_dict() for record in records]
+
+    def agent_window(self) -> tuple[list[dict], int]:
+        """The messages the agents see, as dicts, and the conversation position of the first one.
+
+        This is the in-memory tail without anything paged in for display.
+        """
+        start = max(0, self._agent_start - self._first_position())
+        return [record.as_dict() for record in self._records[start:]], self._first_position() + start
+
+    def all(self) -> list[dict]:
+        """Every known message, spilled ones included, oldest first."""
+        return [record.as_dict() for record in self._spill.read(0, self._spilled)] + self.tail()
+
+    def memory_report(self) -> dict:
+        """Approximate memory held by this session, against what the same messages cost as dicts."""
+        record_bytes = sys.getsizeof(self._records) + sum(record.nbytes() for record in self._records)
+        dict_bytes = sys.getsizeof(self._records) + sum(
+            sys.getsizeof(record.as_dict()) + sys.getsizeof(record.content) for record in self._records
+        )
+        return {
+            "messages": len(self),
+            "in_memory": len(self._records),
+            "spilled": self._spilled,
+            "agent_window": len(self._records) - max(0, self._agent_start - self._first_position()),
+            "max_in_memory": self.max_in_memory,
+            "memory_bytes": record_bytes,
+            "dict_equivalent_bytes": dict_bytes,
+            "spill_file_bytes": self._spill.size,
+            "more_in_database": self.remote_cursor is not None,
+        }
+
+    def close(self):
+        """Deletes the spill file now instead of when the session is garbage collected."""
+        self._finalizer()
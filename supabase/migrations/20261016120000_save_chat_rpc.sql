@@ -0,0 +1,38 @@
+/*
+  # Bulk Chat Save
+
+  1. New Functions
+    - `save_chat_with_messages(p_name text, p_messages jsonb)` - Creates a chat and inserts
+      all of its messages in one transaction, returning the new chat id
+      - `p_messages` is a JSON array of objects with `role`, `content`, optional
+        `message_type` and optional `created_at`
+      - Messages without `created_at` get increasing timestamps in array order
+
+  2. Notes
+    - Replaces one HTTP request per message with a single RPC call on first save
+    - Clients chunk very long chats and append the remaining messages with array inserts
+*/
+
+CREATE OR REPLACE FUNCTION save_chat_with_messages(p_name text, p_messages jsonb)
+RETURNS uuid
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  new_chat_id uuid;
+BEGIN
+  INSERT INTO chats (name) VALUES (p_name) RETURNING id INTO new_chat_id;
+
+  INSERT INTO messages (chat_id, role, content, message_type, created_at)
+  SELECT
+    new_chat_id,
+    m.value->>'role',
+    m.value->>'content',
+    m.value->>'message_type',
+    COALESCE((m.value->>'created_at')::timestamptz, now() + (m.ord * interval '1 microsecond'))
+  FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS m(value, ord);
+
+  RETURN new_chat_id;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION save_chat_with_messages(text, jsonb) TO anon, authenticated;
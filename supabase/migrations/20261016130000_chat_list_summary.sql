@@ -0,0 +1,91 @@
+/*
+  # Chat List Summary Columns
+
+  1. Modified Tables
+    - `chats`
+      - `message_count` (integer) - Number of messages in the chat
+      - `last_message_preview` (text) - First 120 characters of the latest message
+
+  2. Triggers
+    - Statement-level triggers on `messages` keep both columns up to date on insert and
+      delete, so the sidebar never has to read `messages`
+
+  3. Indexes
+    - Replace `idx_chats_updated_at` with `(updated_at DESC, id DESC)` to serve keyset
+      pagination of the chat list
+*/
+
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS message_count integer NOT NULL DEFAULT 0;
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS last_message_preview text;
+
+-- Backfill existing chats
+UPDATE chats c
+SET
+  message_count = s.message_count,
+  last_message_preview = s.last_message_preview
+FROM (
+  SELECT DISTINCT ON (chat_id)
+    chat_id,
+    COUNT(*) OVER (PARTITION BY chat_id) AS message_count,
+    left(content, 120) AS last_message_preview
+  FROM messages
+  ORDER BY chat_id, created_at DESC
+) s
+WHERE c.id = s.chat_id;
+
+CREATE OR REPLACE FUNCTION chats_apply_inserted_messages()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE chats c
+  SET
+    message_count = c.message_count + s.added,
+    last_message_preview = s.preview
+  FROM (
+    SELECT DISTINCT ON (chat_id)
+      chat_id,
+      COUNT(*) OVER (PARTITION BY chat_id) AS added,
+      left(content, 120) AS preview
+    FROM new_messages
+    ORDER BY chat_id, created_at DESC
+  ) s
+  WHERE c.id = s.chat_id;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION chats_apply_deleted_messages()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE chats c
+  SET message_count = GREATEST(c.message_count - s.removed, 0)
+  FROM (
+    SELECT chat_id, COUNT(*) AS removed
+    FROM old_messages
+    GROUP BY chat_id
+  ) s
+  WHERE c.id = s.chat_id;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS messages_after_insert_summary ON messages;
+CREATE TRIGGER messages_after_insert_summary
+  AFTER INSERT ON messages
+  REFERENCING NEW TABLE AS new_messages
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION chats_apply_inserted_messages();
+
+DROP TRIGGER IF EXISTS messages_after_delete_summary ON messages;
+CREATE TRIGGER messages_after_delete_summary
+  AFTER DELETE ON messages
+  REFERENCING OLD TABLE AS old_messages
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION chats_apply_deleted_messages();
+
+-- Keyset pagination index for the sidebar
+DROP INDEX IF EXISTS idx_chats_updated_at;
+CREATE INDEX IF NOT EXISTS idx_chats_updated_at_id ON chats(updated_at DESC, id DESC);
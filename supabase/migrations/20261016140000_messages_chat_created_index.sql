@@ -0,0 +1,16 @@
+/*
+  # Composite Message Index
+
+  1. Indexes
+    - Add `(chat_id, created_at DESC, id DESC)` on `messages`, which serves "latest N messages
+      of a chat" and cursor-based loading of older pages with a single index scan
+    - Drop `idx_messages_chat_id` (covered by the composite index's leading column, which also
+      backs the foreign key's cascading deletes)
+    - Drop `idx_messages_created_at` (no query orders messages across chats)
+*/
+
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id_created_at
+  ON messages(chat_id, created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_messages_chat_id;
+DROP INDEX IF EXISTS idx_messages_created_at;
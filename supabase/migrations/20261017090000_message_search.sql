@@ -0,0 +1,64 @@
+/*
+  # Full-Text Message Search
+
+  1. Modified Tables
+    - `messages`
+      - `content_tsv` (tsvector) - Generated, stored English tsvector of `content`
+
+  2. Indexes
+    - GIN index on `messages.content_tsv`
+
+  3. New Functions
+    - `search_messages(p_query text, p_limit int)` - Ranked search over message content
+      - Parses `p_query` with websearch_to_tsquery (quoted phrases, `or`, `-term`)
+      - Returns chat id and name, message id, role, created_at, a highlighted snippet and
+        its ts_rank_cd score, best matches first
+
+  4. Notes
+    - The generated column is filled for existing rows when the column is added
+    - Snippets are only built for the rows that make the limit, not for every match
+*/
+
+ALTER TABLE messages
+  ADD COLUMN IF NOT EXISTS content_tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_messages_content_tsv ON messages USING GIN (content_tsv);
+
+CREATE OR REPLACE FUNCTION search_messages(p_query text, p_limit int DEFAULT 20)
+RETURNS TABLE (
+  chat_id uuid,
+  chat_name text,
+  message_id uuid,
+  role text,
+  created_at timestamptz,
+  snippet text,
+  score real
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH q AS (
+    SELECT websearch_to_tsquery('english', p_query) AS query
+  ),
+  hits AS (
+    SELECT m.id, m.chat_id, m.role, m.content, m.created_at, ts_rank_cd(m.content_tsv, q.query) AS rank, q.query
+    FROM messages m, q
+    WHERE m.content_tsv @@ q.query
+    ORDER BY rank DESC, m.created_at DESC
+    LIMIT p_limit
+  )
+  SELECT
+    h.chat_id,
+    c.name,
+    h.id,
+    h.role,
+    h.created_at,
+    ts_headline('english', h.content, h.query, 'StartSel=**, StopSel=**, MaxWords=20, MinWords=8'),
+    h.rank
+  FROM hits h
+  JOIN chats c ON c.id = h.chat_id
+  ORDER BY h.rank DESC, h.created_at DESC;
+$$;
+
+GRANT EXECUTE ON FUNCTION search_messages(text, int) TO anon, authenticated;
@@ -0,0 +1,39 @@
+/*
+  # Message Type Backfill
+
+  1. Indexes
+    - Add a partial `(created_at, id)` index on user messages without a `message_type`, which
+      serves the backfill job's keyset pages and shrinks as rows get classified
+
+  2. New Functions
+    - `set_message_types(p_labels jsonb)` - Sets `message_type` for many messages in one
+      statement, returning the number of rows updated
+      - `p_labels` is a JSON object mapping message id to 'emotional' or 'logical'
+
+  3. Notes
+    - The backfill job falls back to one `UPDATE ... WHERE id IN (...)` per label when the
+      function is not deployed
+*/
+
+CREATE INDEX IF NOT EXISTS idx_messages_unclassified
+  ON messages(created_at, id)
+  WHERE message_type IS NULL AND role = 'user';
+
+CREATE OR REPLACE FUNCTION set_message_types(p_labels jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  updated integer;
+BEGIN
+  UPDATE messages m
+  SET message_type = l.value
+  FROM jsonb_each_text(p_labels) AS l(key, value)
+  WHERE m.id = l.key::uuid;
+
+  GET DIAGNOSTICS updated = ROW_COUNT;
+  RETURN updated;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION set_message_types(jsonb) TO anon, authenticated;